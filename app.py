@@ -1,12 +1,21 @@
 
-import os, io, uuid, zipfile
-from datetime import datetime
-from flask import Flask, render_template, request, send_file, send_from_directory, redirect, url_for, flash
+import os, json, time, hashlib, threading, tempfile
+from flask import Flask, Response, jsonify, render_template, request, send_file, send_from_directory, redirect, url_for, flash, stream_with_context
 from werkzeug.utils import secure_filename
-from PyPDF2 import PdfReader, PdfWriter
-from PIL import Image
 import fitz  # PyMuPDF
-from utils import get_relevant_answer_struct
+from pdf_engine import merge_pdfs, select_pages, split_pages
+from page_ranges import parse_ranges
+from render import render_pages
+from zipstream import iter_zip, write_zip
+from image_pdf import images_to_pdf
+from optimize import OPTIMIZE_DPI, OPTIMIZE_JPEG_QUALITY, new_stats, optimize_pdf
+import jobs
+import metrics
+from jobs import should_queue
+import storage
+import summarizer
+from utils import (get_relevant_answer_struct, get_relevant_answers_batch, iter_relevant_answer, build_doc_index,
+                   warm_embedding_model, drop_doc_artifacts, add_to_corpus, search_corpus, CORPUS_ENABLED)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
@@ -16,20 +25,150 @@ UPLOAD_FOLDER = os.path.join(STATIC_DIR, "uploads")
 app = Flask(__name__, template_folder=TEMPLATES_DIR, static_folder=STATIC_DIR)
 app.secret_key = os.getenv("SECRET_KEY", "perdf-dev")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-app.config["TEMPLATES_AUTO_RELOAD"] = True
+metrics.init_app(app)
+CHAT_BATCH_MAX = int(os.getenv("PERDF_CHAT_BATCH_MAX", "100"))  # questions per /ask_pdf_questions call
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Disable Jinja cache so template changes reflect immediately (useful during dev)
-app.jinja_env.cache = {}
-
-# Inject a timestamp for cache-busting static assets
+# Uploads are content-addressed; derived chat artifacts go when their upload expires
+storage.on_delete(drop_doc_artifacts)
+
+def start_background_tasks():
+    """Per-process background work; serve.py calls this in every worker after forking."""
+    # Load the shared embedding model in the background so the first question doesn't pay for it
+    if os.getenv("PERDF_EMBED_WARMUP", "1") == "1":
+        threading.Thread(target=warm_embedding_model, daemon=True).start()
+        if summarizer.enabled():
+            threading.Thread(target=summarizer.get_client, daemon=True).start()
+    storage.start_sweeper()
+
+# serve.py imports this module in the parent process, where no threads may run before the fork;
+# the render / extract pool workers (procpool.py) re-import `python app.py` as __mp_main__
+if os.getenv("PERDF_PREFORK") != "1" and __name__ != "__mp_main__":
+    start_background_tasks()
+
+def _asset_version() -> str:
+    """Content hash of the bundled JS/CSS, so asset URLs only change when the files do."""
+    h = hashlib.sha256()
+    for sub in ("js", "css"):
+        folder = os.path.join(STATIC_DIR, sub)
+        for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else ():
+            with open(os.path.join(folder, name), "rb") as fh:
+                h.update(name.encode())
+                h.update(fh.read())
+    return h.hexdigest()[:12]
+
+ASSET_VERSION = _asset_version()
+STATIC_MAX_AGE = 365 * 24 * 3600  # for versioned asset URLs
+
+# Version string for cache-busting static assets; fixed at startup except under the debug reloader
 @app.context_processor
 def inject_build_ts():
-    return {"build_ts": int(datetime.now().timestamp())}
+    return {"build_ts": _asset_version() if app.debug else ASSET_VERSION}
+
+@app.after_request
+def cache_versioned_assets(resp):
+    """?v=<asset version> URLs change whenever the file does: let browsers keep them."""
+    if (request.endpoint == "static" and resp.status_code == 200 and not app.debug
+            and request.args.get("v") == ASSET_VERSION):
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        resp.cache_control.max_age = STATIC_MAX_AGE
+        resp.cache_control.immutable = True
+    return resp
+
+def _release_on_close(resp, holds):
+    """Give back upload references once a streamed response has been fully sent."""
+    resp.call_on_close(lambda: storage.release(*holds))
+    return resp
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
-def _unique_name(filename: str) -> str:
-    name, ext = os.path.splitext(secure_filename(filename))
-    return f"{name}_{uuid.uuid4().hex[:8]}{ext}"
+def _temp_output(suffix: str) -> str:
+    fd, path = tempfile.mkstemp(prefix="perdf_", suffix=suffix)
+    os.close(fd)
+    return path
+
+def _open_pdf(path: str):
+    """Open an uploaded PDF once for page counting and the work that follows; None if unreadable."""
+    try:
+        return fitz.open(path)
+    except Exception as e:
+        print("PDF open error:", e)
+        return None
+
+def _zip_response(entries, download_name: str):
+    """Stream a ZIP built from (name, bytes) entries as they are produced."""
+    resp = Response(metrics.timed_iter("zip", iter_zip(entries), size=len), mimetype="application/zip")
+    resp.headers.set("Content-Disposition", "attachment", filename=download_name)
+    return resp
+
+def _send_temp_file(path: str, mimetype: str, download_name: str, stats: dict = None):
+    """Stream a result file from disk and delete it once the response is closed."""
+    resp = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+    if stats:
+        resp.headers["X-PerDF-Bytes-Saved"] = str(stats["bytes_saved"])
+    # passthrough responses skip close callbacks in werkzeug; iterate the file wrapper instead
+    resp.direct_passthrough = False
+    resp.call_on_close(lambda: _remove_quietly(path))
+    return resp
+
+def _write_zip(entries, out_path: str) -> int:
+    """write_zip timed as the "zip" stage; returns the archive size."""
+    with metrics.stage("zip") as st:
+        size = write_zip(entries, out_path)
+        st.add_bytes(size)
+    return size
+
+
+def _job_info(job: dict) -> dict:
+    total = job["total"]
+    info = {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "done": job["done"],
+        "total": total,
+        "percent": 100 if job["status"] == "done" else (int(job["done"] * 100 / total) if total else 0),
+        "error": job["error"],
+        "stats": job["stats"],
+        "status_url": url_for("job_status", job_id=job["id"]),
+        "result_url": url_for("job_result", job_id=job["id"]) if job["status"] == "done" else None,
+    }
+    return info
+
+def _optimize_opts():
+    """(target_dpi, jpeg_quality) from the form, defaulting to PERDF_OPTIMIZE_*; dpi 0 means off."""
+    try:
+        dpi = float(request.form.get("optimize_dpi") or OPTIMIZE_DPI)
+    except ValueError:
+        dpi = 0.0
+    try:
+        quality = int(request.form.get("jpeg_quality") or OPTIMIZE_JPEG_QUALITY)
+    except ValueError:
+        quality = OPTIMIZE_JPEG_QUALITY
+    return max(0.0, dpi), min(95, max(10, quality))
+
+def _queue_job(kind: str, work, mimetype: str, download_name: str, holds=()):
+    """Hand a large conversion to the job queue and answer with its id right away."""
+    def run(out_path, progress):
+        try:
+            return work(out_path, progress)
+        finally:
+            storage.release(*holds)
+
+    job_id = jobs.submit(kind, run, mimetype, download_name)
+    if job_id is None:
+        storage.release(*holds)
+        flash("Sunucu yoğun; lütfen biraz sonra tekrar deneyin.")
+        return redirect(url_for(kind))
+    info = _job_info(jobs.get(job_id))
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(info), 202
+    return render_template("job.html", job=info), 202
 
 @app.route("/")
 def index():
@@ -66,47 +205,53 @@ def merge():
     if sort_name and files:
         files = sorted(files, key=lambda f: (f.filename or "").lower())
 
-    # Save uploads, compute hash for dedupe
+    # Spool uploads into the content-addressed store; its SHA-256 key doubles as the dedupe hash
     dedupe = request.form.get("dedupe") == "1"
     seen = set()
     saved_paths = []
-    import hashlib
+    holds = []
     for f in files:
         if not f or not f.filename.lower().endswith(".pdf"):
             continue
-        data = f.read()  # read into memory to hash; typical PDFs are fine for MVP
-        f.stream.seek(0)
+        h, path = storage.put_upload(f)
+        holds.append(h)
         if dedupe:
-            h = hashlib.sha256(data).hexdigest()
             if h in seen:
                 continue
             seen.add(h)
-        fname = _unique_name(f.filename)
-        path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-        f.save(path)
         saved_paths.append(path)
 
     if not saved_paths:
+        storage.release(*holds)
         flash("Geçerli PDF bulunamadı (kopyalar ayıklandıysa hepsi aynı olabilir).")
         return redirect(url_for("merge"))
 
-    # Merge
-    writer = PdfWriter()
-    for path in saved_paths:
-        try:
-            reader = PdfReader(path)
-            # Try to keep metadata from the first file
-            if len(writer.pages) == 0 and reader.metadata:
-                writer.add_metadata(reader.metadata)
-            for page in reader.pages:
-                writer.add_page(page)
-        except Exception as e:
-            print("Merge error:", e)
+    optimize_dpi, jpeg_quality = _optimize_opts()
 
-    out_buf = io.BytesIO()
-    writer.write(out_buf)
-    out_buf.seek(0)
-    return send_file(out_buf, mimetype="application/pdf", as_attachment=True, download_name="perdf_merged.pdf")
+    def work(out_path, progress=None):
+        with metrics.stage("merge", sum(os.path.getsize(p) for p in saved_paths)):
+            if not merge_pdfs(saved_paths, out_path, progress=progress):
+                raise ValueError("PDF'ler birleştirilemedi.")
+        # optional pass: resample oversized images and collapse duplicates across inputs
+        if optimize_dpi:
+            with metrics.stage("optimize", os.path.getsize(out_path)):
+                return optimize_pdf(out_path, optimize_dpi, jpeg_quality)
+        return None
+
+    if should_queue(request.content_length):
+        return _queue_job("merge", work, "application/pdf", "perdf_merged.pdf", holds)
+
+    # Merge into a temp file on disk and stream it back
+    out_path = _temp_output(".pdf")
+    try:
+        stats = work(out_path)
+    except ValueError as e:
+        _remove_quietly(out_path)
+        flash(str(e))
+        return redirect(url_for("merge"))
+    finally:
+        storage.release(*holds)
+    return _send_temp_file(out_path, "application/pdf", "perdf_merged.pdf", stats)
 
 # ------------- PDF SPLIT -------------
 
@@ -121,9 +266,7 @@ def split():
         return redirect(url_for("split"))
 
     # Save upload
-    fname = _unique_name(f.filename)
-    path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-    f.save(path)
+    doc_hash, path = storage.put_upload(f)
 
     # Options
     ranges_spec = (request.form.get("ranges") or "").strip()
@@ -132,65 +275,52 @@ def split():
     if "{n}" not in pattern:
         pattern = "page_{n}.pdf"
 
-    reader = PdfReader(path)
-    total = len(reader.pages)
-
-    # Parse ranges like "1-3,7,10-12"
-    def parse_ranges(spec: str, total_pages: int):
-        if not spec:
-            return list(range(1, total_pages+1))
-        nums = set()
-        for part in spec.split(","):
-            part = part.strip()
-            if not part:
-                continue
-            if "-" in part:
-                a, b = part.split("-", 1)
-                try:
-                    a, b = int(a), int(b)
-                except ValueError:
-                    continue
-                if a > b: a, b = b, a
-                for x in range(max(1,a), min(total_pages,b)+1):
-                    nums.add(x)
-            else:
-                try:
-                    x = int(part)
-                    if 1 <= x <= total_pages:
-                        nums.add(x)
-                except ValueError:
-                    continue
-        return sorted(nums)
-
-    pages = parse_ranges(ranges_spec, total)
+    # one open serves the page count and the split itself
+    doc = _open_pdf(path)
+    if doc is None:
+        storage.release(doc_hash)
+        flash("PDF okunamadı.")
+        return redirect(url_for("split"))
+    pages = parse_ranges(ranges_spec, doc.page_count)
     if not pages:
+        doc.close()
+        storage.release(doc_hash)
         flash("Geçerli sayfa aralığı bulunamadı.")
         return redirect(url_for("split"))
 
+    queue = should_queue(request.content_length)
+
     if mode == "single":
         # one combined PDF
-        w = PdfWriter()
-        for p in pages:
-            w.add_page(reader.pages[p-1])
-        out_buf = io.BytesIO()
-        w.write(out_buf)
-        out_buf.seek(0)
-        return send_file(out_buf, mimetype="application/pdf", as_attachment=True, download_name="perdf_selected_pages.pdf")
-
-    # default: separate PDFs zipped
-    mem_zip = io.BytesIO()
-    with zipfile.ZipFile(mem_zip, "w", zipfile.ZIP_DEFLATED) as zf:
-        for p in pages:
-            w = PdfWriter()
-            w.add_page(reader.pages[p-1])
-            pdf_bytes = io.BytesIO()
-            w.write(pdf_bytes)
+        def work(out_path, progress=None):
+            with metrics.stage("split") as st:
+                select_pages(path, pages, out_path, progress=progress, doc=doc)
+                st.add_bytes(os.path.getsize(out_path))
+
+        if queue:
+            return _queue_job("split", work, "application/pdf", "perdf_selected_pages.pdf", [doc_hash])
+        out_path = _temp_output(".pdf")
+        try:
+            work(out_path)
+        finally:
+            storage.release(doc_hash)
+        return _send_temp_file(out_path, "application/pdf", "perdf_selected_pages.pdf")
+
+    # default: separate PDFs zipped, streamed entry by entry
+    def entries(progress=None):
+        split = metrics.timed_iter("split", split_pages(path, pages, doc=doc), size=lambda e: len(e[1]))
+        for n, (p, pdf_bytes) in enumerate(split, start=1):
             out_name = pattern.replace("{n}", str(p))
             if not out_name.lower().endswith(".pdf"):
                 out_name += ".pdf"
-            zf.writestr(out_name, pdf_bytes.getvalue())
-    mem_zip.seek(0)
-    return send_file(mem_zip, mimetype="application/zip", as_attachment=True, download_name="perdf_split_pages.zip")
+            yield out_name, pdf_bytes
+            if progress:
+                progress(n, len(pages))
+
+    if queue:
+        return _queue_job("split", lambda out_path, progress: _write_zip(entries(progress), out_path),
+                          "application/zip", "perdf_split_pages.zip", [doc_hash])
+    return _release_on_close(_zip_response(entries(), "perdf_split_pages.zip"), [doc_hash])
 
 # ------------- PDF -> IMAGE -------------
 
@@ -203,9 +333,7 @@ def pdf_to_image():
         flash("PDF yükleyin.")
         return redirect(url_for("pdf_to_image"))
 
-    fname = _unique_name(f.filename)
-    path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-    f.save(path)
+    doc_hash, path = storage.put_upload(f)
 
     ranges_spec = (request.form.get("ranges") or "").strip()
     dpi = int(request.form.get("dpi") or 200)
@@ -213,50 +341,32 @@ def pdf_to_image():
     if fmt not in ("png","jpg","jpeg"):
         fmt = "png"
 
-    reader = PdfReader(path)
-    total = len(reader.pages)
-
-    def parse_ranges(spec: str, total_pages: int):
-        if not spec:
-            return list(range(1, total_pages+1))
-        nums = set()
-        for part in spec.split(","):
-            part = part.strip()
-            if not part:
-                continue
-            if "-" in part:
-                a, b = part.split("-", 1)
-                try:
-                    a, b = int(a), int(b)
-                except ValueError:
-                    continue
-                if a > b: a, b = b, a
-                for x in range(max(1,a), min(total_pages,b)+1):
-                    nums.add(x)
-            else:
-                try:
-                    x = int(part)
-                    if 1 <= x <= total_pages:
-                        nums.add(x)
-                except ValueError:
-                    continue
-        return sorted(nums)
-
-    pages = parse_ranges(ranges_spec, total)
+    doc = _open_pdf(path)
+    if doc is None:
+        storage.release(doc_hash)
+        flash("PDF okunamadı.")
+        return redirect(url_for("pdf_to_image"))
+    pages = parse_ranges(ranges_spec, doc.page_count)
     if not pages:
+        doc.close()
+        storage.release(doc_hash)
         flash("Geçerli sayfa aralığı bulunamadı.")
         return redirect(url_for("pdf_to_image"))
 
-    doc = fitz.open(path)
-    mem_zip = io.BytesIO()
-    with zipfile.ZipFile(mem_zip, "w", zipfile.ZIP_DEFLATED) as zf:
-        for p in pages:
-            page = doc[p-1]
-            pix = page.get_pixmap(dpi=dpi)
-            img_bytes = pix.tobytes(fmt)
-            zf.writestr(f"page_{p}.{fmt}", img_bytes)
-    mem_zip.seek(0)
-    return send_file(mem_zip, mimetype="application/zip", as_attachment=True, download_name="perdf_images.zip")
+    # pages render in parallel worker processes and are streamed out in order;
+    # PNG/JPEG entries are stored, not deflated a second time
+    def entries(progress=None):
+        rendered = metrics.timed_iter("render", render_pages(path, pages, dpi, fmt, doc=doc),
+                                      size=lambda e: len(e[1]))
+        for n, (p, img_bytes) in enumerate(rendered, start=1):
+            yield f"page_{p}.{fmt}", img_bytes
+            if progress:
+                progress(n, len(pages))
+
+    if should_queue(request.content_length):
+        return _queue_job("pdf_to_image", lambda out_path, progress: _write_zip(entries(progress), out_path),
+                          "application/zip", "perdf_images.zip", [doc_hash])
+    return _release_on_close(_zip_response(entries(), "perdf_images.zip"), [doc_hash])
 
 # ------------- IMAGE -> PDF -------------
 
@@ -281,116 +391,63 @@ def image_to_pdf():
         except Exception as e:
             print("Order parse error:", e)
 
-    page_size = (request.form.get("page_size") or "auto")
-    orientation = (request.form.get("orientation") or "auto")
-    fit_mode = (request.form.get("fit_mode") or "contain")
+    opts = {
+        "page_size": (request.form.get("page_size") or "auto"),
+        "orientation": (request.form.get("orientation") or "auto"),
+        "fit_mode": (request.form.get("fit_mode") or "contain"),
+    }
     try:
-        margin_mm = float(request.form.get("margin_mm") or 10.0)
+        opts["margin_mm"] = float(request.form.get("margin_mm") or 10.0)
     except Exception:
-        margin_mm = 10.0
+        opts["margin_mm"] = 10.0
 
-    # If auto page size and zero margins and fit=contain, we can use PIL simple multi-save
-    simple_path = (page_size == "auto" and margin_mm <= 0 and fit_mode == "contain")
+    # Spool images to disk so the conversion can also run outside this request
+    stored = [storage.put_upload(f) for f in files if f and f.filename]
+    holds = [h for h, _ in stored]
+    paths = [p for _, p in stored]
 
-    # Load images
-    from PIL import Image
-    imgs = []
-    for f in files:
-        try:
-            img = Image.open(f.stream).convert("RGB")
-            imgs.append(img)
-        except Exception as e:
-            print("IMG load error:", e)
+    # images larger than their page box needs are resampled while the PDF is built
+    opts["target_dpi"], opts["jpeg_quality"] = _optimize_opts()
 
-    if not imgs:
-        flash("Görsel okunamadı.")
-        return redirect(url_for("image_to_pdf"))
+    def work(out_path, progress=None):
+        stats = new_stats()
+        with metrics.stage("image_to_pdf", sum(os.path.getsize(p) for p in paths)):
+            if not images_to_pdf(paths, out_path, opts, progress, stats=stats):
+                raise ValueError("Görsel okunamadı.")
+        # bytes saved are only reported when the optimize pass ran, as for merge
+        return stats if opts["target_dpi"] else None
 
-    if simple_path and len(imgs) == 1:
-        out_buf = io.BytesIO()
-        imgs[0].save(out_buf, format="PDF")
-        out_buf.seek(0)
-        return send_file(out_buf, mimetype="application/pdf", as_attachment=True, download_name="perdf_from_images.pdf")
-    elif simple_path and len(imgs) > 1:
-        out_buf = io.BytesIO()
-        imgs[0].save(out_buf, format="PDF", save_all=True, append_images=imgs[1:])
-        out_buf.seek(0)
-        return send_file(out_buf, mimetype="application/pdf", as_attachment=True, download_name="perdf_from_images.pdf")
-
-    # Advanced path with ReportLab for page size/margins/fit modes
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import A4, LETTER, landscape, portrait
-
-    def mm_to_pt(mm): 
-        return mm * 72.0 / 25.4
-
-    margin_pt = mm_to_pt(margin_mm)
-
-    def pick_page_size(base, img):
-        # auto orientation based on image aspect if requested
-        if orientation == "portrait":
-            return portrait(base)
-        if orientation == "landscape":
-            return landscape(base)
-        # auto: decide by image aspect ratio (>1: landscape)
-        w, h = img.size
-        if w >= h:
-            return landscape(base)
-        return portrait(base)
-
-    def get_base_size():
-        if page_size == "A4":
-            return A4
-        if page_size == "Letter":
-            return LETTER
-        # auto -> use A4 as base, but will be oriented automatically
-        return A4
-
-    base = get_base_size()
-
-    out_buf = io.BytesIO()
-    c = canvas.Canvas(out_buf, pagesize=base)  # will be reset per page
-
-    for img in imgs:
-        # decide page size for this image
-        ps = pick_page_size(base, img)
-        c.setPageSize(ps)
-        page_w, page_h = ps
-        box_w = max(1, page_w - 2*margin_pt)
-        box_h = max(1, page_h - 2*margin_pt)
-
-        iw, ih = img.size
-        # assume 72 dpi if not provided
-        dpi = img.info.get("dpi", (72,72))[0] or 72
-        # image size in points at 72dpi scaling
-        iw_pt = iw * 72.0 / dpi
-        ih_pt = ih * 72.0 / dpi
-
-        if fit_mode == "stretch":
-            draw_w, draw_h = box_w, box_h
-        else:
-            import math
-            scale_fit = min(box_w/iw_pt, box_h/ih_pt)
-            scale_cover = max(box_w/iw_pt, box_h/ih_pt)
-            s = scale_fit if fit_mode == "contain" else scale_cover
-            draw_w, draw_h = iw_pt*s, ih_pt*s
-
-        # center in box
-        x = (page_w - draw_w) / 2.0
-        y = (page_h - draw_h) / 2.0
-
-        # Save PIL image to a temporary in-memory buffer to draw
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        # reportlab needs a filename or a PIL ImageReader
-        from reportlab.lib.utils import ImageReader
-        c.drawImage(ImageReader(buf), x, y, width=draw_w, height=draw_h, preserveAspectRatio=False, mask='auto')
-        c.showPage()
-
-    c.save()
-    out_buf.seek(0)
-    return send_file(out_buf, mimetype="application/pdf", as_attachment=True, download_name="perdf_from_images.pdf")
+    if should_queue(request.content_length):
+        return _queue_job("image_to_pdf", work, "application/pdf", "perdf_from_images.pdf", holds)
+
+    out_path = _temp_output(".pdf")
+    try:
+        stats = work(out_path)
+    except ValueError as e:
+        _remove_quietly(out_path)
+        flash(str(e))
+        return redirect(url_for("image_to_pdf"))
+    finally:
+        storage.release(*holds)
+    return _send_temp_file(out_path, "application/pdf", "perdf_from_images.pdf", stats)
+
+# ------------- JOBS -------------
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "İş bulunamadı."}), 404
+    return jsonify(_job_info(job))
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "İş bulunamadı."}), 404
+    if job["status"] != "done":
+        return jsonify(_job_info(job)), 409
+    return send_file(job["result_path"], mimetype=job["mimetype"], as_attachment=True, download_name=job["download_name"])
 
 # ------------- PDF CHAT -------------
 @app.route("/pdf_chat", methods=["GET"])
@@ -403,10 +460,16 @@ def upload_pdf_chat():
     if not f:
         flash("PDF yükleyin.")
         return redirect(url_for("pdf_chat"))
-    fname = _unique_name(f.filename)
-    path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-    f.save(path)
-    return render_template("pdf_chat.html", pdf_uploaded=True, filename=fname)
+    # No reference is held: the document lives until it has been idle for PERDF_STORE_TTL
+    doc_hash, path = storage.put_upload(f, hold=False)
+    try:
+        # Parse + embed once; questions then only embed the query
+        build_doc_index(path, doc_hash)
+        add_to_corpus(path, doc_hash)
+    except Exception as e:
+        print("index build error:", e)
+    return render_template("pdf_chat.html", pdf_uploaded=True, filename=doc_hash,
+                           display_name=secure_filename(f.filename or "") or "belge.pdf")
 
 
 @app.route("/ask_pdf_question", methods=["POST"])
@@ -416,9 +479,111 @@ def ask_pdf_question():
     if not filename or not q:
         flash("Soru veya dosya eksik.")
         return redirect(url_for("pdf_chat"))
-    path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    data = get_relevant_answer_struct(path, q, k=3, make_previews=True)
-    return render_template("pdf_chat.html", pdf_uploaded=True, filename=filename, qa=data, query=q)
+    display_name = request.form.get("display_name") or filename
+    path = storage.path_for(filename)
+    if not path:
+        flash("Dosya bulunamadı veya süresi doldu; lütfen tekrar yükleyin.")
+        return redirect(url_for("pdf_chat"))
+    data = get_relevant_answer_struct(path, q, k=3, make_previews=True, doc_hash=filename)
+    return render_template("pdf_chat.html", pdf_uploaded=True, filename=filename, display_name=display_name,
+                           qa=data, query=q)
+
+@app.route("/ask_pdf_question/stream")
+def ask_pdf_question_stream():
+    """
+    /ask_pdf_question as server-sent events (?filename=<hash>&question=...): ranked snippets
+    first, then each page preview as it is ready, then the summary. See iter_relevant_answer.
+    """
+    filename = request.args.get("filename")
+    q = (request.args.get("question") or "").strip()
+    if not filename or not q:
+        return jsonify({"error": "Soru veya dosya eksik."}), 400
+    path = storage.path_for(filename)
+    if not path:
+        return jsonify({"error": "Dosya bulunamadı veya süresi doldu; lütfen tekrar yükleyin."}), 404
+
+    def events():
+        try:
+            for event, data in iter_relevant_answer(path, q, k=3, make_previews=True, doc_hash=filename):
+                if event == "preview":
+                    data = dict(data, preview=url_for("uploads", filename=data["preview"]))
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            # not "error": EventSource reserves that name for connection failures
+            print("chat stream error:", e)
+            yield 'event: failed\ndata: {"error": "Yanıt oluşturulamadı."}\n\n'
+
+    resp = Response(stream_with_context(events()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # let reverse proxies pass events through unbuffered
+    return resp
+
+@app.route("/ask_pdf_questions", methods=["POST"])
+def ask_pdf_questions():
+    """
+    Batch Q&A for one document, JSON in and out. Body: {"filename": <hash>, "questions": [...],
+    "k": 3, "previews": true}; form posts may send questions one per line.
+    """
+    payload = request.get_json(silent=True) or {}
+    filename = payload.get("filename") or request.form.get("filename")
+    questions = payload.get("questions")
+    if questions is None:
+        questions = (request.form.get("questions") or "").splitlines()
+    if isinstance(questions, str) or not isinstance(questions, list):
+        return jsonify({"error": "questions bir liste olmalı."}), 400
+    questions = [str(q).strip() for q in questions if str(q).strip()]
+    if not filename or not questions:
+        return jsonify({"error": "Soru veya dosya eksik."}), 400
+    if len(questions) > CHAT_BATCH_MAX:
+        return jsonify({"error": f"En fazla {CHAT_BATCH_MAX} soru gönderilebilir."}), 400
+    path = storage.path_for(filename)
+    if not path:
+        return jsonify({"error": "Dosya bulunamadı veya süresi doldu; lütfen tekrar yükleyin."}), 404
+    try:
+        k = max(1, min(10, int(payload.get("k") or request.form.get("k") or 3)))
+    except (TypeError, ValueError):
+        k = 3
+    make_previews = str(payload.get("previews", request.form.get("previews", "1"))).lower() not in ("0", "false", "no")
+
+    data = get_relevant_answers_batch(path, questions, k=k, make_previews=make_previews, doc_hash=filename)
+    for answer in data["answers"]:
+        if answer["summary_id"]:
+            answer["summary_url"] = url_for("pdf_chat_summary", summary_id=answer["summary_id"])
+        for r in answer["results"]:
+            r["preview_url"] = url_for("uploads", filename=r["preview"]) if r["preview"] else None
+    return jsonify(data)
+
+@app.route("/search_pdfs")
+def search_pdfs():
+    """Semantic search over every uploaded chat document: ?q=...&k=10 -> (document, page, snippet) hits."""
+    # the hits name other users' documents, and a document hash is all /ask_pdf_question needs
+    if not CORPUS_ENABLED:
+        return jsonify({"error": "Arşiv araması kapalı."}), 404
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "Arama metni (q) eksik."}), 400
+    try:
+        k = int(request.args.get("k") or 10)
+    except ValueError:
+        k = 10
+    t0 = time.perf_counter()
+    hits = search_corpus(q, k)
+    if hits is None:
+        return jsonify({"error": "Embedding modeli kullanılamıyor; arşiv araması kapalı."}), 503
+    return jsonify({"query": q, "took_ms": round((time.perf_counter() - t0) * 1000, 1), "hits": hits})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target: per-stage and per-route timings of this process."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/pdf_chat/summary/<summary_id>")
+def pdf_chat_summary(summary_id):
+    """Long-poll for an LLM summary that wasn't ready when the answer page was rendered."""
+    state = summarizer.poll(summary_id, wait=5)
+    if state is None:
+        return jsonify({"status": "unknown"}), 404
+    return jsonify(state)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "10000")), debug=True)
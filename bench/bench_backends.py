@@ -0,0 +1,85 @@
+"""
+PDF backend comparison: merge, page selection and per-page split with PyMuPDF and PyPDF2.
+
+    python bench/bench_backends.py --files 20 --pages 100
+    python bench/bench_backends.py --variants fitz:0:0,fitz:3:1,pypdf2:0:1
+
+Inputs are text PDFs sharing one embedded font, saved without stream compression,
+plus a shared image every tenth page, so both the copying speed and the effect of
+the garbage / deflate output options are visible. A variant is backend:garbage:deflate.
+Reports wall time, pages/s, input MB/s and output size per operation.
+"""
+import argparse, os, sys, time, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_inputs(d, files, pages):
+    import fitz
+    side = 300
+    pix = fitz.Pixmap(fitz.csRGB, side, side, os.urandom(side * side * 3), 0)
+    paths = []
+    for f in range(files):
+        doc = fitz.open()
+        xref = 0
+        for p in range(pages):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 545, 700),
+                                f"Belge {f + 1}, sayfa {p + 1}. " + "Lorem ipsum dolor sit amet. " * 60,
+                                fontsize=9, fontname="tiro")
+            if p % 10 == 0:
+                xref = page.insert_image(fitz.Rect(100, 710, 250, 810), pixmap=pix if not xref else None, xref=xref)
+        doc.set_metadata({"title": f"Belge {f + 1}", "author": "perdf bench"})
+        path = os.path.join(d, f"in_{f:03d}.pdf")
+        doc.save(path, garbage=1, deflate=False)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=100, help="pages per input file")
+    ap.add_argument("--variants", default="fitz:1:0,fitz:3:1,pypdf2:0:0,pypdf2:0:1")
+    ap.add_argument("--ops", default="merge,select,split")
+    args = ap.parse_args()
+
+    import pdf_engine
+    with tempfile.TemporaryDirectory(prefix="perdf_bench_") as d:
+        paths = make_inputs(d, args.files, args.pages)
+        in_mb = sum(os.path.getsize(p) for p in paths) / 2**20
+        print(f"input: {args.files} files x {args.pages} pages, {in_mb:.1f} MB")
+        big = paths[0]
+        big_mb = os.path.getsize(big) / 2**20
+        every_other = list(range(1, args.pages + 1, 2))
+
+        for variant in args.variants.split(","):
+            name, garbage, deflate = (variant.split(":") + ["1", "0"])[:3]
+            options = {"garbage": int(garbage), "deflate": deflate == "1"}
+            pdf_engine.PDF_DEFLATE = options["deflate"]  # read directly by the per-page split writers
+            backend = pdf_engine.BACKENDS[name](options=options)
+            for op in args.ops.split(","):
+                out = os.path.join(d, f"out_{name}_{op}.pdf")
+                t0 = time.perf_counter()
+                if op == "merge":
+                    n = backend.merge(paths, out)
+                    size, mb = os.path.getsize(out), in_mb
+                elif op == "select":
+                    n = backend.select(big, every_other, out)
+                    size, mb = os.path.getsize(out), big_mb
+                else:
+                    n, size = 0, 0
+                    for _, data in backend.split(big, range(1, args.pages + 1)):
+                        n, size = n + 1, size + len(data)
+                    mb = big_mb
+                dt = time.perf_counter() - t0
+                print(f"{variant:<12} {op:<7} {dt:7.2f}s  {n / dt:8.0f} pages/s  {mb / dt:7.1f} MB/s  "
+                      f"output {size / 2**20:7.2f} MB")
+                if os.path.exists(out):
+                    os.remove(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Chunking benchmark: retrieval quality vs. embedding cost for the chunkers and size/overlap settings.
+
+    python bench/bench_chunking.py --pages 300 --k 3
+
+A synthetic document is generated with one "fact" sentence ("The <attribute> of <name>
+is <value>.") every few sentences; pages are cut at a fixed length, so some facts run
+across a page break. For each fact we ask "What is the <attribute> of <name>?" and
+count a hit when one of the top-k chunks contains both the name and the value, i.e.
+the whole answer. Ranking is BM25 (keyword mode), plus the embedding model when
+sentence-transformers is installed. "embedded chars" is what the embedding model has
+to encode at upload time; "dup" is the share of it that is repeated overlap text.
+"""
+import argparse, os, sys, time, random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SYLLABLES = ["ka", "lo", "ve", "ri", "tan", "mo", "sel", "du", "pra", "nik", "zo", "ber", "ul", "gam", "ti"]
+ATTRIBUTES = ["capacity", "density", "altitude", "budget", "voltage", "yield", "tariff", "radius"]
+
+
+def _word(rng, n):
+    return "".join(rng.choice(SYLLABLES) for _ in range(n))
+
+
+def make_pdf(path, pages, page_chars, seed=7):
+    import fitz
+    rng = random.Random(seed)
+    facts, text = [], []
+    while sum(map(len, text)) < pages * page_chars:
+        para = []
+        for _ in range(rng.randint(3, 7)):
+            if rng.random() < 0.25:
+                name, attr = _word(rng, 3).capitalize() + _word(rng, 2), rng.choice(ATTRIBUTES)
+                value = f"{rng.randint(1000, 99999)} units"
+                facts.append((attr, name, value))
+                para.append(f"The {attr} of {name} is {value}.")
+            else:
+                words = [_word(rng, rng.randint(1, 3)) for _ in range(rng.randint(8, 22))]
+                para.append(" ".join(words).capitalize() + ".")
+        text.append(" ".join(para) + "\n\n")
+    text = "".join(text)
+
+    doc = fitz.open()
+    pos = 0
+    while pos < len(text):
+        cut = min(len(text), pos + page_chars)
+        if cut < len(text):
+            cut = text.rfind(" ", pos, cut) + 1 or cut  # whole words only; sentences may run on
+        page = doc.new_page()
+        if page.insert_textbox(fitz.Rect(40, 40, 555, 800), text[pos:cut], fontsize=8) < 0:
+            raise SystemExit("page text overflowed; lower --page-chars")
+        pos = cut
+    doc.save(path)
+    return facts
+
+
+def evaluate(pdf, facts, mode, size, overlap, k, embed):
+    import chunker, utils
+    t0 = time.perf_counter()
+    parts = chunker.chunk_document(pdf, mode=mode, size=size, overlap=overlap)
+    chunk_s = time.perf_counter() - t0
+    chunks = chunker.Chunks(parts["text"], parts["spans"])
+    covered = sum(b - a for a, b in parts["spans"])
+    unique = len({i for a, b in parts["spans"] for i in range(a, b)})
+    index = {"chunks": chunks}
+    questions = [f"What is the {attr} of {name}?" for attr, name, _ in facts]
+
+    def hits(orders):
+        n = 0
+        for (attr, name, value), order in zip(facts, orders):
+            n += any(name in chunks[i] and value in chunks[i] for i in order[:k])
+        return n / len(facts)
+
+    row = {"chunks": len(chunks), "embedded": covered, "dup": 1 - unique / max(1, covered), "chunk_s": chunk_s,
+           "kw": hits([utils._rank_keyword(index, q, k) for q in questions])}
+    if embed:
+        import numpy as np
+        t0 = time.perf_counter()
+        vecs = utils._try_embed(["passage: " + c for c in chunks])
+        row["embed_s"] = time.perf_counter() - t0
+        index["emb"] = np.asarray(vecs, dtype=np.float32)
+        row["emb"] = hits(utils._rank_embedding_batch(index, questions, k))
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=300)
+    ap.add_argument("--page-chars", type=int, default=2200)
+    ap.add_argument("--k", type=int, default=3)
+    ap.add_argument("--sizes", default="500,900,1200")
+    ap.add_argument("--overlaps", default="0,120,250")
+    ap.add_argument("--no-embed", action="store_true", help="skip the embedding model even if installed")
+    args = ap.parse_args()
+
+    import tempfile, utils
+    embed = not args.no_embed and utils.get_embed_model() is not None
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = os.path.join(tmp, "doc.pdf")
+        facts = make_pdf(pdf, args.pages, args.page_chars)
+        print(f"{args.pages} pages, {len(facts)} facts, top-{args.k}"
+              + ("" if embed else " (no embedding model: keyword ranking only)"))
+        configs = [("fixed", 900, 150)] + [("sentence", int(s), int(o)) for s in args.sizes.split(",")
+                                           for o in args.overlaps.split(",")]
+        head = f"{'chunker':<16}{'chunks':>8}{'embedded chars':>16}{'dup':>7}{'chunk s':>9}{'hit kw':>8}"
+        print(head + (f"{'hit emb':>9}{'embed s':>9}" if embed else ""))
+        for mode, size, overlap in configs:
+            r = evaluate(pdf, facts, mode, size, overlap, args.k, embed)
+            line = (f"{f'{mode} {size}/{overlap}':<16}{r['chunks']:>8}{r['embedded']:>16,}{r['dup']:>7.1%}"
+                    f"{r['chunk_s']:>9.2f}{r['kw']:>8.1%}")
+            if embed:
+                line += f"{r['emb']:>9.1%}{r['embed_s']:>9.1f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
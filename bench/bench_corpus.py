@@ -0,0 +1,85 @@
+"""
+Corpus index benchmark: insert throughput, rebuild time, search latency and recall.
+
+    python bench/bench_corpus.py --chunks 1000000 --dim 384
+
+Synthetic clustered unit vectors stand in for passage embeddings (no model needed);
+documents of --doc-chunks vectors are inserted one add() at a time as uploads would.
+Search latency is measured for the exact scan (before the IVF lists exist) and for
+IVF with several nprobe values; recall@k is against the exact top-k.
+The figures cover the vector search only; /search_pdfs also reads the stored
+index of each distinct hit document (once per document and search) for its snippets.
+"""
+import argparse, hashlib, os, sys, time, tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def pct(values, p):
+    return float(np.percentile(np.asarray(values) * 1000, p))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=1_000_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--doc-chunks", type=int, default=200)
+    ap.add_argument("--clusters", type=int, default=5000, help="topics in the synthetic data")
+    ap.add_argument("--noise", type=float, default=0.05, help="per-dimension spread around a topic")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nprobe", default="4,8,16,32,64")
+    args = ap.parse_args()
+
+    from corpus_index import CorpusIndex, _normalize
+    rng = np.random.default_rng(0)
+    topics = _normalize(rng.standard_normal((args.clusters, args.dim)))
+
+    def sample(n):
+        noise = args.noise * rng.standard_normal((n, args.dim)).astype(np.float32)
+        return _normalize(topics[rng.integers(0, args.clusters, n)] + noise)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = CorpusIndex(tmp, train_min=1 << 62)  # no background rebuilds while loading
+        add_times = []
+        t0 = time.perf_counter()
+        for d in range(0, args.chunks, args.doc_chunks):
+            vecs = sample(min(args.doc_chunks, args.chunks - d))
+            t = time.perf_counter()
+            index.add(hashlib.sha256(str(d).encode()).hexdigest(), vecs, "bench")
+            add_times.append(time.perf_counter() - t)
+        total = time.perf_counter() - t0
+        print(f"inserted {args.chunks:,} x {args.dim} in {len(add_times):,} documents: "
+              f"add() p50 {pct(add_times, 50):.1f} ms, p99 {pct(add_times, 99):.1f} ms "
+              f"({args.chunks / total:,.0f} vectors/s incl. data generation)")
+
+        queries = sample(args.queries)
+        flat, exact = [], []
+        for q in queries:
+            t = time.perf_counter()
+            hits = index.search(q, args.k)[0]
+            flat.append(time.perf_counter() - t)
+            exact.append({(h, c) for h, c, _ in hits})
+        print(f"exact scan: p50 {pct(flat, 50):.1f} ms, p99 {pct(flat, 99):.1f} ms")
+
+        index.train_min = 0
+        t = time.perf_counter()
+        meta = index.rebuild(force=True)
+        print(f"rebuild (k-means, {meta['nlist']} lists): {time.perf_counter() - t:.1f} s")
+
+        for nprobe in [int(x) for x in args.nprobe.split(",")]:
+            lat, recall = [], []
+            for q, truth in zip(queries, exact):
+                t = time.perf_counter()
+                hits = index.search(q, args.k, nprobe=nprobe)[0]
+                lat.append(time.perf_counter() - t)
+                recall.append(len(truth & {(h, c) for h, c, _ in hits}) / max(1, len(truth)))
+            print(f"IVF nprobe={nprobe:<3} p50 {pct(lat, 50):6.2f} ms  p99 {pct(lat, 99):6.2f} ms  "
+                  f"recall@{args.k} {np.mean(recall):.3f}")
+
+
+if __name__ == "__main__":
+    main()
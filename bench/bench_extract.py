@@ -0,0 +1,60 @@
+"""
+Text extraction benchmark for Q&A indexing: worker scaling and the per-page cache.
+
+    python bench/bench_extract.py --pages 1000 --workers 1,2,4
+
+Extracts a synthetic text-heavy PDF with each worker count (cache off), then shows
+a cold cache, a warm cache and a re-index after one page was edited.
+"""
+import argparse, os, sys, time, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_pdf(path, pages):
+    import fitz
+    doc = fitz.open()
+    text = "PerDF çıkarma testi: bu paragraf birkaç cümle içerir. İkinci cümle burada biter. " * 12
+    for i in range(pages):
+        page = doc.new_page()
+        for j in range(4):
+            page.insert_textbox(fitz.Rect(50, 50 + j * 190, 545, 230 + j * 190), f"{i+1}.{j+1} " + text,
+                                fontsize=8)
+    doc.save(path)
+    return doc
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=1000)
+    ap.add_argument("--workers", default=",".join(str(w) for w in sorted({1, 2, 4, os.cpu_count() or 1})))
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="perdf_bench_") as d:
+        os.environ["PERDF_EXTRACT_CACHE_DIR"] = os.path.join(d, "cache")
+        os.environ["PERDF_EXTRACT_PARALLEL_MIN"] = "1"
+        import extract
+        path = os.path.join(d, "doc.pdf")
+        doc = make_pdf(path, args.pages)
+        print(f"cpus={os.cpu_count()} pages={args.pages} ocr={extract.get_ocr_backend()[0]}")
+        base = None
+        for w in (int(x) for x in args.workers.split(",")):
+            t0 = time.perf_counter()
+            extract.extract_pages(path, workers=w, use_cache=False)
+            dt = time.perf_counter() - t0
+            base = base or dt
+            print(f"workers={w:<3} {dt:7.2f}s  {args.pages/dt:7.1f} pages/s  speed-up x{base/dt:.2f}")
+
+        doc[args.pages // 2].insert_text((50, 820), "Düzeltme notu.", fontsize=8)
+        edited = os.path.join(d, "edited.pdf")
+        doc.save(edited)
+        for label, p in (("cache cold", path), ("cache warm", path), ("1 page edited", edited)):
+            stats = {}
+            t0 = time.perf_counter()
+            extract.extract_pages(p, stats=stats)
+            print(f"{label:<14} {time.perf_counter() - t0:7.2f}s  extracted={stats['extracted']} cached={stats['cached']}")
+
+
+if __name__ == "__main__":
+    main()
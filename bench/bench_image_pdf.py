@@ -0,0 +1,90 @@
+"""
+Image -> PDF: pass-through embedding vs. the decode/re-encode ReportLab path.
+
+    python bench/bench_image_pdf.py --images 20 --width 4032 --height 3024
+    python bench/bench_image_pdf.py --images 200 --margin-mm 0   # PIL-style simple path
+    python bench/bench_image_pdf.py --images 20 --optimize-dpi 150
+
+Generates phone-sized JPEGs (gradient + noise, so they compress like photos) and
+converts them in a fresh subprocess per engine, reporting wall time, peak RSS
+(ru_maxrss) and output size.
+"""
+import argparse, os, sys, time, tempfile, resource, subprocess, json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_images(dirpath, count, width, height, fmt):
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 255 // width, yy * 255 // height, (xx + yy) * 255 // (width + height)], -1)
+    paths = []
+    for i in range(count):
+        noise = rng.integers(-12, 12, size=base.shape)
+        img = Image.fromarray(np.clip(base + noise + i, 0, 255).astype("uint8"))
+        path = os.path.join(dirpath, f"img_{i:04d}.{fmt}")
+        if fmt == "jpg":
+            img.save(path, quality=90)
+        else:
+            img.save(path)
+        paths.append(path)
+    return paths
+
+
+def run_engine(engine, paths, out_path, margin_mm, optimize_dpi):
+    from image_pdf import images_to_pdf
+    from optimize import new_stats
+    opts = {"page_size": "auto", "orientation": "auto", "fit_mode": "contain", "margin_mm": margin_mm,
+            "target_dpi": optimize_dpi}
+    stats = new_stats()
+    t0 = time.perf_counter()
+    pages = images_to_pdf(paths, out_path, opts, engine=engine, stats=stats)
+    dt = time.perf_counter() - t0
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print(json.dumps({"engine": engine, "pages": pages, "seconds": round(dt, 2),
+                      "images_per_s": round(pages / dt, 1) if dt else None,
+                      "peak_rss_mb": round(rss_mb, 1),
+                      "output_mb": round(os.path.getsize(out_path) / 2**20, 1),
+                      "saved_mb": round(stats["bytes_saved"] / 2**20, 1)}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=20)
+    ap.add_argument("--width", type=int, default=4032)
+    ap.add_argument("--height", type=int, default=3024)
+    ap.add_argument("--fmt", default="jpg", choices=["jpg", "png"])
+    ap.add_argument("--margin-mm", type=float, default=10.0)
+    ap.add_argument("--optimize-dpi", type=float, default=0)
+    ap.add_argument("--engines", default="passthrough,reportlab")
+    ap.add_argument("--make", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.make:
+        make_images(args.dir, args.images, args.width, args.height, args.fmt)
+        return
+    if args.child:
+        paths = sorted(os.path.join(args.dir, p) for p in os.listdir(args.dir) if p.startswith("img_"))
+        run_engine(args.child, paths, os.path.join(args.dir, f"out_{args.child}.pdf"), args.margin_mm,
+                   args.optimize_dpi)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="perdf_bench_") as d:
+        # generate in a subprocess too: ru_maxrss is inherited across fork/exec on Linux
+        subprocess.run([sys.executable, __file__, "--make", "--dir", d, "--images", str(args.images),
+                        "--width", str(args.width), "--height", str(args.height), "--fmt", args.fmt], check=True)
+        paths = sorted(os.path.join(d, p) for p in os.listdir(d) if p.startswith("img_"))
+        total = sum(os.path.getsize(p) for p in paths) / 2**20
+        print(f"inputs: {len(paths)} x {args.width}x{args.height} {args.fmt}, {total:.1f} MB")
+        for engine in args.engines.split(","):
+            subprocess.run([sys.executable, __file__, "--child", engine, "--dir", d,
+                            "--margin-mm", str(args.margin_mm), "--optimize-dpi", str(args.optimize_dpi)], check=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Peak-RSS benchmark for the merge engines.
+
+    python bench/bench_merge.py --total-mb 1024 --file-mb 8
+
+Generates incompressible image PDFs totalling --total-mb, then merges them in a
+fresh subprocess per mode and reports wall time and peak RSS (ru_maxrss).
+"""
+import argparse, os, sys, time, tempfile, resource, subprocess, json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_inputs(dirpath, total_mb, file_mb):
+    import fitz
+    n_files = max(1, int(total_mb // file_mb))
+    side = 592  # 592*592*3 bytes ~ 1 MB of noise per page
+    paths = []
+    for i in range(n_files):
+        doc = fitz.open()
+        for _ in range(max(1, int(file_mb))):
+            page = doc.new_page()
+            pix = fitz.Pixmap(fitz.csRGB, side, side, os.urandom(side * side * 3), 0)
+            page.insert_image(page.rect, pixmap=pix)
+        path = os.path.join(dirpath, f"in_{i:04d}.pdf")
+        doc.save(path, deflate=False)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def run_mode(mode, paths, out_path):
+    from pdf_engine import merge_pdfs
+    t0 = time.perf_counter()
+    pages = merge_pdfs(paths, out_path, mode=mode)
+    dt = time.perf_counter() - t0
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print(json.dumps({"mode": mode, "pages": pages, "seconds": round(dt, 2),
+                      "peak_rss_mb": round(rss_mb, 1),
+                      "output_mb": round(os.path.getsize(out_path) / 2**20, 1)}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--total-mb", type=float, default=1024)
+    ap.add_argument("--file-mb", type=float, default=8)
+    ap.add_argument("--modes", default="stream,memory")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        paths = sorted(os.path.join(args.dir, p) for p in os.listdir(args.dir) if p.startswith("in_"))
+        run_mode(args.child, paths, os.path.join(args.dir, f"out_{args.child}.pdf"))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="perdf_bench_") as d:
+        paths = make_inputs(d, args.total_mb, args.file_mb)
+        total = sum(os.path.getsize(p) for p in paths) / 2**20
+        print(f"inputs: {len(paths)} files, {total:.1f} MB")
+        for mode in args.modes.split(","):
+            subprocess.run([sys.executable, __file__, "--child", mode, "--dir", d], check=False)
+
+
+if __name__ == "__main__":
+    main()
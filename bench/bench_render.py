@@ -0,0 +1,53 @@
+"""
+Scaling benchmark for PDF -> image rendering.
+
+    python bench/bench_render.py --pages 200 --dpi 200 --workers 1,2,4,8
+
+Builds a synthetic text + vector PDF and renders every page with each worker
+count, reporting pages/s and speed-up over a single worker.
+"""
+import argparse, os, sys, time, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_pdf(path, pages):
+    import fitz
+    doc = fitz.open()
+    text = "PerDF benchmark sayfası. " * 40
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 500), f"{i+1}. " + text, fontsize=10)
+        for j in range(30):
+            page.draw_circle((100 + j * 13, 650), 20 + j, color=(j / 30, 0.2, 0.6), width=1.5)
+    doc.save(path)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--dpi", type=int, default=200)
+    ap.add_argument("--fmt", default="png")
+    ap.add_argument("--workers", default=",".join(str(w) for w in sorted({1, 2, 4, os.cpu_count() or 1})))
+    args = ap.parse_args()
+
+    from render import render_pages
+    with tempfile.TemporaryDirectory(prefix="perdf_bench_") as d:
+        path = os.path.join(d, "doc.pdf")
+        make_pdf(path, args.pages)
+        pages = list(range(1, args.pages + 1))
+        print(f"cpus={os.cpu_count()} pages={args.pages} dpi={args.dpi} fmt={args.fmt}")
+        base = None
+        for w in (int(x) for x in args.workers.split(",")):
+            t0 = time.perf_counter()
+            out_bytes = 0
+            for p, data in render_pages(path, pages, args.dpi, args.fmt, workers=w):
+                out_bytes += len(data)
+            dt = time.perf_counter() - t0
+            base = base or dt
+            print(f"workers={w:<3} {dt:7.2f}s  {args.pages/dt:7.1f} pages/s  speed-up x{base/dt:.2f}  ({out_bytes/2**20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
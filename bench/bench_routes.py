@@ -0,0 +1,170 @@
+"""
+End-to-end benchmark of every route through the Flask test client.
+
+    python bench/bench_routes.py --requests 20 --pages 50 --images 10 --image-width 2000
+    python bench/bench_routes.py --routes chat --requests 50
+
+Synthetic inputs (text + image PDFs, photo-like JPEGs) are generated locally, then
+each route runs in a fresh subprocess with its own store/index directories:
+one warm-up request, then --requests timed requests whose response bodies are read
+completely. Reports p50/p99 latency, requests/s, input MB/s, peak RSS of the route's
+process, and the stages that took the most time (from metrics.py).
+"""
+import argparse, io, os, sys, time, json, tempfile, resource, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROUTES = ("merge", "split", "pdf_to_image", "image_to_pdf", "chat")
+QUESTIONS = ["Bölüm 3 neyi anlatıyor?", "Fatura tutarı nedir?", "Teslim tarihi ne zaman?",
+             "Sözleşmenin tarafları kimler?", "Ödeme koşulları nelerdir?"]
+
+
+def make_inputs(d, pages, images, width, height):
+    import fitz
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 255 // width, yy * 255 // height, (xx + yy) * 255 // (width + height)], -1)
+    for i in range(images):
+        noise = rng.integers(-12, 12, size=base.shape)
+        Image.fromarray(np.clip(base + noise + i, 0, 255).astype("uint8")).save(
+            os.path.join(d, f"img_{i:03d}.jpg"), quality=90)
+
+    photo = os.path.join(d, "img_000.jpg")
+    for name, seed in (("a.pdf", 0), ("b.pdf", 1)):
+        doc = fitz.open()
+        for p in range(pages):
+            page = doc.new_page()
+            text = (f"Bölüm {p + 1}. Belge {name}, sayfa {p + 1}. Fatura tutarı {1000 + p * 7 + seed} TL. "
+                    "Teslim tarihi sözleşmede belirtilmiştir. Ödeme koşulları ekte yer alır. ") * 6
+            page.insert_textbox(fitz.Rect(50, 50, 545, 420), text, fontsize=10)
+            if p % 5 == 0 and images:
+                page.insert_image(fitz.Rect(100, 450, 495, 750), filename=photo)
+        doc.save(os.path.join(d, name), garbage=3, deflate=True)
+
+
+def run_route(route, d, requests):
+    for sub in ("store", "index", "corpus", "extract", "jobs"):
+        os.makedirs(os.path.join(d, route, sub), exist_ok=True)
+    os.environ.update(PERDF_STORE_DIR=os.path.join(d, route, "store"),
+                      PERDF_INDEX_DIR=os.path.join(d, route, "index"),
+                      PERDF_CORPUS_DIR=os.path.join(d, route, "corpus"),
+                      PERDF_EXTRACT_CACHE_DIR=os.path.join(d, route, "extract"),
+                      PERDF_JOB_DIR=os.path.join(d, route, "jobs"),
+                      PERDF_JOB_THRESHOLD_MB="-1", PERDF_EMBED_WARMUP="0", PERDF_SLOW_REQUEST_SECONDS="0")
+    import metrics
+    from app import app
+    client = app.test_client()
+    images = sorted(n for n in os.listdir(d) if n.startswith("img_"))
+
+    blobs = {}
+
+    def upload(name):
+        if name not in blobs:
+            with open(os.path.join(d, name), "rb") as fh:
+                blobs[name] = fh.read()
+        return io.BytesIO(blobs[name]), name
+
+    def size(names):
+        return sum(os.path.getsize(os.path.join(d, n)) for n in names)
+
+    doc_hash = None
+    if route == "chat":
+        t0 = time.perf_counter()
+        resp = client.post("/upload_pdf_chat", data={"pdf_file": upload("a.pdf")})
+        upload_s = time.perf_counter() - t0
+        body = resp.get_data(as_text=True)
+        doc_hash = body.split('name="filename" value="', 1)[1].split('"', 1)[0]
+
+    def one(i):
+        if route == "merge":
+            pdfs = [upload("a.pdf"), upload("b.pdf")]
+            return client.post("/merge", data={"pdfs": pdfs}), size(["a.pdf", "b.pdf"])
+        if route == "split":
+            return client.post("/split", data={"pdf": upload("a.pdf"), "mode": "zip"}), size(["a.pdf"])
+        if route == "pdf_to_image":
+            data = {"pdf": upload("a.pdf"), "ranges": "1-10", "dpi": "100"}
+            return client.post("/pdf_to_image", data=data), size(["a.pdf"])
+        if route == "image_to_pdf":
+            data = {"images": [upload(n) for n in images], "margin_mm": "10"}
+            return client.post("/image_to_pdf", data=data), size(images)
+        q = QUESTIONS[i % len(QUESTIONS)] + f" ({i})"
+        return client.post("/ask_pdf_question", data={"filename": doc_hash, "question": q}), len(q)
+
+    latencies, in_total, out_total = [], 0, 0
+    for i in range(requests + 1):
+        t0 = time.perf_counter()
+        resp, in_bytes = one(i)
+        body = resp.get_data()
+        resp.close()
+        dt = time.perf_counter() - t0
+        if resp.status_code != 200:
+            raise SystemExit(f"{route}: HTTP {resp.status_code}")
+        if i:  # the first request warms caches and imports
+            latencies.append(dt)
+            in_total += in_bytes
+            out_total += len(body)
+
+    latencies.sort()
+    total = sum(latencies)
+    stages = sorted(metrics.snapshot().items(), key=lambda kv: -kv[1][0])
+    result = {
+        "route": route, "requests": requests,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "req_s": requests / total, "in_mb_s": in_total / 2**20 / total, "out_mb": out_total / 2**20 / requests,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "stages": [(name, seconds / (requests + 1)) for name, (seconds, _, _) in stages[:3]],
+    }
+    if route == "chat":
+        result["upload_ms"] = upload_s * 1000
+    print(json.dumps(result))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--routes", default=",".join(ROUTES))
+    ap.add_argument("--requests", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=50)
+    ap.add_argument("--images", type=int, default=10)
+    ap.add_argument("--image-width", type=int, default=2000)
+    ap.add_argument("--image-height", type=int, default=1500)
+    ap.add_argument("--make", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.make:
+        make_inputs(args.dir, args.pages, args.images, args.image_width, args.image_height)
+        return
+    if args.child:
+        run_route(args.child, args.dir, args.requests)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="perdf_bench_") as d:
+        # generate and run in subprocesses: ru_maxrss is inherited across fork/exec on Linux
+        subprocess.run([sys.executable, __file__, "--make", "--dir", d, "--pages", str(args.pages),
+                        "--images", str(args.images), "--image-width", str(args.image_width),
+                        "--image-height", str(args.image_height)], check=True)
+        print(f"cpus={os.cpu_count()} pages={args.pages} images={args.images}x{args.image_width}x"
+              f"{args.image_height} requests={args.requests}")
+        print(f"{'route':<14}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>8}{'in MB/s':>9}{'out MB':>8}{'RSS MB':>8}"
+              "  top stages (s/req)")
+        for route in args.routes.split(","):
+            out = subprocess.run([sys.executable, __file__, "--child", route, "--dir", d,
+                                  "--requests", str(args.requests)], capture_output=True, text=True)
+            lines = [ln for ln in out.stdout.splitlines() if ln.startswith("{")]
+            if out.returncode or not lines:
+                print(f"{route:<14} failed: {(out.stderr or out.stdout).strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(lines[-1])
+            stages = ", ".join(f"{n} {s:.3f}" for n, s in r["stages"])
+            extra = f"  (upload {r['upload_ms']:.0f} ms)" if "upload_ms" in r else ""
+            print(f"{route:<14}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['req_s']:>8.1f}{r['in_mb_s']:>9.1f}"
+                  f"{r['out_mb']:>8.1f}{r['peak_rss_mb']:>8.0f}  {stages}{extra}")
+
+
+if __name__ == "__main__":
+    main()
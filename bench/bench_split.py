@@ -0,0 +1,51 @@
+"""
+Split benchmark: one PDF per page for a large document with shared resources.
+
+    python bench/bench_split.py --pages 1000
+
+Every page uses the same embedded font and references one shared image XObject,
+which is the case where per-page re-serialization hurts most.
+"""
+import argparse, os, sys, time, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_pdf(path, pages):
+    import fitz
+    doc = fitz.open()
+    side = 400
+    pix = fitz.Pixmap(fitz.csRGB, side, side, os.urandom(side * side * 3), 0)
+    xref = 0
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 400), f"Sayfa {i+1}. " + "Lorem ipsum dolor sit amet. " * 30,
+                            fontsize=10, fontname="tiro")
+        xref = page.insert_image(fitz.Rect(100, 450, 300, 650), pixmap=pix if not xref else None, xref=xref)
+    doc.save(path, garbage=3, deflate=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=1000)
+    ap.add_argument("--engines", default="graft,fitz,pypdf2")
+    args = ap.parse_args()
+
+    from pdf_engine import split_pages
+    with tempfile.TemporaryDirectory(prefix="perdf_bench_") as d:
+        path = os.path.join(d, "doc.pdf")
+        make_pdf(path, args.pages)
+        print(f"input: {args.pages} pages, {os.path.getsize(path)/2**20:.1f} MB")
+        pages = list(range(1, args.pages + 1))
+        for engine in args.engines.split(","):
+            t0 = time.perf_counter()
+            total = 0
+            for _, data in split_pages(path, pages, engine=engine):
+                total += len(data)
+            dt = time.perf_counter() - t0
+            print(f"{engine:<7} {dt:7.2f}s  {args.pages/dt:8.1f} pages/s  output {total/2**20:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
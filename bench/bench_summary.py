@@ -0,0 +1,90 @@
+"""
+LLM summary layer against a local OpenAI-compatible stub server (no API key or network).
+
+    python bench/bench_summary.py --latency 1.5 --wait 0.3 --concurrency 20
+
+The stub answers POST /v1/chat/completions after --latency seconds and counts calls.
+Reports: time to first (extractive) answer, time until the LLM summary can be polled,
+cache-hit latency, and how many upstream calls N concurrent identical questions cost.
+"""
+import argparse, json, os, sys, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    calls = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with StubHandler.lock:
+            StubHandler.calls += 1
+        time.sleep(StubHandler.latency)
+        question = body["messages"][0]["content"].split("Soru: ", 1)[-1].split("\n", 1)[0]
+        out = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"Özet: {question}"}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=1.5)
+    ap.add_argument("--wait", type=float, default=0.3)
+    ap.add_argument("--concurrency", type=int, default=20)
+    args = ap.parse_args()
+
+    StubHandler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    import summarizer
+    snippets = ["Birinci pasaj.", "İkinci pasaj."]
+
+    t0 = time.perf_counter()
+    summary, key = summarizer.summarize("doc", "soru 1", snippets, wait=args.wait)
+    first = time.perf_counter() - t0
+    while key and summarizer.poll(key, wait=5)["status"] != "done":
+        pass
+    ready = time.perf_counter() - t0
+    print(f"cold: answer after {first*1000:.0f} ms (pending={bool(key)}), LLM summary after {ready*1000:.0f} ms")
+
+    t0 = time.perf_counter()
+    summary, key = summarizer.summarize("doc", "soru 1", snippets, wait=args.wait)
+    print(f"cached: {(time.perf_counter()-t0)*1e6:.0f} µs -> {summary!r}")
+
+    before = StubHandler.calls
+    with ThreadPoolExecutor(args.concurrency) as ex:
+        list(ex.map(lambda _: summarizer.summarize("doc", "soru 2", snippets, wait=args.latency * 2),
+                    range(args.concurrency)))
+    print(f"{args.concurrency} concurrent identical questions -> {StubHandler.calls - before} upstream call(s)")
+
+    before = StubHandler.calls
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as ex:
+        list(ex.map(lambda i: summarizer.summarize("doc", f"farklı {i}", snippets, wait=60), range(args.concurrency)))
+    dt = time.perf_counter() - t0
+    print(f"{args.concurrency} distinct questions: {dt:.2f} s with {summarizer.LLM_WORKERS} LLM workers "
+          f"({StubHandler.calls - before} calls)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
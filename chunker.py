@@ -0,0 +1,194 @@
+"""
+Passage chunking for PDF Q&A.
+
+The document text is built once from per-page PyMuPDF text blocks (extract.py
+produces them in parallel, with OCR for scanned pages) into a single string:
+lines of a block are joined (de-hyphenated), blocks are separated as
+paragraphs, and a page whose last sentence runs on is joined to the next page
+with a space so the sentence stays whole. Chunks are (start, end) character
+offsets into that string plus the first/last page they touch; chunk text is
+only sliced out when it is needed.
+
+    sentence  (default) packs whole sentences up to PERDF_CHUNK_CHARS, prefers
+              paragraph breaks, and repeats at most PERDF_CHUNK_OVERLAP
+              characters of trailing *whole* sentences in the next chunk.
+    fixed     the old per-page 900/150 character windows, kept for comparison.
+"""
+import os
+import re
+from bisect import bisect_right
+from collections.abc import Sequence
+
+import fitz  # PyMuPDF
+
+CHUNKER = os.getenv("PERDF_CHUNKER", "sentence")
+CHUNK_CHARS = int(os.getenv("PERDF_CHUNK_CHARS", "900"))
+CHUNK_OVERLAP = int(os.getenv("PERDF_CHUNK_OVERLAP", "0"))
+PARAGRAPH_FILL = 0.6  # a paragraph break ends the chunk once it is this full
+
+_SENT_END_RE = re.compile(r"[.!?…][\"'”’)\]»]*\s+|\n{2,}")
+_TERMINAL_RE = re.compile(r"[.!?…:][\"'”’)\]»]*$")
+_SPACE_RE = re.compile(r"[ \t\r\f\v]+")
+
+
+class Chunks(Sequence):
+    """Read-only list of chunk strings backed by one text and (start, end) spans."""
+
+    def __init__(self, text: str, spans):
+        self.text = text
+        self.spans = spans
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.text[a:b] for a, b in self.spans[i]]
+        a, b = self.spans[i]
+        return self.text[a:b]
+
+
+def settings_key(mode: str = None, size: int = None, overlap: int = None) -> str:
+    """Identifies the chunking an index was built with; a change forces a rebuild."""
+    mode = mode or CHUNKER
+    if mode == "fixed":
+        return "fixed:900:150"
+    return f"{mode}:{size or CHUNK_CHARS}:{CHUNK_OVERLAP if overlap is None else overlap}"
+
+
+def _join_lines(lines):
+    out = ""
+    for line in lines:
+        line = _SPACE_RE.sub(" ", line).strip()
+        if not line:
+            continue
+        if not out:
+            out = line
+        elif out.endswith("-") and line[:1].islower():
+            out = out[:-1] + line  # hyphenated line break
+        else:
+            out += " " + line
+    return out
+
+
+def page_blocks(page, textpage=None):
+    """Text blocks of one page in reading order, each as a single de-hyphenated line."""
+    blocks = (_join_lines(b[4].split("\n")) for b in page.get_text("blocks", textpage=textpage) if b[6] == 0)
+    return [b for b in blocks if b]
+
+
+def join_pages(pages):
+    """(text, page_starts) for per-page block lists: the whole document as one string."""
+    parts, page_starts, pos = [], [], 0
+    for blocks in pages:
+        page_text = "\n\n".join(blocks)
+        if page_text and parts:
+            prev = parts[-1]
+            if _TERMINAL_RE.search(prev):
+                sep = "\n\n"
+            elif prev.endswith("-") and page_text[:1].islower():
+                parts[-1] = prev = prev[:-1]
+                pos -= 1
+                sep = ""
+            else:
+                sep = " "  # the sentence continues on the next page
+            parts.append(sep)
+            pos += len(sep)
+        page_starts.append(pos)
+        if page_text:
+            parts.append(page_text)
+            pos += len(page_text)
+    return "".join(parts), page_starts
+
+
+def _sentences(text: str, size: int):
+    """(start, end, starts_paragraph) per sentence; sentences longer than `size` are cut at spaces."""
+    out = []
+    pos, para = 0, True
+    for m in [*_SENT_END_RE.finditer(text), None]:
+        end = m.start() + len(m.group().rstrip()) if m else len(text)
+        start = pos
+        while start < end and text[start].isspace():
+            start += 1
+        while end - start > size:
+            cut = text.rfind(" ", start + 1, start + size + 1)
+            if cut <= start:
+                cut = start + size
+            out.append((start, cut, para))
+            para = False
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+        if end > start:
+            out.append((start, end, para))
+        if m is None:
+            break
+        pos = m.end()
+        para = "\n\n" in m.group()
+    return out
+
+
+def _pack(sents, size: int, overlap: int):
+    spans, i, n = [], 0, len(sents)
+    while i < n:
+        start, end = sents[i][0], sents[i][1]
+        j = i
+        while j + 1 < n and sents[j + 1][1] - start <= size:
+            if sents[j + 1][2] and end - start >= size * PARAGRAPH_FILL:
+                break
+            j += 1
+            end = sents[j][1]
+        spans.append((start, end))
+        if j + 1 >= n:
+            break
+        nxt = j + 1
+        while nxt - 1 > i and end - sents[nxt - 1][0] <= overlap:
+            nxt -= 1
+        i = nxt
+    return spans
+
+
+def _fixed_spans(pages, size=900, overlap=150):
+    """The previous chunker: character windows within each page, never across pages."""
+    parts, spans, page_starts, pos = [], [], [], 0
+    for blocks in pages:
+        txt = "\n".join(blocks)
+        page_starts.append(pos)
+        if txt.strip():
+            spans.extend((pos + i, pos + min(i + size, len(txt))) for i in range(0, len(txt), size - overlap))
+        parts.append(txt)
+        pos += len(txt)
+    return "".join(parts), page_starts, spans
+
+
+def chunk_pages(pages, mode: str = None, size: int = None, overlap: int = None) -> dict:
+    """
+    Chunk per-page block lists (see `page_blocks`). Returns
+    {'text': str, 'spans': [[start, end]], 'pages': [first page], 'page_ends': [last page]}
+    with 1-based pages.
+    """
+    mode = mode or CHUNKER
+    size = size or CHUNK_CHARS
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    if mode == "fixed":
+        text, page_starts, spans = _fixed_spans(pages)
+    else:
+        text, page_starts = join_pages(pages)
+        spans = _pack(_sentences(text, size), size, min(overlap, size // 2))
+    return {
+        "text": text,
+        "spans": [[a, b] for a, b in spans],
+        "pages": [bisect_right(page_starts, a) for a, _ in spans],
+        "page_ends": [bisect_right(page_starts, b - 1) for _, b in spans],
+    }
+
+
+def chunk_document(doc_or_path, mode: str = None, size: int = None, overlap: int = None) -> dict:
+    """chunk_pages() for a PDF path or open fitz document, extracted serially without OCR."""
+    doc = fitz.open(doc_or_path) if isinstance(doc_or_path, str) else doc_or_path
+    try:
+        pages = [page_blocks(page) for page in doc]
+    finally:
+        if doc is not doc_or_path:
+            doc.close()
+    return chunk_pages(pages, mode, size, overlap)
@@ -0,0 +1,411 @@
+"""
+Corpus-wide vector index over the passage embeddings of every chat upload.
+
+Pure NumPy IVF (inverted file): the vectors are clustered with spherical
+k-means into ~sqrt(n) lists; a query scores the centroids, scans only the
+PERDF_CORPUS_NPROBE closest lists and takes its top-k with argpartition.
+Below PERDF_CORPUS_TRAIN_MIN vectors there are no lists and every vector is
+scanned (blockwise, still argpartition).
+
+On disk, under PERDF_CORPUS_DIR (data files live in a directory per rebuild
+"epoch", so a rebuild never touches files a reader has mapped):
+    meta.json      epoch, n, dim, nlist, signature, deleted document ids, ...
+    vectors.f32    float32 [n, dim], append-only, memory-mapped for search
+    rows.i32       int32 [n, 2]: (document id, chunk index) per vector
+    assign.i32     int32 [n]: IVF list of each vector (only once trained)
+    centroids.npy  float32 [nlist, dim]
+    docs.txt       document hash per line; line number = document id
+
+Inserts append to the files and then publish the new row count in meta.json,
+so a reader never sees a half-written row; other processes notice the change
+through the generation stamp in meta.json. New vectors join the list of their
+nearest centroid. Removing a document only marks it deleted. When the corpus has
+grown 4x since the lists were trained, or a quarter of the rows belong to
+deleted documents, `rebuild` (run in a background thread) compacts the files
+and retrains the lists.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl  # serialises writers across worker processes
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.getenv("PERDF_CORPUS_DIR", os.path.join(BASE_DIR, "instance", "corpus"))
+CORPUS_NPROBE = int(os.getenv("PERDF_CORPUS_NPROBE", "16"))
+CORPUS_TRAIN_MIN = int(os.getenv("PERDF_CORPUS_TRAIN_MIN", "20000"))
+CORPUS_VERSION = 1
+GROWTH_RETRAIN = 4  # retrain once the corpus is this many times larger than at the last training
+DEAD_COMPACT = 0.25  # compact once this share of rows belongs to deleted documents
+KMEANS_ITERS = 12
+KMEANS_SAMPLE = 64  # training vectors per list
+BLOCK_ROWS = 1 << 16
+
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return x / norms
+
+
+def _assign(x, centroids):
+    """Nearest centroid (max inner product) per row, blockwise."""
+    out = np.empty(len(x), dtype=np.int32)
+    for s in range(0, len(x), BLOCK_ROWS):
+        out[s:s + BLOCK_ROWS] = np.argmax(np.asarray(x[s:s + BLOCK_ROWS]) @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(x, nlist: int, iters: int = KMEANS_ITERS, seed: int = 0):
+    """Spherical k-means; empty lists are re-seeded from random training vectors."""
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(iters):
+        a = _assign(x, centroids)
+        order = np.argsort(a, kind="stable")
+        counts = np.bincount(a, minlength=nlist)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        centroids[filled] = np.add.reduceat(x[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+def _top_k(scores, ids, k):
+    if len(ids) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[part], ids[part]
+    order = np.argsort(-scores)
+    return scores[order], ids[order]
+
+
+class CorpusIndex:
+    def __init__(self, root: str = CORPUS_DIR, nprobe: int = CORPUS_NPROBE, train_min: int = CORPUS_TRAIN_MIN):
+        self.root = root
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self._lock = threading.Lock()  # guards the mapped view; held only briefly
+        self._write_lock = threading.Lock()
+        self._rebuilding = False
+        self._stamp = None
+        self._state = None
+
+    # --- files -------------------------------------------------------------------------
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _data(self, meta, name):
+        return os.path.join(self.root, meta["epoch"], name)
+
+    @contextmanager
+    def _writer(self):
+        """In-process lock plus an exclusive flock so worker processes don't interleave writes."""
+        with self._write_lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self._path("lock"), "a") as fh:
+                if fcntl:
+                    fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        try:
+            with open(self._path("meta.json"), encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == CORPUS_VERSION else None
+
+    def _write_meta(self, meta):
+        meta["gen"] = uuid.uuid4().hex  # readers re-map when this changes
+        tmp = self._path(f"meta.json.tmp-{uuid.uuid4().hex[:8]}")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self._path("meta.json"))
+
+    def _reset(self, old, dim: int, signature: str):
+        meta = {"version": CORPUS_VERSION, "epoch": uuid.uuid4().hex[:12], "dim": dim, "signature": signature,
+                "n": 0, "n_docs": 0, "nlist": 0, "trained_n": 0, "deleted": [], "dead_rows": 0}
+        os.makedirs(self._path(meta["epoch"]), exist_ok=True)
+        self._write_meta(meta)
+        if old:
+            shutil.rmtree(self._path(old["epoch"]), ignore_errors=True)
+        return meta
+
+    @staticmethod
+    def _append(path, data: bytes, offset: int):
+        # anything past `offset` is a write that never got published; overwrite it
+        with open(path, "r+b" if os.path.exists(path) else "wb") as fh:
+            fh.seek(offset)
+            fh.write(data)
+            fh.truncate()
+
+    # --- loading -------------------------------------------------------------------------
+    def _load(self):
+        """Current read-only view; re-mapped only when meta.json's generation changed."""
+        for _ in range(2):
+            meta = self._read_meta()
+            if meta is None:
+                return None
+            with self._lock:
+                if meta["gen"] == self._stamp:
+                    return self._state
+                try:
+                    state = self._map(meta)
+                except (OSError, ValueError):
+                    continue  # a rebuild swapped epochs between reading meta and mapping; retry
+                self._stamp, self._state = meta["gen"], state
+                return state
+        return self._state
+
+    def _map(self, meta):
+        if not meta["n"]:
+            return {"meta": meta}
+        n, dim = meta["n"], meta["dim"]
+        state = {
+            "meta": meta,
+            "vectors": np.memmap(self._data(meta, "vectors.f32"), dtype=np.float32, mode="r", shape=(n, dim)),
+            "rows": np.memmap(self._data(meta, "rows.i32"), dtype=np.int32, mode="r", shape=(n, 2)),
+            "docs": self._read_docs(meta, strict=True),
+            "dead": None,
+            "centroids": None,
+        }
+        if meta["deleted"]:
+            state["dead"] = np.isin(state["rows"][:, 0], np.asarray(meta["deleted"], dtype=np.int32))
+        if meta["nlist"]:
+            assign = np.fromfile(self._data(meta, "assign.i32"), dtype=np.int32, count=n)
+            state["centroids"] = np.load(self._data(meta, "centroids.npy"))
+            state["order"] = np.argsort(assign, kind="stable").astype(np.int32)
+            state["offsets"] = np.concatenate(
+                ([0], np.cumsum(np.bincount(assign, minlength=meta["nlist"])))).astype(np.int64)
+        return state
+
+    def _read_docs(self, meta, strict: bool = False):
+        try:
+            with open(self._data(meta, "docs.txt"), encoding="ascii") as fh:
+                return [line.rstrip("\n") for _, line in zip(range(meta["n_docs"]), fh)]
+        except OSError:
+            if strict:
+                raise
+            return []
+
+    # --- writes ---------------------------------------------------------------------------
+    def add(self, doc_hash: str, vectors, signature: str) -> int:
+        """
+        Append a document's (normalized) chunk vectors; row i is chunk i of the document.
+        `signature` names the embedding model/chunking; a different one starts a new corpus.
+        Returns the number of rows added (0 if the document is already indexed).
+        """
+        if len(doc_hash) != 64:
+            raise ValueError("doc_hash must be a SHA-256 hex digest")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            return 0
+        with self._writer():
+            meta = self._read_meta()
+            if meta is None or meta["signature"] != signature or meta["dim"] != vectors.shape[1]:
+                meta = self._reset(meta, vectors.shape[1], signature)
+            docs = self._read_docs(meta)
+            deleted = set(meta["deleted"])
+            if any(h == doc_hash and i not in deleted for i, h in enumerate(docs)):
+                return 0
+
+            n, doc_id = meta["n"], meta["n_docs"]
+            self._append(self._data(meta, "docs.txt"), (doc_hash + "\n").encode("ascii"), doc_id * 65)  # fixed-width lines
+            rows = np.column_stack((np.full(len(vectors), doc_id, dtype=np.int32),
+                                    np.arange(len(vectors), dtype=np.int32)))
+            self._append(self._data(meta, "rows.i32"), rows.tobytes(), n * 8)
+            self._append(self._data(meta, "vectors.f32"), vectors.tobytes(), n * 4 * meta["dim"])
+            if meta["nlist"]:
+                centroids = np.load(self._data(meta, "centroids.npy"))
+                self._append(self._data(meta, "assign.i32"), _assign(vectors, centroids).tobytes(), n * 4)
+            meta["n"], meta["n_docs"] = n + len(vectors), doc_id + 1
+            self._write_meta(meta)
+        self._maybe_rebuild(meta)
+        return len(vectors)
+
+    def remove(self, doc_hash: str) -> bool:
+        """Mark a document deleted; its rows are skipped by search and dropped at the next rebuild."""
+        with self._writer():
+            meta = self._read_meta()
+            if meta is None:
+                return False
+            docs = self._read_docs(meta)
+            ids = [i for i, h in enumerate(docs) if h == doc_hash and i not in meta["deleted"]]
+            if not ids:
+                return False
+            if meta["n"]:
+                rows = np.memmap(self._data(meta, "rows.i32"), dtype=np.int32, mode="r", shape=(meta["n"], 2))
+                meta["dead_rows"] += int(np.isin(rows[:, 0], ids).sum())
+                del rows
+            meta["deleted"] = sorted(meta["deleted"] + ids)
+            self._write_meta(meta)
+        self._maybe_rebuild(meta)
+        return True
+
+    def _needs_rebuild(self, meta) -> bool:
+        alive = meta["n"] - meta["dead_rows"]
+        if meta["dead_rows"] > DEAD_COMPACT * max(meta["n"], 1) and meta["n"] >= 1000:
+            return True
+        if meta["nlist"]:
+            return alive >= GROWTH_RETRAIN * meta["trained_n"]
+        return alive >= self.train_min
+
+    def _maybe_rebuild(self, meta):
+        if not self._needs_rebuild(meta):
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception as e:
+                print("corpus rebuild error:", e)
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def rebuild(self, force: bool = False) -> dict:
+        """Drop deleted documents' rows and (re)train the IVF lists. Holds the writer lock."""
+        with self._writer():
+            meta = self._read_meta()
+            if meta is None or not (force or self._needs_rebuild(meta)):
+                return meta
+            t0 = time.perf_counter()
+            n, dim = meta["n"], meta["dim"]
+            deleted = np.asarray(meta["deleted"], dtype=np.int32)
+            docs = self._read_docs(meta)
+            keep_doc = np.ones(len(docs), dtype=bool)
+            keep_doc[deleted] = False
+            remap = np.cumsum(keep_doc, dtype=np.int32) - 1
+
+            new = dict(meta, epoch=uuid.uuid4().hex[:12])
+            os.makedirs(self._path(new["epoch"]), exist_ok=True)
+            alive = 0
+            with open(self._data(new, "vectors.f32"), "wb") as vf, open(self._data(new, "rows.i32"), "wb") as rf:
+                if n:
+                    vectors = np.memmap(self._data(meta, "vectors.f32"), dtype=np.float32, mode="r", shape=(n, dim))
+                    rows = np.memmap(self._data(meta, "rows.i32"), dtype=np.int32, mode="r", shape=(n, 2))
+                    for s in range(0, n, BLOCK_ROWS):
+                        r = np.array(rows[s:s + BLOCK_ROWS])
+                        mask = keep_doc[r[:, 0]]
+                        r = r[mask]
+                        r[:, 0] = remap[r[:, 0]]
+                        vf.write(np.ascontiguousarray(vectors[s:s + BLOCK_ROWS][mask]).tobytes())
+                        rf.write(r.tobytes())
+                        alive += len(r)
+                    del vectors, rows
+            with open(self._data(new, "docs.txt"), "w", encoding="ascii") as fh:
+                fh.writelines(h + "\n" for h, keep in zip(docs, keep_doc) if keep)
+
+            nlist = 0
+            if alive >= self.train_min:
+                vectors = np.memmap(self._data(new, "vectors.f32"), dtype=np.float32, mode="r", shape=(alive, dim))
+                nlist = max(1, int(np.sqrt(alive)))
+                rng = np.random.default_rng(alive)
+                sample = np.sort(rng.choice(alive, min(alive, nlist * KMEANS_SAMPLE), replace=False))
+                centroids = kmeans(vectors[sample], nlist)
+                _assign(vectors, centroids).tofile(self._data(new, "assign.i32"))
+                np.save(self._data(new, "centroids.npy"), centroids)
+                del vectors
+
+            new.update(n=alive, n_docs=int(keep_doc.sum()), nlist=nlist, trained_n=alive if nlist else 0,
+                       deleted=[], dead_rows=0, rebuilt_at=time.time(),
+                       rebuild_seconds=round(time.perf_counter() - t0, 2))
+            self._write_meta(new)
+            # readers that still map the old epoch keep their (unlinked) files until they re-map
+            shutil.rmtree(self._path(meta["epoch"]), ignore_errors=True)
+            return new
+
+    # --- search ---------------------------------------------------------------------------
+    def search(self, queries, k: int = 10, signature: str = None, nprobe: int = None):
+        """
+        Top-k (doc_hash, chunk_index, score) per query row (normalized vectors).
+        Returns [] per query when the corpus is empty or was built with another signature.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        state = self._load()
+        if (not state or "vectors" not in state or state["meta"]["dim"] != queries.shape[1]
+                or (signature is not None and state["meta"]["signature"] != signature)):
+            return [[] for _ in queries]
+        if state["centroids"] is not None:
+            found = self._search_ivf(state, queries, k, nprobe or self.nprobe)
+        else:
+            found = self._search_flat(state, queries, k)
+        docs, rows = state["docs"], state["rows"]
+        return [[(docs[rows[i, 0]], int(rows[i, 1]), float(s)) for s, i in zip(scores, ids)]
+                for scores, ids in found]
+
+    def _search_flat(self, state, queries, k):
+        vectors, dead = state["vectors"], state["dead"]
+        best = [(np.empty(0, np.float32), np.empty(0, np.int64)) for _ in queries]
+        for s in range(0, len(vectors), BLOCK_ROWS):
+            sims = np.asarray(vectors[s:s + BLOCK_ROWS]) @ queries.T  # (block, queries)
+            if dead is not None:
+                sims[dead[s:s + BLOCK_ROWS]] = -np.inf
+            kk = min(k, len(sims))
+            part = np.argpartition(-sims, kk - 1, axis=0)[:kk]
+            for q in range(len(queries)):
+                ids = part[:, q]
+                scores = np.concatenate((best[q][0], sims[ids, q]))
+                best[q] = _top_k(scores, np.concatenate((best[q][1], ids + s)), k)
+        return [(sc[np.isfinite(sc)], ids[np.isfinite(sc)]) for sc, ids in best]
+
+    def _search_ivf(self, state, queries, k, nprobe):
+        centroids, order, offsets = state["centroids"], state["order"], state["offsets"]
+        vectors, dead = state["vectors"], state["dead"]
+        nprobe = min(nprobe, len(centroids))
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        out = []
+        for q, lists in zip(queries, probes):
+            ids = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in lists])
+            if dead is not None:
+                ids = ids[~dead[ids]]
+            ids.sort()  # sequential reads from the memory map
+            out.append(_top_k(vectors[ids] @ q, ids, k) if len(ids) else
+                       (np.empty(0, np.float32), ids))
+        return out
+
+    def stats(self) -> dict:
+        state = self._load()
+        if not state:
+            return {"vectors": 0, "documents": 0, "lists": 0}
+        meta = state["meta"]
+        return {"vectors": meta["n"] - meta["dead_rows"], "documents": meta["n_docs"] - len(meta["deleted"]),
+                "lists": meta["nlist"], "signature": meta["signature"]}
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_corpus() -> CorpusIndex:
+    """Process-wide index over PERDF_CORPUS_DIR."""
+    global _corpus
+    if _corpus is None:
+        with _corpus_lock:
+            if _corpus is None:
+                _corpus = CorpusIndex()
+    return _corpus
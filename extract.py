@@ -0,0 +1,279 @@
+"""
+Page text extraction for PDF Q&A indexing.
+
+Pages are extracted in the shared process pool (procpool.py, as in render.py):
+PERDF_EXTRACT_WORKERS processes (0 = cpu_count) started with
+PERDF_EXTRACT_START_METHOD (forkserver | spawn | fork; defaults to
+PERDF_RENDER_START_METHOD, then forkserver). Documents shorter than
+PERDF_EXTRACT_PARALLEL_MIN pages are extracted inline. Pages come back in page
+order as lists of text blocks. A page with (almost) no text but with images is
+treated as scanned and handed to the OCR backend:
+
+    PERDF_OCR_BACKEND  auto (default)  Tesseract via PyMuPDF if tessdata is installed, else none
+                       tesseract       PyMuPDF get_textpage_ocr (PERDF_OCR_LANG, PERDF_OCR_DPI)
+                       none            scanned pages stay empty
+                       module:function a callable(page) -> [block text, ...]
+
+Results are cached per page in SQLite, keyed by a hash of everything the page
+references (content streams, form XObjects, fonts, images) and the OCR
+settings, so re-indexing an edited document (or the same pages in another
+upload) only extracts pages it has not seen.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import importlib
+import threading
+from collections import deque
+
+import fitz  # PyMuPDF
+
+import procpool
+from chunker import page_blocks
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXTRACT_WORKERS = int(os.getenv("PERDF_EXTRACT_WORKERS", "0"))  # 0 -> os.cpu_count()
+EXTRACT_PARALLEL_MIN = int(os.getenv("PERDF_EXTRACT_PARALLEL_MIN", "32"))  # smaller documents run inline
+EXTRACT_START_METHOD = os.getenv("PERDF_EXTRACT_START_METHOD", os.getenv("PERDF_RENDER_START_METHOD", ""))
+EXTRACT_CACHE_DIR = os.getenv("PERDF_EXTRACT_CACHE_DIR", os.path.join(BASE_DIR, "instance", "extract"))
+EXTRACT_CACHE_TTL = int(os.getenv("PERDF_EXTRACT_CACHE_TTL", str(30 * 24 * 3600)))
+OCR_BACKEND = os.getenv("PERDF_OCR_BACKEND", "auto")
+OCR_LANG = os.getenv("PERDF_OCR_LANG", "tur+eng")
+OCR_DPI = int(os.getenv("PERDF_OCR_DPI", "300"))
+OCR_MIN_CHARS = 10  # pages with less text than this and an image are OCR candidates
+EXTRACT_VERSION = 2
+PRUNE_EVERY = 500  # cache writes between TTL sweeps
+_REF = re.compile(r"\b(\d+) \d+ R\b")
+_PARENT_REF = re.compile(r"/Parent\s*\d+ \d+ R\b")
+
+_backend = None
+_cache_lock = threading.Lock()
+_writes = 0
+
+
+# --- OCR backends -------------------------------------------------------------------------
+def _tesseract_available() -> bool:
+    try:
+        return bool(fitz.get_tessdata())
+    except Exception:
+        return False
+
+
+def ocr_tesseract(page):
+    """Local Tesseract through PyMuPDF; the page is rasterized at PERDF_OCR_DPI."""
+    tp = page.get_textpage_ocr(language=OCR_LANG, dpi=OCR_DPI, full=True)
+    return page_blocks(page, textpage=tp)
+
+
+def get_ocr_backend():
+    """(name, callable or None) for PERDF_OCR_BACKEND, resolved once per process."""
+    global _backend
+    if _backend is None:
+        name = OCR_BACKEND
+        if name == "auto":
+            name = "tesseract" if _tesseract_available() else "none"
+        if name == "none":
+            _backend = (name, None)
+        elif name == "tesseract":
+            _backend = (name, ocr_tesseract)
+        else:
+            module, _, attr = name.partition(":")
+            _backend = (name, getattr(importlib.import_module(module), attr or "ocr"))
+    return _backend
+
+
+def settings_key() -> str:
+    """Identifies the extraction an index was built with (an OCR change re-indexes)."""
+    name, _ = get_ocr_backend()
+    if name == "none":
+        return f"v{EXTRACT_VERSION}:none"
+    return f"v{EXTRACT_VERSION}:{name}:{OCR_LANG}:{OCR_DPI}"
+
+
+# --- page cache ---------------------------------------------------------------------------
+def _connect():
+    os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+    db = sqlite3.connect(os.path.join(EXTRACT_CACHE_DIR, "pages.db"), timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("""CREATE TABLE IF NOT EXISTS pages (
+        key TEXT PRIMARY KEY, blocks TEXT NOT NULL, ocr INTEGER NOT NULL, last_used REAL NOT NULL)""")
+    return db
+
+
+def _inherited(doc, xref: int, key: str) -> str:
+    """A page attribute, looked up through the page tree like a viewer does."""
+    for _ in range(64):  # guards against /Parent cycles in broken files
+        kind, value = doc.xref_get_key(xref, key)
+        if kind != "null":
+            return value
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            break
+        xref = int(parent.split()[0])
+    return "null"
+
+
+def page_key(doc, page, settings: str, stream_digests: dict = None) -> str:
+    """
+    Content hash of a page: its content streams and resources and, recursively, every object
+    they reference (form XObjects, fonts with their font files and ToUnicode maps, images),
+    the annotation appearances (rendered for OCR) and the page box. Object numbers are
+    replaced by the order they are reached in, so the same page in another file gets the same
+    key; stream data is hashed raw, once per document (`stream_digests` maps xref -> digest).
+    """
+    stream_digests = {} if stream_digests is None else stream_digests
+    xref_count = doc.xref_length()
+    roots = [("Contents", doc.xref_get_key(page.xref, "Contents")[1]),
+             ("Resources", _inherited(doc, page.xref, "Resources"))]
+    for xref, kind, _ in page.annot_xrefs():
+        roots.append((f"Annot {kind} {doc.xref_get_key(xref, 'Rect')[1]}", doc.xref_get_key(xref, "AP")[1]))
+
+    order, queue, objects = {}, deque(), []
+
+    def reach(text):
+        for m in _REF.finditer(text):
+            xref = int(m.group(1))
+            if 0 < xref < xref_count and xref not in order:
+                order[xref] = len(order)
+                queue.append(xref)
+
+    for _, value in roots:
+        reach(value)
+    while queue:
+        xref = queue.popleft()
+        source = _PARENT_REF.sub("", doc.xref_object(xref, compressed=True))  # never climb into the page tree
+        reach(source)
+        objects.append((xref, source))
+
+    def renumber(text):
+        return _REF.sub(lambda m: f"#{order.get(int(m.group(1)), -1)}", text)
+
+    h = hashlib.sha256(settings.encode())
+    for label, value in roots:
+        h.update(f"{label}={renumber(value)}\n".encode())
+    for xref, source in objects:
+        h.update(renumber(source).encode())
+        if doc.xref_is_stream(xref):
+            digest = stream_digests.get(xref)
+            if digest is None:
+                digest = stream_digests[xref] = hashlib.sha256(doc.xref_stream_raw(xref) or b"").digest()
+            h.update(digest)
+    h.update(repr((tuple(page.rect), page.rotation)).encode())
+    return h.hexdigest()
+
+
+def _cache_get(db, keys):
+    found = {}
+    keys = list(keys)
+    for i in range(0, len(keys), 500):
+        part = keys[i:i + 500]
+        rows = db.execute(f"SELECT key, blocks, ocr FROM pages WHERE key IN ({','.join('?' * len(part))})", part)
+        for key, blocks, ocr in rows:
+            found[key] = (json.loads(blocks), bool(ocr))
+    return found
+
+
+def _cache_put(db, entries):
+    global _writes
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.executemany("INSERT OR REPLACE INTO pages (key, blocks, ocr, last_used) VALUES (?, ?, ?, ?)",
+                       [(key, json.dumps(blocks, ensure_ascii=False), int(ocr), now)
+                        for key, (blocks, ocr) in entries.items()])
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    with _cache_lock:
+        _writes += len(entries)
+        prune = _writes >= PRUNE_EVERY
+        if prune:
+            _writes = 0
+    if prune:
+        db.execute("DELETE FROM pages WHERE last_used < ?", (now - EXTRACT_CACHE_TTL,))
+
+
+def _cache_touch(db, keys):
+    db.executemany("UPDATE pages SET last_used = ? WHERE key = ?", [(time.time(), k) for k in keys])
+
+
+# --- extraction ---------------------------------------------------------------------------
+def _extract_page(doc, pno: int, ocr):
+    """(blocks, ocr_used) for a 0-based page."""
+    page = doc[pno]
+    blocks = page_blocks(page)
+    if ocr is not None and sum(map(len, blocks)) < OCR_MIN_CHARS and page.get_images():
+        try:
+            return ocr(page), True
+        except Exception as e:
+            print(f"OCR error on page {pno + 1}:", e)
+    return blocks, False
+
+
+def _extract_in_worker(pdf_path: str, pnos):
+    doc, ocr = procpool.open_doc(pdf_path), get_ocr_backend()[1]
+    return [(pno, *_extract_page(doc, pno, ocr)) for pno in pnos]
+
+
+def extract_workers(workers: int = None) -> int:
+    return max(1, workers or EXTRACT_WORKERS or os.cpu_count() or 1)
+
+
+def extract_pages(pdf_path: str, workers: int = None, use_cache: bool = True, stats: dict = None):
+    """
+    Per-page lists of text blocks for the whole document, in page order. `stats`, if
+    given, receives pages / cached / extracted / ocr counts.
+    """
+    settings = settings_key()
+    doc = fitz.open(pdf_path)
+    try:
+        digests = {}  # shared streams (fonts, images, forms) are hashed once
+        keys = [page_key(doc, page, settings, digests) for page in doc] if use_cache else []
+        db = _connect() if use_cache else None
+        try:
+            hits = _cache_get(db, set(keys)) if use_cache else {}
+            todo = [pno for pno in range(doc.page_count) if not use_cache or keys[pno] not in hits]
+            results = {}
+            workers = extract_workers(workers)
+            if workers == 1 or len(todo) < EXTRACT_PARALLEL_MIN:
+                ocr = get_ocr_backend()[1]
+                for pno in todo:
+                    results[pno] = _extract_page(doc, pno, ocr)
+            else:
+                results = _extract_parallel(pdf_path, todo, workers)
+
+            if use_cache:
+                fresh = {keys[pno]: res for pno, res in results.items()}
+                if fresh:
+                    _cache_put(db, fresh)
+                if hits:
+                    _cache_touch(db, hits)
+            pages, ocr_pages = [], 0
+            for pno in range(doc.page_count):
+                blocks, ocr_used = results[pno] if pno in results else hits[keys[pno]]
+                pages.append(blocks)
+                ocr_pages += ocr_used
+        finally:
+            if db is not None:
+                db.close()
+    finally:
+        doc.close()
+    if stats is not None:
+        stats.update(pages=len(pages), cached=len(pages) - len(todo), extracted=len(todo), ocr=ocr_pages)
+    return pages
+
+
+def _extract_parallel(pdf_path: str, pnos, workers: int):
+    # a few batches per worker: enough to balance OCR-heavy pages, few enough to keep IPC cheap
+    size = max(1, len(pnos) // (workers * 4))
+    batches = [pnos[i:i + size] for i in range(0, len(pnos), size)]
+    results = {}
+    ex = procpool.get_pool(workers, EXTRACT_START_METHOD)
+    for batch in ex.map(_extract_in_worker, [pdf_path] * len(batches), batches):
+        for pno, blocks, ocr_used in batch:
+            results[pno] = (blocks, ocr_used)
+    return results
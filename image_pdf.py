@@ -0,0 +1,331 @@
+"""
+Image -> PDF engines.
+
+`passthrough` (default) places the original JPEG bytes (DCTDecode) and, where the
+PNG layout allows it, the original PNG IDAT stream (FlateDecode + PNG predictor)
+straight into the PDF with PyMuPDF; images are only decoded when the format can't
+be embedded as-is. `reportlab` is the original decode -> RGB -> PNG -> ReportLab path.
+Both share `page_layout`, so pages come out the same size and position.
+
+Both engines are streaming page builders: each image is opened (header first, for
+the layout), placed and released before the next one is touched, so memory does
+not grow with the number of decoded images.
+"""
+import io
+import os
+import struct
+import hashlib
+import fitz  # PyMuPDF
+from PIL import Image
+from reportlab import rl_config
+from optimize import new_stats, finish_stats, fit_image_file
+from reportlab.lib.pagesizes import A4, LETTER, landscape, portrait
+
+# ASCII85-wrapping image streams makes them 25% larger and, without ReportLab's C
+# accelerator, costs more time than the whole page; PDFs here are always binary-safe
+rl_config.useA85 = 0
+
+IMAGE_PDF_ENGINE = os.getenv("PERDF_IMAGE_PDF_ENGINE", "passthrough")  # passthrough | reportlab
+IMAGE_PDF_BATCH_MB = float(os.getenv("PERDF_IMAGE_PDF_BATCH_MB", "64"))  # passthrough: flush to disk every N MB
+
+_PNG_SIG = b"\x89PNG\r\n\x1a\n"
+
+
+def mm_to_pt(mm):
+    return mm * 72.0 / 25.4
+
+
+def _simple_path(opts: dict) -> bool:
+    return opts["page_size"] == "auto" and opts["margin_mm"] <= 0 and opts["fit_mode"] == "contain"
+
+
+def page_layout(iw: int, ih: int, dpi: float, opts: dict):
+    """
+    Page size and image box for one image, in points:
+    (page_w, page_h, x, y, draw_w, draw_h) with (x, y) the lower-left corner.
+    """
+    page_size, orientation = opts["page_size"], opts["orientation"]
+    fit_mode, margin_mm = opts["fit_mode"], opts["margin_mm"]
+    # assume 72 dpi if not provided
+    dpi = dpi or 72
+    # image size in points at 72dpi scaling
+    iw_pt = iw * 72.0 / dpi
+    ih_pt = ih * 72.0 / dpi
+
+    # auto page size, no margins, contain: the page is the image (like PIL's PDF save)
+    if _simple_path(opts):
+        return float(iw), float(ih), 0.0, 0.0, float(iw), float(ih)
+
+    if page_size == "A4":
+        base = A4
+    elif page_size == "Letter":
+        base = LETTER
+    else:
+        # auto -> use A4 as base, but will be oriented automatically
+        base = A4
+    # auto orientation based on image aspect if requested
+    if orientation == "portrait":
+        ps = portrait(base)
+    elif orientation == "landscape":
+        ps = landscape(base)
+    else:
+        # auto: decide by image aspect ratio (>1: landscape)
+        ps = landscape(base) if iw >= ih else portrait(base)
+
+    page_w, page_h = ps
+    margin_pt = mm_to_pt(margin_mm)
+    box_w = max(1, page_w - 2*margin_pt)
+    box_h = max(1, page_h - 2*margin_pt)
+
+    if fit_mode == "stretch":
+        draw_w, draw_h = box_w, box_h
+    else:
+        scale_fit = min(box_w/iw_pt, box_h/ih_pt)
+        scale_cover = max(box_w/iw_pt, box_h/ih_pt)
+        s = scale_fit if fit_mode == "contain" else scale_cover
+        draw_w, draw_h = iw_pt*s, ih_pt*s
+
+    # center in box
+    x = (page_w - draw_w) / 2.0
+    y = (page_h - draw_h) / 2.0
+    return page_w, page_h, x, y, draw_w, draw_h
+
+
+def _image_dpi(img) -> float:
+    return img.info.get("dpi", (72, 72))[0] or 72
+
+
+def _png_xobject(data: bytes):
+    """
+    (dict, stream) for an image XObject that reuses the PNG's compressed IDAT data,
+    or None when the PNG needs decoding (alpha, palette transparency, 16 bit, interlace).
+    """
+    if not data.startswith(_PNG_SIG):
+        return None
+    pos = len(_PNG_SIG)
+    ihdr = None
+    idat = []
+    palette = None
+    while pos + 8 <= len(data):
+        length, ctype = struct.unpack(">I4s", data[pos:pos+8])
+        body = data[pos+8:pos+8+length]
+        pos += 12 + length
+        if ctype == b"IHDR":
+            ihdr = struct.unpack(">IIBBBBB", body)
+        elif ctype == b"PLTE":
+            palette = body
+        elif ctype == b"IDAT":
+            idat.append(body)
+        elif ctype == b"tRNS":
+            return None
+        elif ctype == b"IEND":
+            break
+    if not ihdr or not idat:
+        return None
+    width, height, depth, color_type, _, _, interlace = ihdr
+    if depth != 8 or interlace:
+        return None
+    if color_type == 0:
+        colorspace, colors = "/DeviceGray", 1
+    elif color_type == 2:
+        colorspace, colors = "/DeviceRGB", 3
+    elif color_type == 3 and palette:
+        colorspace, colors = f"[/Indexed/DeviceRGB {len(palette)//3 - 1}<{palette.hex()}>]", 1
+    else:
+        return None  # alpha channels need an SMask: let MuPDF decode those
+    stream = b"".join(idat)
+    obj = (f"<</Type/XObject/Subtype/Image/Width {width}/Height {height}/ColorSpace {colorspace}"
+           f"/BitsPerComponent 8/Filter/FlateDecode"
+           f"/DecodeParms<</Predictor 15/Colors {colors}/BitsPerComponent 8/Columns {width}>>"
+           f"/Length {len(stream)}>>")
+    return obj, stream
+
+
+def _read_header(path: str):
+    """(format, (w, h), dpi) from the image header; nothing is decoded."""
+    with Image.open(path) as img:
+        return img.format, img.size, _image_dpi(img)
+
+
+def _mpo_primary(path: str, data: bytes) -> bytes:
+    """
+    The first JPEG of a multi-picture file (phone cameras append depth maps or
+    previews after it, and Pillow reports such files as MPO); `data` if unsure.
+    """
+    try:
+        with Image.open(path) as img:
+            size = img.mpinfo[0xB002][0]["Size"]
+    except Exception:
+        return data
+    if data[:2] == b"\xff\xd8" and data[size - 2:size] == b"\xff\xd9":
+        return data[:size]
+    return data
+
+
+def images_to_pdf_passthrough(paths, out_path: str, opts: dict, progress=None, batch_mb: float = None,
+                               stats: dict = None) -> int:
+    """
+    Embed original JPEG/PNG streams (of an MPO only its primary JPEG); only other
+    formats are decoded (once, by PIL).
+    Like merge_streaming, the output is saved incrementally every `batch_mb` of
+    embedded image data and reopened, so only one batch of streams is held at a time.
+    Identical uploads share one image XObject; with opts["target_dpi"] images larger
+    than their page box needs are resampled to JPEG first (see optimize.py).
+    """
+    budget = (IMAGE_PDF_BATCH_MB if batch_mb is None else batch_mb) * 2**20
+    target_dpi, quality = opts.get("target_dpi"), opts.get("jpeg_quality")
+    stats = new_stats() if stats is None else stats
+    seen = {}  # sha1 of the upload -> image xref (xrefs survive the incremental saves)
+    doc = None
+    started = False
+    pending = 0
+    pages = 0
+
+    def flush():
+        nonlocal doc, started, pending, pages
+        if doc is None:
+            return
+        if doc.page_count:
+            if started:
+                doc.saveIncr()
+            else:
+                doc.save(out_path, garbage=1, deflate=True)
+                started = True
+            pages = doc.page_count
+        doc.close()
+        doc, pending = None, 0
+
+    for n, path in enumerate(paths, start=1):
+        try:
+            fmt, (iw, ih), dpi = _read_header(path)
+        except Exception as e:
+            print("IMG load error:", e)
+            continue
+
+        if doc is None:
+            doc = fitz.open(out_path) if started else fitz.open()
+        page_w, page_h, x, y, draw_w, draw_h = page_layout(iw, ih, dpi, opts)
+        page = doc.new_page(width=page_w, height=page_h)
+        # PDF space is bottom-up, fitz rects are top-down
+        rect = fitz.Rect(x, page_h - y - draw_h, x + draw_w, page_h - y)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            # stats cover the optimization only (dedupe, resampling), not format conversion
+            digest = hashlib.sha1(data).digest()
+            if digest in seen:
+                # identical upload: show the image that is already embedded
+                page.insert_image(rect, xref=seen[digest], keep_proportion=False)
+                stats["bytes_before"] += len(data)
+                stats["images_deduped"] += 1
+            else:
+                fitted = None
+                if target_dpi:
+                    fitted = fit_image_file(path, fmt, iw, ih, draw_w, draw_h, target_dpi, quality)
+                if fitted:
+                    stats["bytes_before"] += len(data)
+                    stats["bytes_after"] += len(fitted)
+                    stats["images_resampled"] += 1
+                    data, fmt = fitted, "JPEG"
+                elif fmt == "MPO":
+                    data, fmt = _mpo_primary(path, data), "JPEG"
+                elif fmt not in ("JPEG", "PNG"):
+                    with Image.open(path) as img:
+                        buf = io.BytesIO()
+                        img.convert("RGB").save(buf, format="PNG")
+                    data = buf.getvalue()
+                png = _png_xobject(data) if fmt == "PNG" else None
+                if png:
+                    xref = doc.get_new_xref()
+                    doc.update_object(xref, "<<>>")
+                    doc.update_stream(xref, png[1], new=True, compress=False)
+                    doc.update_object(xref, png[0])
+                    page.insert_image(rect, xref=xref, keep_proportion=False)
+                else:
+                    # JPEG bytes are kept as DCTDecode; other PNGs are decoded once by MuPDF
+                    xref = page.insert_image(rect, stream=data, keep_proportion=False)
+                seen[digest] = xref
+                pending += len(data)
+            del data
+        except Exception as e:
+            print("IMG load error:", e)
+            doc.delete_page(-1)
+            continue
+        if progress:
+            progress(n, len(paths))
+        if pending >= budget:
+            flush()
+    flush()
+    finish_stats(stats)
+    return pages
+
+
+def images_to_pdf_reportlab(paths, out_path: str, opts: dict, progress=None, stats: dict = None) -> int:
+    """
+    Original path: decode each image to RGB and draw it with ReportLab, one image at a
+    time. With auto page size, no margin and contain, pages are the image size and the
+    image is stored as JPEG, as PIL's multi-page PDF save used to do. ReportLab already
+    shares identical images; opts["target_dpi"] resamples like the passthrough engine.
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.utils import ImageReader
+
+    simple_path = _simple_path(opts)
+    target_dpi, quality = opts.get("target_dpi"), opts.get("jpeg_quality")
+    stats = new_stats() if stats is None else stats
+    c = None
+    pages = 0
+    for n, path in enumerate(paths, start=1):
+        try:
+            fmt, (iw, ih), dpi = _read_header(path)
+            page_w, page_h, x, y, draw_w, draw_h = page_layout(iw, ih, dpi, opts)
+            fitted = None
+            if target_dpi:
+                fitted = fit_image_file(path, fmt, iw, ih, draw_w, draw_h, target_dpi, quality)
+            if fitted:
+                stats["bytes_before"] += os.path.getsize(path)
+                stats["bytes_after"] += len(fitted)
+                stats["images_resampled"] += 1
+                buf = io.BytesIO(fitted)
+            else:
+                with Image.open(path) as img:
+                    rgb = img.convert("RGB")
+                if simple_path:
+                    buf = io.BytesIO()
+                    rgb.save(buf, format="JPEG")
+                    buf.seek(0)
+        except Exception as e:
+            print("IMG load error:", e)
+            continue
+
+        if c is None:
+            c = canvas.Canvas(out_path, pagesize=(page_w, page_h))
+        c.setPageSize((page_w, page_h))
+        # JPEG buffers are embedded as-is; a decoded image goes through ReportLab's Flate path
+        reader = ImageReader(buf if fitted or simple_path else rgb)
+        c.drawImage(reader, x, y, width=draw_w, height=draw_h, preserveAspectRatio=False, mask='auto')
+        # for JPEG input ImageReader stores a bound method of itself; break that cycle so the
+        # RGB copy it caches is freed now rather than whenever the cyclic GC next runs
+        reader.__dict__.pop("jpeg_fh", None)
+        c.showPage()
+        pages += 1
+        rgb = buf = reader = None
+
+        if progress:
+            progress(n, len(paths))
+
+    if c is not None:
+        c.save()
+    finish_stats(stats)
+    return pages
+
+
+def images_to_pdf(paths, out_path: str, opts: dict, progress=None, engine: str = None, stats: dict = None) -> int:
+    """
+    Write one page per readable image to out_path; returns the number of pages.
+    Pass a dict from optimize.new_stats() as `stats` to get the bytes saved.
+    """
+    engine = engine or IMAGE_PDF_ENGINE
+    if engine == "reportlab":
+        return images_to_pdf_reportlab(paths, out_path, opts, progress, stats=stats)
+    return images_to_pdf_passthrough(paths, out_path, opts, progress, stats=stats)
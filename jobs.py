@@ -0,0 +1,179 @@
+"""
+Local background job queue for heavy conversions.
+
+A bounded thread pool runs `work(out_path, progress)` callables; the job table
+keeps status, progress, the finished artifact path and whatever stats dict the
+work returned until the TTL expires.
+
+Each record is also written to <PERDF_JOB_DIR>/<id>.json, so with several
+worker processes (serve.py) a job started by one of them can be polled and
+downloaded through any other. The pool and the pending limit are per process.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.getenv("PERDF_JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("PERDF_JOB_MAX_PENDING", "32"))  # queued + running
+JOB_THRESHOLD_MB = float(os.getenv("PERDF_JOB_THRESHOLD_MB", "50"))  # larger requests become jobs
+JOB_TTL = int(os.getenv("PERDF_JOB_TTL", "3600"))  # seconds a finished job stays downloadable
+JOB_DIR = os.getenv("PERDF_JOB_DIR", os.path.join(tempfile.gettempdir(), "perdf_jobs"))
+PROGRESS_SAVE_SECONDS = 0.5  # progress reaches other processes at most this often
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_jobs = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def _after_fork():
+    # threads don't survive a fork: a worker process starts with its own empty pool and table
+    global _jobs, _lock, _executor
+    _jobs, _lock, _executor = {}, threading.Lock(), None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, JOB_WORKERS), thread_name_prefix="perdf-job")
+        return _executor
+
+
+def should_queue(content_length) -> bool:
+    return JOB_THRESHOLD_MB >= 0 and (content_length or 0) > JOB_THRESHOLD_MB * 2**20
+
+
+def _record_path(jid: str) -> str:
+    return os.path.join(JOB_DIR, jid + ".json")
+
+
+def _save(job: dict):
+    """Publish a snapshot of the job record for the other worker processes."""
+    path = _record_path(job["id"])
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w") as fh:
+            json.dump(dict(job), fh)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"job {job['id']} record not saved:", e)
+
+
+def _remove(job: dict):
+    for path in (job["result_path"], _record_path(job["id"])):
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _load(jid: str):
+    """A job owned by another process, from its record; None if unknown or expired."""
+    try:
+        with open(_record_path(jid)) as fh:
+            job = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if job["finished"] and time.time() - job["finished"] > JOB_TTL:
+        _remove(job)
+        return None
+    if job["status"] in ("queued", "running") and not _alive(job.get("pid")):
+        job.update(status="error", error="İşi yürüten süreç sonlandı.")
+    return job
+
+
+def _alive(pid) -> bool:
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _purge_expired():
+    now = time.time()
+    with _lock:
+        expired = [jid for jid, j in _jobs.items() if j["finished"] and now - j["finished"] > JOB_TTL]
+        for jid in expired:
+            _remove(_jobs.pop(jid))
+
+
+def submit(kind: str, work, mimetype: str, download_name: str):
+    """
+    Queue `work(out_path, progress)`; `progress(done, total)` may be called any number of times.
+    A dict returned by `work` is kept as the job's stats.
+    Returns the job id, or None when the queue is full.
+    """
+    _purge_expired()
+    with _lock:
+        pending = sum(1 for j in _jobs.values() if j["status"] in ("queued", "running"))
+        if pending >= JOB_MAX_PENDING:
+            return None
+        os.makedirs(JOB_DIR, exist_ok=True)
+        jid = uuid.uuid4().hex
+        _jobs[jid] = {
+            "id": jid, "kind": kind, "status": "queued", "done": 0, "total": 0,
+            "error": None, "created": time.time(), "finished": None,
+            "result_path": None, "stats": None, "mimetype": mimetype, "download_name": download_name,
+            "pid": os.getpid(),
+        }
+        _save(_jobs[jid])
+    _get_executor().submit(_run, jid, work, os.path.join(JOB_DIR, jid + os.path.splitext(download_name)[1]))
+    return jid
+
+
+def _run(jid: str, work, out_path: str):
+    job = _jobs[jid]
+    job["status"] = "running"
+    _save(job)
+    saved = [time.monotonic()]
+
+    def progress(done, total):
+        job["done"], job["total"] = done, total
+        if time.monotonic() - saved[0] >= PROGRESS_SAVE_SECONDS:
+            saved[0] = time.monotonic()
+            _save(job)
+
+    try:
+        result = work(out_path, progress)
+        job["stats"] = result if isinstance(result, dict) else None
+        job["done"] = job["total"]
+        job["result_path"] = out_path
+        job["status"] = "done"
+    except Exception as e:
+        print(f"job {jid} ({job['kind']}) failed:", e)
+        job["error"] = str(e) or e.__class__.__name__
+        job["status"] = "error"
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+    finally:
+        job["finished"] = time.time()
+        _save(job)
+
+
+def get(jid: str):
+    """Snapshot of a job for status endpoints; None if unknown or expired."""
+    if not _ID_RE.match(jid or ""):
+        return None
+    _purge_expired()
+    with _lock:
+        job = _jobs.get(jid)
+        if job:
+            return dict(job)
+    return _load(jid)
@@ -0,0 +1,245 @@
+"""
+In-process timing and byte counters, exported in the Prometheus text format.
+
+Work is wrapped in named stages:
+
+    with metrics.stage("merge") as st:
+        ...
+        st.add_bytes(os.path.getsize(out_path))
+
+    for name, data in metrics.timed_iter("render", render_pages(...), size=lambda e: len(e[1])):
+        ...
+
+Stages nest per thread and record *self* time: a "zip" stage pulling entries
+from a "render" iterator is charged only for the zipping. Every stage feeds the
+perdf_stage_seconds histogram and perdf_stage_bytes_total counter. Stages that
+run on the request's thread are also collected per request: the ones finished
+before the headers go out are listed in the Server-Timing header, and requests
+slower than PERDF_SLOW_REQUEST_SECONDS print their full breakdown (including
+streamed stages) when the response closes. Work on other threads (background
+jobs, LLM calls) is counted in the totals only.
+
+Metrics are per process; with several worker processes each one exposes its own.
+"""
+import os
+import time
+import resource
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+SLOW_REQUEST_SECONDS = float(os.getenv("PERDF_SLOW_REQUEST_SECONDS", "5"))  # 0 disables the log
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+START_TIME = time.time()
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _after_fork():
+    # a preforked worker reports its own start; the parent has served nothing worth inheriting
+    global START_TIME
+    START_TIME = time.time()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class _Histogram:
+    def __init__(self, name, help_text, labels):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, values, seconds):
+        with _lock:
+            s = self.series.get(values)
+            if s is None:
+                s = self.series[values] = [0] * (len(BUCKETS) + 2)
+            for i, le in enumerate(BUCKETS):
+                if seconds <= le:
+                    s[i] += 1
+            s[-2] += seconds
+            s[-1] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for values, s in sorted(series.items()):
+            lbl = _labels(self.labels, values)
+            for i, le in enumerate(BUCKETS):
+                out.append(f'{self.name}_bucket{{{lbl},le="{le}"}} {s[i]}')
+            out.append(f'{self.name}_bucket{{{lbl},le="+Inf"}} {s[-1]}')
+            out.append(f"{self.name}_sum{{{lbl}}} {s[-2]:.6f}")
+            out.append(f"{self.name}_count{{{lbl}}} {s[-1]}")
+        return out
+
+
+class _Counter:
+    def __init__(self, name, help_text, labels):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.series = defaultdict(float)
+
+    def inc(self, values, amount=1):
+        with _lock:
+            self.series[values] += amount
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            series = dict(self.series)
+        for values, v in sorted(series.items()):
+            out.append(f"{self.name}{{{_labels(self.labels, values)}}} {v:g}")
+        return out
+
+
+def _labels(names, values):
+    esc = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, esc))
+
+
+STAGE_SECONDS = _Histogram("perdf_stage_seconds", "Self time spent in a processing stage.", ("stage",))
+STAGE_BYTES = _Counter("perdf_stage_bytes_total", "Bytes processed by a stage.", ("stage",))
+REQUEST_SECONDS = _Histogram("perdf_http_request_seconds",
+                             "Request latency until the response body was fully sent.", ("route", "method"))
+REQUESTS = _Counter("perdf_http_requests_total", "Requests served.", ("route", "method", "status"))
+REQUEST_BYTES = _Counter("perdf_http_request_bytes_total", "Request body bytes received.", ("route",))
+RESPONSE_BYTES = _Counter("perdf_http_response_bytes_total", "Response bytes with a known length.", ("route",))
+
+
+class _Stage:
+    __slots__ = ("name", "bytes", "child")
+
+    def __init__(self, name):
+        self.name, self.bytes, self.child = name, 0, 0.0
+
+    def add_bytes(self, n):
+        self.bytes += n or 0
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _record(st, elapsed):
+    self_time = max(0.0, elapsed - st.child)
+    STAGE_SECONDS.observe((st.name,), self_time)
+    if st.bytes:
+        STAGE_BYTES.inc((st.name,), st.bytes)
+    req = getattr(_local, "request", None)
+    if req is not None:
+        req.append((st.name, self_time, st.bytes))
+
+
+@contextmanager
+def stage(name: str, nbytes: int = 0):
+    """Time a block as `name`; the yielded object's add_bytes() counts processed bytes."""
+    st = _Stage(name)
+    st.add_bytes(nbytes)
+    stack = _stack()
+    stack.append(st)
+    t0 = time.perf_counter()
+    try:
+        yield st
+    finally:
+        elapsed = time.perf_counter() - t0
+        stack.pop()
+        if stack:
+            stack[-1].child += elapsed
+        _record(st, elapsed)
+
+
+def timed_iter(name: str, iterable, size=None):
+    """Yield from `iterable`, charging the time spent producing each item to stage `name`."""
+    it = iter(iterable)
+    while True:
+        with stage(name) as st:
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            if size is not None:
+                st.add_bytes(size(item))
+        yield item
+
+
+def timed(name: str):
+    """Decorator form of stage() for whole functions."""
+    def wrap(fn):
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        inner.__name__, inner.__doc__, inner.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return inner
+    return wrap
+
+
+def _summary(stages):
+    totals = defaultdict(lambda: [0.0, 0])
+    for name, seconds, nbytes in stages:
+        totals[name][0] += seconds
+        totals[name][1] += nbytes
+    return totals
+
+
+def init_app(app):
+    """Per-request collection, request metrics and the Server-Timing header."""
+    from flask import request
+
+    @app.before_request
+    def _start():
+        _local.request = []
+        _local.started = time.perf_counter()
+
+    @app.after_request
+    def _finish(resp):
+        stages = getattr(_local, "request", None)
+        started = getattr(_local, "started", None)
+        if stages is None or started is None:
+            return resp
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        method = request.method
+        if stages:
+            resp.headers["Server-Timing"] = ", ".join(
+                f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in _summary(stages).items())
+        if request.content_length:
+            REQUEST_BYTES.inc((rule,), request.content_length)
+        if resp.content_length:
+            RESPONSE_BYTES.inc((rule,), resp.content_length)
+
+        def closed():
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe((rule, method), elapsed)
+            REQUESTS.inc((rule, method, str(resp.status_code)))
+            if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+                parts = " ".join(f"{n}={s:.2f}s/{b / 2**20:.1f}MB" for n, (s, b) in _summary(stages).items())
+                print(f"slow request {method} {rule} {elapsed:.2f}s: {parts}")
+            if getattr(_local, "request", None) is stages:
+                _local.request = None
+
+        resp.call_on_close(closed)
+        return resp
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in (REQUESTS, REQUEST_SECONDS, REQUEST_BYTES, RESPONSE_BYTES, STAGE_SECONDS, STAGE_BYTES):
+        lines.extend(metric.render())
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kB on Linux
+    lines += ["# HELP perdf_process_max_rss_bytes Peak resident set size of this process.",
+              "# TYPE perdf_process_max_rss_bytes gauge",
+              f"perdf_process_max_rss_bytes {rss}",
+              "# HELP perdf_process_start_time_seconds Start time of the process since the epoch.",
+              "# TYPE perdf_process_start_time_seconds gauge",
+              f"perdf_process_start_time_seconds {START_TIME:.3f}"]
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """{stage: (seconds, bytes, count)} totals, e.g. for benchmark reports."""
+    with _lock:
+        return {k[0]: (v[-2], STAGE_BYTES.series.get(k, 0), v[-1]) for k, v in STAGE_SECONDS.series.items()}
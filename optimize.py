@@ -0,0 +1,225 @@
+"""
+Output optimization for image-heavy PDFs (image->PDF and merge results).
+
+Images are resampled to the physical size they are shown at on the page
+(`target_dpi`) and stored as JPEG (`quality`) when that is smaller than the
+original stream; identical image XObjects are collapsed to one. Every entry
+point returns a stats dict so callers can report how many bytes were saved.
+"""
+import io
+import os
+import hashlib
+import fitz  # PyMuPDF
+from PIL import Image
+from pdf_engine import _REF_RE, _LENGTH_RE
+
+OPTIMIZE_DPI = float(os.getenv("PERDF_OPTIMIZE_DPI", "0"))  # 0 = off unless the request asks
+OPTIMIZE_JPEG_QUALITY = int(os.getenv("PERDF_OPTIMIZE_JPEG_QUALITY", "80"))
+OPTIMIZE_SLACK = 1.25  # images at most this far above the target are left alone
+OPTIMIZE_MIN_GAIN = 0.9  # keep a recompressed image only if it is <90% of the original
+
+# lossless bilevel scans compress far better than JPEG ever could
+_KEEP_FILTERS = ("JBIG2Decode", "CCITTFaxDecode", "JPXDecode")
+
+
+def new_stats() -> dict:
+    return {"bytes_before": 0, "bytes_after": 0, "bytes_saved": 0, "images_resampled": 0, "images_deduped": 0}
+
+
+def finish_stats(stats: dict) -> dict:
+    stats["bytes_saved"] = max(0, stats["bytes_before"] - stats["bytes_after"])
+    return stats
+
+
+def target_size(iw: int, ih: int, box_w_pt: float, box_h_pt: float, dpi: float):
+    """
+    Pixel size for an iw x ih image drawn into a box of box_w_pt x box_h_pt points at
+    `dpi`, or None when the image is already within OPTIMIZE_SLACK of that density.
+    """
+    if not dpi or box_w_pt <= 0 or box_h_pt <= 0:
+        return None
+    tw = max(1, round(box_w_pt / 72.0 * dpi))
+    th = max(1, round(box_h_pt / 72.0 * dpi))
+    if iw <= tw * OPTIMIZE_SLACK and ih <= th * OPTIMIZE_SLACK:
+        return None
+    return min(tw, iw), min(th, ih)
+
+
+def encode_jpeg(img, size=None, quality: int = None) -> bytes:
+    """Resample a PIL image to `size` (if given) and encode it as baseline JPEG."""
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if size and size != img.size:
+        img = img.resize(size, Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality or OPTIMIZE_JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+def fit_image_file(path: str, fmt: str, iw: int, ih: int, box_w_pt: float, box_h_pt: float,
+                   dpi: float, quality: int = None):
+    """
+    JPEG bytes for the image at `path` resampled to its page box, or None when it is
+    already small enough. JPEG sources are decoded at reduced scale (draft mode).
+    """
+    size = target_size(iw, ih, box_w_pt, box_h_pt, dpi)
+    if size is None:
+        return None
+    with Image.open(path) as img:
+        if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+            return None  # JPEG has no alpha; keep the original
+        if fmt in ("JPEG", "MPO"):  # MPO: a JPEG with an MPF block, as many phone cameras write
+            img.draft(img.mode, size)
+        return encode_jpeg(img, size, quality)
+
+
+def _jpeg_xobject(data: bytes, width: int, height: int, gray: bool) -> str:
+    cs = "/DeviceGray" if gray else "/DeviceRGB"
+    return (f"<</Type/XObject/Subtype/Image/Width {width}/Height {height}/ColorSpace {cs}"
+            f"/BitsPerComponent 8/Filter/DCTDecode/Length {len(data)}>>")
+
+
+def _display_sizes(doc):
+    """{image xref: (max shown width pt, max shown height pt, page number)} over all pages."""
+    shown = {}
+    for page in doc:
+        for item in page.get_images(full=True):
+            xref = item[0]
+            try:
+                rects = page.get_image_rects(xref)
+            except Exception:
+                continue
+            for r in rects:
+                w, h = abs(r.width), abs(r.height)
+                if page.rotation in (90, 270):
+                    w, h = h, w
+                old = shown.get(xref)
+                if old is None or w * h > old[0] * old[1]:
+                    shown[xref] = (w, h, page.number)
+    return shown
+
+
+def _resample_images(doc, dpi: float, quality: int, stats: dict, progress=None):
+    shown = _display_sizes(doc)
+    smasks = set()
+    for page in doc:
+        smasks.update(item[1] for item in page.get_images(full=True) if item[1])
+    total = len(shown)
+    for n, (xref, (box_w, box_h, _)) in enumerate(shown.items(), start=1):
+        if progress:
+            progress(n - 1, total)
+        if xref in smasks or doc.xref_get_key(xref, "SMask")[0] != "null":
+            continue  # transparency would need its own JPEG + SMask pair
+        if doc.xref_get_key(xref, "Mask")[0] != "null":
+            continue  # stencil or colour-key mask: the bare DCTDecode dict would drop it
+        if doc.xref_get_key(xref, "ImageMask")[1] == "true":
+            continue
+        filt = doc.xref_get_key(xref, "Filter")[1]
+        if any(f in filt for f in _KEEP_FILTERS):
+            continue
+        try:
+            iw = int(doc.xref_get_key(xref, "Width")[1])
+            ih = int(doc.xref_get_key(xref, "Height")[1])
+            bpc = doc.xref_get_key(xref, "BitsPerComponent")[1]
+        except ValueError:
+            continue
+        if bpc not in ("8", "16"):
+            continue
+        size = target_size(iw, ih, box_w, box_h, dpi)
+        if size is None:
+            continue
+        try:
+            raw_len = len(doc.xref_stream_raw(xref))
+            pix = fitz.Pixmap(doc, xref)
+            if pix.alpha:
+                pix = fitz.Pixmap(pix, 0)
+            if pix.n not in (1, 3):
+                pix = fitz.Pixmap(fitz.csRGB, pix)  # CMYK, Lab, ...
+            mode = "L" if pix.n == 1 else "RGB"
+            img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+            pix = None
+            data = encode_jpeg(img, size, quality)
+        except Exception as e:
+            print("optimize: image", xref, "skipped:", e)
+            continue
+        if len(data) >= raw_len * OPTIMIZE_MIN_GAIN:
+            continue
+        doc.update_stream(xref, data, new=True, compress=False)
+        doc.update_object(xref, _jpeg_xobject(data, size[0], size[1], mode == "L"))
+        stats["images_resampled"] += 1
+    if progress:
+        progress(total, total)
+
+
+def _dedupe_images(doc, stats: dict):
+    """Point every reference to a duplicate image XObject at its first copy."""
+    memo = {}
+
+    def key(xref, depth=0):
+        if xref in memo:
+            return memo[xref]
+        if depth > 8 or not (0 < xref < doc.xref_length()):
+            return f"{xref}R"
+        text = _LENGTH_RE.sub("", doc.xref_object(xref, compressed=True))
+        text = _REF_RE.sub(lambda m: "<" + key(int(m.group(1)), depth + 1) + ">", text)
+        h = hashlib.sha1(text.encode("latin-1", "replace"))
+        if doc.xref_is_stream(xref):
+            h.update(doc.xref_stream_raw(xref) or b"")
+        memo[xref] = h.hexdigest()
+        return memo[xref]
+
+    canonical, remap = {}, {}
+    for page in doc:
+        for item in page.get_images(full=True):
+            xref = item[0]
+            if xref in remap or canonical.get(key(xref)) == xref:
+                continue
+            first = canonical.setdefault(key(xref), xref)
+            if first != xref:
+                remap[xref] = first
+    if not remap:
+        return
+    for xref in range(1, doc.xref_length()):
+        if xref in remap:
+            continue
+        try:
+            text = doc.xref_object(xref, compressed=True)
+        except Exception:
+            continue
+        if " R" not in text:
+            continue
+        new = _REF_RE.sub(lambda m: f"{remap[int(m.group(1))]} 0 R" if int(m.group(1)) in remap else m.group(0), text)
+        if new != text:
+            doc.update_object(xref, new)
+    stats["images_deduped"] += len(remap)
+
+
+def optimize_pdf(path: str, dpi: float = None, quality: int = None, progress=None) -> dict:
+    """
+    Rewrite the PDF at `path` in place: resample images above `dpi` (when set), collapse
+    duplicate images and save with garbage collection. The file is only replaced when
+    the result is smaller; on any error it is left untouched. Returns the stats dict.
+    """
+    stats = new_stats()
+    stats["bytes_before"] = stats["bytes_after"] = os.path.getsize(path)
+    tmp = path + ".opt"
+    try:
+        doc = fitz.open(path)
+        try:
+            if dpi:
+                _resample_images(doc, dpi, quality or OPTIMIZE_JPEG_QUALITY, stats, progress)
+            _dedupe_images(doc, stats)
+            doc.save(tmp, garbage=3, deflate=True)
+        finally:
+            doc.close()
+        size = os.path.getsize(tmp)
+        if size < stats["bytes_before"]:
+            os.replace(tmp, path)
+            stats["bytes_after"] = size
+    except Exception as e:
+        print("optimize error:", e)
+        stats["images_resampled"] = stats["images_deduped"] = 0
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return finish_stats(stats)
@@ -0,0 +1,135 @@
+"""
+Page-range selection shared by split and PDF -> image.
+
+`parse_ranges(spec, total)` turns a spec like "1-3,7,10-" into a PageSelection:
+sorted, merged 1-based intervals that are iterated lazily, so "1-1000000" costs
+the same as "1-3". Comma-separated parts, whitespace ignored:
+
+    7         page 7                 -1        last page (negatives count from the end)
+    3-9       pages 3..9             5-        page 5 to the end
+    -3-       last three pages       1--2      everything but the last page
+    1-20:2    every 2nd page in 1-20 odd/even (tek/çift) odd or even pages
+
+An empty spec selects every page. Unparseable parts are skipped and ranges are
+clipped to the document, as the old per-route parser did.
+"""
+import re
+import heapq
+from itertools import chain
+
+_PART_RE = re.compile(r"^(-?\d+)?(?:(-)(-?\d+)?)?(?::(\d+))?$")
+_KEYWORDS = {"odd": (1, 2), "tek": (1, 2), "even": (2, 2), "çift": (2, 2), "cift": (2, 2), "all": (1, 1)}
+
+
+class PageSelection:
+    """Sorted, de-duplicated 1-based pages held as (first, last, step) runs."""
+
+    def __init__(self, runs, total: int):
+        self.total = total
+        plain = sorted((a, b) for a, b, s in runs if s == 1)
+        merged = []
+        for a, b in plain:
+            if merged and a <= merged[-1][1] + 1:
+                if b > merged[-1][1]:
+                    merged[-1][1] = b
+            else:
+                merged.append([a, b])
+        self._plain = [(a, b) for a, b in merged]
+        # stepped runs that a plain interval already covers add nothing
+        self._stepped = sorted((a, b, s) for a, b, s in runs
+                               if s > 1 and not any(x <= a and b <= y for x, y in self._plain))
+        self._len = None
+
+    def _ranges(self):
+        plain = [range(a, b + 1) for a, b in self._plain]
+        return plain, [range(a, b + 1, s) for a, b, s in self._stepped]
+
+    def __iter__(self):
+        plain, stepped = self._ranges()
+        if not stepped:
+            return chain.from_iterable(plain)
+        return self._merge(plain + stepped)
+
+    @staticmethod
+    def _merge(ranges):
+        last = None
+        for p in heapq.merge(*ranges):
+            if p != last:
+                yield p
+                last = p
+
+    def __len__(self):
+        if self._len is None:
+            if self._stepped:
+                self._len = sum(1 for _ in self)
+            else:
+                self._len = sum(b - a + 1 for a, b in self._plain)
+        return self._len
+
+    def __bool__(self):
+        return bool(self._plain or self._stepped)
+
+    def runs(self):
+        """Yield (first, last) blocks of consecutive pages, e.g. for one insert_pdf call each."""
+        if not self._stepped:
+            yield from self._plain
+            return
+        start = prev = None
+        for p in self:
+            if prev is not None and p == prev + 1:
+                prev = p
+                continue
+            if start is not None:
+                yield start, prev
+            start = prev = p
+        if start is not None:
+            yield start, prev
+
+    def __repr__(self):
+        return f"PageSelection({len(self)} of {self.total} pages)"
+
+
+def _resolve(n: int, total: int) -> int:
+    return total + 1 + n if n < 0 else n
+
+
+def parse_ranges(spec: str, total_pages: int) -> PageSelection:
+    """Parse a page spec against a document of `total_pages` pages (see module docstring)."""
+    if total_pages <= 0:
+        return PageSelection([], 0)
+    spec = (spec or "").strip()
+    if not spec:
+        return PageSelection([(1, total_pages, 1)], total_pages)
+
+    runs = []
+    for part in spec.split(","):
+        part = re.sub(r"\s+", "", part).lower()
+        if not part:
+            continue
+        if part in _KEYWORDS:
+            first, step = _KEYWORDS[part]
+            a, b = first, total_pages
+        else:
+            m = _PART_RE.match(part)
+            if not m or not any(m.groups()):
+                continue
+            lo, dash, hi, step = m.groups()
+            step = int(step) if step else 1
+            if dash:
+                a = _resolve(int(lo), total_pages) if lo is not None else 1
+                b = _resolve(int(hi), total_pages) if hi is not None else total_pages
+            elif lo is not None:
+                a = b = _resolve(int(lo), total_pages)
+            else:
+                a, b = 1, total_pages  # bare ":n" steps through the whole document
+            if int(lo or 1) == 0 or int(hi or 1) == 0 or step < 1:
+                continue
+            if a > b:
+                a, b = b, a
+        a, b = max(1, a), min(total_pages, b)
+        if a > b:
+            continue
+        if step > 1:
+            b -= (b - a) % step
+        runs.append((a, b, step))
+    return PageSelection(runs, total_pages)
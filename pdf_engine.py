@@ -0,0 +1,489 @@
+"""
+Disk-backed PDF page operations used by the conversion routes.
+
+Everything here reads inputs from paths and writes the result to a path, so the
+Flask views can stream the output file back instead of holding it in memory.
+
+Page copying goes through a backend (PERDF_PDF_BACKEND):
+
+    fitz    PyMuPDF, C-level insert_pdf (default); per-page split uses the
+            graft writer below unless PERDF_SPLIT_ENGINE=fitz
+    pypdf2  the original pure-Python PdfReader/PdfWriter path, kept as a fallback
+
+Both carry the document metadata over and honour the output options
+PERDF_PDF_GARBAGE (0-4, MuPDF garbage collection level) and PERDF_PDF_DEFLATE.
+A backend subclasses PdfBackend and is added with register_backend.
+"""
+import io
+import os
+import re
+import inspect
+from abc import ABC, abstractmethod
+import fitz  # PyMuPDF
+
+PDF_BACKEND = os.getenv("PERDF_PDF_BACKEND", "fitz")  # fitz | pypdf2
+PDF_GARBAGE = int(os.getenv("PERDF_PDF_GARBAGE", "1"))
+PDF_DEFLATE = os.getenv("PERDF_PDF_DEFLATE", "0") == "1"
+MERGE_MODE = os.getenv("PERDF_MERGE_MODE", "")  # stream (fitz) | memory (pypdf2); empty -> PDF_BACKEND
+MERGE_BATCH_MB = float(os.getenv("PERDF_MERGE_BATCH_MB", "64"))
+SPLIT_ENGINE = os.getenv("PERDF_SPLIT_ENGINE", "")  # graft | fitz | pypdf2; empty -> PDF_BACKEND
+SPLIT_CACHE_MB = float(os.getenv("PERDF_SPLIT_CACHE_MB", "256"))
+
+_REF_RE = re.compile(r"(?<![\w.])(\d+)\s+\d+\s+R(?!\w)")
+_LENGTH_RE = re.compile(r"/Length\s+\d+(?:\s+\d+\s+R)?")
+_INHERITABLE = ("Resources", "MediaBox", "CropBox", "Rotate")
+_INFO_KEYS = {"title": "Title", "author": "Author", "subject": "Subject", "keywords": "Keywords",
+              "creator": "Creator", "producer": "Producer", "creationDate": "CreationDate", "modDate": "ModDate"}
+
+
+def save_options(garbage: int = None, deflate: bool = None) -> dict:
+    """Keyword arguments for fitz Document.save from the PERDF_PDF_* output settings."""
+    return {"garbage": PDF_GARBAGE if garbage is None else garbage,
+            "deflate": PDF_DEFLATE if deflate is None else deflate}
+
+
+def _carry_metadata(out, src):
+    meta = {k: v for k, v in (src.metadata or {}).items() if v and k in _INFO_KEYS}
+    if meta:
+        out.set_metadata(meta)
+
+
+def _pdf_string(value: str) -> str:
+    if value.isascii() and value.isprintable():
+        return "(" + value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+    return "<FEFF" + value.encode("utf-16-be").hex().upper() + ">"
+
+
+def _info_dict(metadata) -> str:
+    """Serialized /Info dictionary for the graft writer, or '' without metadata."""
+    items = [f"/{_INFO_KEYS[k]}{_pdf_string(v)}" for k, v in (metadata or {}).items() if v and k in _INFO_KEYS]
+    return "<<" + "".join(items) + ">>" if items else ""
+
+
+def _open_fitz(path: str):
+    """fitz.open with a PyPDF2 round trip for files MuPDF refuses but PyPDF2 can still read."""
+    try:
+        return fitz.open(path)
+    except Exception as e:
+        try:
+            from PyPDF2 import PdfReader, PdfWriter
+            reader = PdfReader(path)
+            w = PdfWriter()
+            for page in reader.pages:
+                w.add_page(page)
+            if reader.metadata:
+                w.add_metadata(reader.metadata)
+            buf = io.BytesIO()
+            w.write(buf)
+        except Exception:
+            raise e
+        print(f"fitz could not open {os.path.basename(path)}, rewritten by PyPDF2:", e)
+        return fitz.open("pdf", buf.getvalue())
+
+
+def merge_streaming(paths, out_path: str, batch_mb: float = None, progress=None, options: dict = None) -> int:
+    """
+    Append inputs to `out_path` in batches of roughly `batch_mb` input bytes. Each batch
+    ends with an incremental save and the output is reopened, so resident memory is
+    bounded by the batch size rather than the total input size. The save `options` apply
+    to the first (full) save; later batches are appended incrementally.
+    Returns the number of pages written.
+    """
+    options = save_options() if options is None else options
+    budget = (MERGE_BATCH_MB if batch_mb is None else batch_mb) * 2**20
+    out = None
+    started = False
+    pending = 0
+    pages = 0
+
+    def flush():
+        nonlocal out, started, pending, pages
+        if out is None:
+            return
+        if out.page_count == 0:
+            out.close()
+            out, pending = None, 0
+            return
+        if started:
+            out.saveIncr()
+        else:
+            out.save(out_path, **options)
+            started = True
+        pages = out.page_count
+        out.close()
+        out, pending = None, 0
+
+    for n, path in enumerate(paths, start=1):
+        if progress:
+            progress(n - 1, len(paths))
+        try:
+            src = _open_fitz(path)
+        except Exception as e:
+            print("Merge error:", e)
+            continue
+        try:
+            if out is None:
+                out = fitz.open(out_path) if started else fitz.open()
+            if not started and out.page_count == 0:
+                # keep metadata from the first file
+                _carry_metadata(out, src)
+            out.insert_pdf(src)
+            pending += os.path.getsize(path)
+        except Exception as e:
+            print("Merge error:", e)
+        finally:
+            src.close()
+        if pending >= budget:
+            flush()
+    flush()
+    return pages
+
+
+def _pypdf2_write(writer, out_path: str, deflate: bool = None):
+    if PDF_DEFLATE if deflate is None else deflate:
+        for page in writer.pages:
+            page.compress_content_streams()
+    with open(out_path, "wb") as fh:
+        writer.write(fh)
+
+
+def merge_pypdf2(paths, out_path: str, progress=None, options: dict = None) -> int:
+    """Original in-memory PyPDF2 merge; the result goes to a file instead of BytesIO."""
+    from PyPDF2 import PdfReader, PdfWriter
+    writer = PdfWriter()
+    for n, path in enumerate(paths, start=1):
+        if progress:
+            progress(n - 1, len(paths))
+        try:
+            reader = PdfReader(path)
+            # Try to keep metadata from the first file
+            if len(writer.pages) == 0 and reader.metadata:
+                writer.add_metadata(reader.metadata)
+            for page in reader.pages:
+                writer.add_page(page)
+        except Exception as e:
+            print("Merge error:", e)
+    if len(writer.pages) == 0:
+        return 0
+    _pypdf2_write(writer, out_path, (options or {}).get("deflate"))
+    return len(writer.pages)
+
+
+def select_pages_fitz(path: str, pages, out_path: str, progress=None, doc=None, options: dict = None) -> int:
+    """
+    Keep only the 1-based `pages` of the source (in the given order) with MuPDF's
+    Document.select and save it to `out_path`. Unlike one insert_pdf per block of pages,
+    objects shared by several selected pages (fonts, images) stay shared. An open `doc`
+    for `path` is reused and closed. Returns the page count.
+    """
+    src = doc if doc is not None else _open_fitz(path)
+    try:
+        src.select([p - 1 for p in pages])
+        if progress:
+            progress(len(pages), len(pages))
+        opts = dict(save_options() if options is None else options)
+        opts["garbage"] = max(1, opts.get("garbage", 0))  # drop what only unselected pages used
+        src.save(out_path, **opts)
+        return src.page_count
+    finally:
+        src.close()
+
+
+def split_pages_fitz(path: str, pages, doc=None):
+    """
+    Yield (page_num, pdf_bytes) for each 1-based page. The source is parsed once and
+    each page is grafted into a fresh document by MuPDF's C-level insert_pdf.
+    """
+    src = doc if doc is not None else _open_fitz(path)
+    try:
+        options = save_options()
+        for p in pages:
+            out = fitz.open()
+            try:
+                _carry_metadata(out, src)
+                out.insert_pdf(src, from_page=p-1, to_page=p-1)
+                yield p, out.tobytes(**options)
+            finally:
+                out.close()
+    finally:
+        src.close()
+
+
+def select_pages_pypdf2(path: str, pages, out_path: str, progress=None, doc=None, options: dict = None) -> int:
+    from PyPDF2 import PdfReader, PdfWriter
+    if doc is not None:
+        doc.close()
+    reader = PdfReader(path)
+    w = PdfWriter()
+    if reader.metadata:
+        w.add_metadata(reader.metadata)
+    for n, p in enumerate(pages, start=1):
+        w.add_page(reader.pages[p-1])
+        if progress:
+            progress(n, len(pages))
+    _pypdf2_write(w, out_path, (options or {}).get("deflate"))
+    return len(w.pages)
+
+
+def split_pages_pypdf2(path: str, pages, doc=None):
+    """Original path: one PdfWriter per page, object graph walked in Python each time."""
+    from PyPDF2 import PdfReader, PdfWriter
+    if doc is not None:
+        doc.close()
+    reader = PdfReader(path)
+    for p in pages:
+        w = PdfWriter()
+        if reader.metadata:
+            w.add_metadata(reader.metadata)
+        w.add_page(reader.pages[p-1])
+        if PDF_DEFLATE:
+            w.pages[0].compress_content_streams()
+        buf = io.BytesIO()
+        w.write(buf)
+        yield p, buf.getvalue()
+
+
+def _page_tree_xrefs(src):
+    """Every page and intermediate /Pages node; references to them are cut in single-page output."""
+    nodes = set()
+    for i in range(src.page_count):
+        x = src.page_xref(i)
+        while x and x not in nodes:
+            nodes.add(x)
+            kind, val = src.xref_get_key(x, "Parent")
+            x = int(val.split()[0]) if kind == "xref" else 0
+    return nodes
+
+
+def _page_dict(src, xref: int) -> str:
+    """Page dictionary without /Parent, with inherited attributes pulled down from the tree."""
+    items = []
+    keys = src.xref_get_keys(xref)
+    for k in keys:
+        if k != "Parent":
+            items.append(f"/{k} {src.xref_get_key(xref, k)[1]}")
+    for k in _INHERITABLE:
+        if k in keys:
+            continue
+        kind, parent = src.xref_get_key(xref, "Parent")
+        while kind == "xref":
+            px = int(parent.split()[0])
+            vkind, val = src.xref_get_key(px, k)
+            if vkind != "null":
+                items.append(f"/{k} {val}")
+                break
+            kind, parent = src.xref_get_key(px, "Parent")
+    return "<<" + "".join(items) + ">>"
+
+
+def _template(body: str):
+    """Split a serialized object into literal parts and the xrefs it references."""
+    bits = _REF_RE.split(body)
+    return bits[0::2], [int(x) for x in bits[1::2]]
+
+
+def split_pages_graft(path: str, pages, doc=None):
+    """
+    Yield (page_num, pdf_bytes) per 1-based page by writing minimal single-page PDFs
+    directly. Every source object is serialized once (dictionary template + raw, still
+    compressed stream bytes) and reused by all pages that reference it, so shared fonts
+    and images are neither re-parsed nor re-encoded per output file.
+    """
+    src = doc if doc is not None else _open_fitz(path)
+    if src.is_encrypted or src.xref_length() == 0:
+        yield from split_pages_fitz(path, pages, doc=src)
+        return
+    try:
+        tree = _page_tree_xrefs(src)
+        n_xref = src.xref_length()
+        info = _info_dict(src.metadata)
+        templates = {}
+        raws = {}
+        budget = [SPLIT_CACHE_MB * 2**20]
+
+        def load(x):
+            """(literal parts, referenced xrefs, is_stream) for an object, built once."""
+            tpl = templates.get(x)
+            if tpl is None:
+                body = src.xref_object(x, compressed=True).strip()
+                is_stream = src.xref_is_stream(x)
+                if is_stream:
+                    body = _LENGTH_RE.sub("", body, count=1)
+                tpl = templates[x] = _template(body) + (is_stream,)
+            return tpl
+
+        def stream_bytes(x):
+            raw = raws.get(x)
+            if raw is None:
+                raw = src.xref_stream_raw(x)
+                if len(raw) <= budget[0]:
+                    budget[0] -= len(raw)
+                    raws[x] = raw
+            return raw
+
+        def render(parts, refs, numbers):
+            out = [parts[0]]
+            for r, lit in zip(refs, parts[1:]):
+                num = numbers.get(r)
+                out.append(f"{num} 0 R" if num else "null")
+                out.append(lit)
+            return "".join(out)
+
+        for p in pages:
+            pxref = src.page_xref(p-1)
+            try:
+                page_parts, page_refs = _template(_page_dict(src, pxref))
+                # objects reachable from the page, page-tree nodes excluded
+                numbers = {pxref: 3}
+                order = []
+                stack = list(reversed(page_refs))
+                while stack:
+                    x = stack.pop()
+                    if x in numbers or x in tree or not 0 < x < n_xref:
+                        continue
+                    numbers[x] = len(order) + 4
+                    order.append(x)
+                    stack.extend(reversed(load(x)[1]))
+
+                buf = io.BytesIO()
+                buf.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+                offsets = []
+
+                def emit(num, body, raw=None):
+                    offsets.append(buf.tell())
+                    buf.write(f"{num} 0 obj\n".encode())
+                    if raw is None:
+                        buf.write(body.encode("latin-1"))
+                    else:
+                        buf.write(body[:-2].encode("latin-1"))
+                        buf.write(f"/Length {len(raw)}>>\nstream\n".encode())
+                        buf.write(raw)
+                        buf.write(b"\nendstream")
+                    buf.write(b"\nendobj\n")
+
+                emit(1, "<</Type/Catalog/Pages 2 0 R>>")
+                emit(2, "<</Type/Pages/Kids[3 0 R]/Count 1>>")
+                emit(3, render(page_parts, page_refs, numbers)[:-2] + "/Parent 2 0 R>>")
+                for x in order:
+                    parts, refs, is_stream = load(x)
+                    emit(numbers[x], render(parts, refs, numbers), stream_bytes(x) if is_stream else None)
+                trailer = "/Root 1 0 R"
+                if info:
+                    emit(len(offsets) + 1, info)
+                    trailer += f"/Info {len(offsets)} 0 R"
+
+                xref_pos = buf.tell()
+                size = len(offsets) + 1
+                buf.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+                buf.write("".join(f"{off:010d} 00000 n \n" for off in offsets).encode())
+                buf.write(f"trailer\n<</Size {size}{trailer}>>\nstartxref\n{xref_pos}\n%%EOF\n".encode())
+                data = buf.getvalue()
+            except Exception as e:
+                # unusual object syntax: let MuPDF copy this page instead
+                print("split graft fallback:", e)
+                out = fitz.open()
+                _carry_metadata(out, src)
+                out.insert_pdf(src, from_page=p-1, to_page=p-1)
+                data = out.tobytes(**save_options())
+                out.close()
+            yield p, data
+    finally:
+        src.close()
+
+
+# --- backends -----------------------------------------------------------------------------
+class PdfBackend(ABC):
+    """
+    Page copying and output writing for merge / split. Paths in, files or bytes out;
+    an open fitz `doc` passed to select/split is handed over and closed by the backend.
+    """
+    name = ""
+
+    @abstractmethod
+    def merge(self, paths, out_path: str, progress=None) -> int:
+        """Concatenate `paths` into `out_path`; returns the page count (0 if nothing was readable)."""
+
+    @abstractmethod
+    def select(self, path: str, pages, out_path: str, progress=None, doc=None) -> int:
+        """Copy the 1-based `pages` into one PDF at `out_path`; returns the page count."""
+
+    @abstractmethod
+    def split(self, path: str, pages, doc=None):
+        """Yield (page_num, pdf_bytes) with one single-page PDF per 1-based page."""
+
+
+class FitzBackend(PdfBackend):
+    name = "fitz"
+
+    def __init__(self, split_engine: str = "graft", options: dict = None):
+        self.split_engine = split_engine
+        self.options = options
+
+    def merge(self, paths, out_path, progress=None):
+        return merge_streaming(paths, out_path, progress=progress, options=self.options)
+
+    def select(self, path, pages, out_path, progress=None, doc=None):
+        return select_pages_fitz(path, pages, out_path, progress=progress, doc=doc, options=self.options)
+
+    def split(self, path, pages, doc=None):
+        if self.split_engine == "fitz":
+            return split_pages_fitz(path, pages, doc=doc)
+        return split_pages_graft(path, pages, doc=doc)
+
+
+class PyPDF2Backend(PdfBackend):
+    name = "pypdf2"
+
+    def __init__(self, options: dict = None):
+        self.options = options
+
+    def merge(self, paths, out_path, progress=None):
+        return merge_pypdf2(paths, out_path, progress=progress, options=self.options)
+
+    def select(self, path, pages, out_path, progress=None, doc=None):
+        return select_pages_pypdf2(path, pages, out_path, progress=progress, doc=doc, options=self.options)
+
+    def split(self, path, pages, doc=None):
+        return split_pages_pypdf2(path, pages, doc=doc)
+
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    """Add a PdfBackend subclass under its `name`; an incomplete one is rejected here, not per request."""
+    if not (isinstance(cls, type) and issubclass(cls, PdfBackend)) or inspect.isabstract(cls) or not cls.name:
+        raise TypeError(f"{cls!r} is not a complete, named PdfBackend")
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+register_backend(FitzBackend)
+register_backend(PyPDF2Backend)
+
+
+def get_backend(name: str = None) -> PdfBackend:
+    """
+    Backend by name. Besides the BACKENDS keys this accepts the older engine names:
+    stream / graft -> fitz, memory -> pypdf2.
+    """
+    name = {"stream": "fitz", "graft": "fitz", "memory": "pypdf2"}.get(name, name or PDF_BACKEND)
+    if name not in BACKENDS:
+        raise ValueError(f"unknown PDF backend {name!r}")
+    return BACKENDS[name]()
+
+
+def merge_pdfs(paths, out_path: str, mode: str = None, progress=None) -> int:
+    return get_backend(mode or MERGE_MODE).merge(paths, out_path, progress=progress)
+
+
+def select_pages(path: str, pages, out_path: str, engine: str = None, progress=None, doc=None) -> int:
+    return get_backend(engine or SPLIT_ENGINE).select(path, pages, out_path, progress=progress, doc=doc)
+
+
+def split_pages(path: str, pages, engine: str = None, doc=None):
+    """Pick a split engine; an open fitz `doc` for `path` is handed over and closed by it."""
+    engine = engine or SPLIT_ENGINE
+    if engine == "fitz":  # the fitz backend with insert_pdf instead of the graft writer
+        return FitzBackend("fitz").split(path, pages, doc=doc)
+    return get_backend(engine).split(path, pages, doc=doc)
@@ -0,0 +1,64 @@
+"""
+Worker process pools for page rendering (render.py) and text extraction (extract.py).
+
+A server process keeps one pool per size and start method, created on first use
+and shared by every request: concurrent conversions queue for the same workers
+instead of each starting cpu_count processes of their own. Workers start from
+forkserver where the platform has it, spawn elsewhere; forking the threaded
+server itself can copy a lock another thread holds and hang the child.
+
+Tasks name the PDF they work on; a worker keeps the last few documents it
+opened, so the pages of one request open their document once per worker.
+"""
+import os
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+DEFAULT_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+WORKER_DOCS = 2  # documents a worker keeps open
+
+_pools = {}
+_lock = threading.Lock()
+_docs = OrderedDict()  # in a worker: (path, mtime, size) -> open document
+
+
+def _after_fork():
+    # a forked server worker (serve.py) must not share the parent's pool processes
+    global _pools, _lock
+    _pools, _lock = {}, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_pool(workers: int, start_method: str = "") -> ProcessPoolExecutor:
+    """The shared pool of `workers` processes; one whose worker died (e.g. OOM-killed) is replaced."""
+    method = start_method or DEFAULT_START_METHOD
+    with _lock:
+        pool = _pools.get((workers, method))
+        if pool is not None and getattr(pool, "_broken", False):
+            pool.shutdown(wait=False, cancel_futures=True)
+            pool = None
+        if pool is None:
+            ctx = multiprocessing.get_context(method)
+            if method == "forkserver":
+                ctx.set_forkserver_preload(["fitz"])
+            pool = _pools[(workers, method)] = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+        return pool
+
+
+def open_doc(pdf_path: str):
+    """In a worker: the open document for `pdf_path`, reopened if the file changed."""
+    st = os.stat(pdf_path)
+    key = (pdf_path, st.st_mtime_ns, st.st_size)
+    doc = _docs.pop(key, None)
+    if doc is None:
+        doc = fitz.open(pdf_path)
+        while len(_docs) >= WORKER_DOCS:
+            _docs.popitem(last=False)[1].close()
+    _docs[key] = doc
+    return doc
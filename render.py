@@ -0,0 +1,70 @@
+"""
+Page rasterization for PDF -> image.
+
+Pages are rendered in the shared process pool (procpool.py); every worker opens
+the document once and returns encoded PNG/JPEG bytes. Results are yielded
+strictly in page order while later pages are still rendering.
+"""
+import os
+from collections import deque
+import fitz  # PyMuPDF
+
+import procpool
+
+RENDER_WORKERS = int(os.getenv("PERDF_RENDER_WORKERS", "0"))  # 0 -> os.cpu_count()
+RENDER_PARALLEL_MIN = int(os.getenv("PERDF_RENDER_PARALLEL_MIN", "8"))  # smaller jobs render inline
+RENDER_START_METHOD = os.getenv("PERDF_RENDER_START_METHOD", "")  # forkserver (default) | spawn | fork
+
+
+def _render_one(doc, page_num: int, dpi: int, fmt: str) -> bytes:
+    pix = doc[page_num-1].get_pixmap(dpi=dpi)
+    return pix.tobytes(fmt)
+
+
+def _render_in_worker(pdf_path: str, page_num: int, dpi: int, fmt: str):
+    return page_num, _render_one(procpool.open_doc(pdf_path), page_num, dpi, fmt)
+
+
+def render_workers(workers: int = None) -> int:
+    return max(1, workers or RENDER_WORKERS or os.cpu_count() or 1)
+
+
+def render_pages(pdf_path: str, pages, dpi: int, fmt: str, workers: int = None, doc=None):
+    """
+    Yield (page_num, image_bytes) for 1-based `pages`, in order. An already open `doc`
+    (e.g. the one the caller counted pages with) is used for inline rendering; either
+    way the generator closes it.
+    """
+    workers = render_workers(workers)
+    if workers == 1 or len(pages) < RENDER_PARALLEL_MIN:
+        if doc is None:
+            doc = fitz.open(pdf_path)
+        try:
+            for p in pages:
+                yield p, _render_one(doc, p, dpi, fmt)
+        finally:
+            doc.close()
+        return
+
+    if doc is not None:
+        doc.close()  # every worker opens its own copy
+    ex = procpool.get_pool(workers, RENDER_START_METHOD)
+    # Keep a bounded window in flight so finished images don't pile up in memory
+    # and concurrent requests get a share of the workers
+    window_size = workers * 2
+    it = iter(pages)
+    window = deque()
+    try:
+        for p in it:
+            window.append(ex.submit(_render_in_worker, pdf_path, p, dpi, fmt))
+            if len(window) >= window_size:
+                break
+        while window:
+            yield window.popleft().result()
+            nxt = next(it, None)
+            if nxt is not None:
+                window.append(ex.submit(_render_in_worker, pdf_path, nxt, dpi, fmt))
+    finally:
+        # consumer went away (e.g. client disconnected): drop queued pages
+        for fut in window:
+            fut.cancel()
@@ -0,0 +1,167 @@
+"""
+Production server: preforked worker processes sharing one listening socket.
+
+    python serve.py                  # PERDF_WORKERS workers on PERDF_HOST:PORT
+
+The parent imports the app and the heavy libraries once (PyMuPDF, Pillow,
+ReportLab, NumPy, the OpenAI client, the embedding model), compiles every
+template and only then forks, so workers share those pages copy-on-write and
+the first request in a worker pays no import or load cost. Nothing may run in
+a background thread before the fork: each worker starts its own (model
+warm-up, upload sweeper, job and LLM pools) through start_background_tasks().
+
+Each worker runs the threaded Werkzeug server on the shared socket. A worker
+that dies is replaced; SIGTERM / SIGINT let the workers finish their
+in-flight requests for up to PERDF_GRACEFUL_SECONDS. Per-process state that
+must be visible to every worker (background jobs, pending LLM summaries) is
+kept on disk; /metrics reports the worker that answered the scrape.
+
+`python app.py` remains the single-process development server with the
+debugger and template auto-reload.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import importlib
+import threading
+import traceback
+
+os.environ.setdefault("PERDF_PREFORK", "1")  # app.py leaves background threads to the workers
+
+from werkzeug.serving import make_server
+import app as perdf
+import extract
+import utils
+
+HOST = os.getenv("PERDF_HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "10000"))
+WORKERS = int(os.getenv("PERDF_WORKERS", "0"))  # 0 -> os.cpu_count()
+BACKLOG = int(os.getenv("PERDF_LISTEN_BACKLOG", "128"))
+GRACEFUL_SECONDS = float(os.getenv("PERDF_GRACEFUL_SECONDS", "30"))
+PRELOAD_MODEL = os.getenv("PERDF_PRELOAD_MODEL", "1") == "1"
+RESPAWN_DELAY = 1.0  # a worker that dies this soon after starting is restarted after this pause
+PRELOAD_MODULES = ("PIL.Image", "reportlab.pdfgen.canvas", "reportlab.lib.utils", "numpy", "PyPDF2")
+
+
+def preload():
+    """Everything a worker would otherwise import or build on its first requests."""
+    t0 = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    if perdf.summarizer.enabled():
+        importlib.import_module("openai")  # the client itself is per process
+    for name in perdf.app.jinja_env.list_templates():
+        perdf.app.jinja_env.get_template(name)
+    extract.get_ocr_backend()
+    if PRELOAD_MODEL and os.getenv("PERDF_EMBED_WARMUP", "1") == "1":
+        # load the weights only: the warm-up encode starts the torch thread pool, which must
+        # happen after the fork, so each worker runs it in start_background_tasks()
+        utils.get_embed_model()
+    return time.perf_counter() - t0
+
+
+def _serve_worker(sock):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the parent, which stops us
+    perdf.start_background_tasks()
+    server = make_server(HOST, PORT, perdf.app, threaded=True, fd=sock.fileno())
+    # wait for in-flight requests on shutdown instead of dropping them with the daemon threads
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever()
+    server.server_close()
+
+
+def _spawn(sock, workers):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _serve_worker(sock)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    workers[pid] = time.monotonic()
+
+
+def _stop_workers(workers):
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + GRACEFUL_SECONDS
+    while workers and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in workers:
+        print(f"worker {pid} did not stop in {GRACEFUL_SECONDS:.0f}s, killing it")
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+
+def main():
+    count = max(1, WORKERS or os.cpu_count() or 1)
+    took = preload()
+    sock = socket.create_server((HOST, PORT), backlog=BACKLOG)
+    if not hasattr(os, "fork"):
+        print(f"perdf: no fork() on this platform, serving in one process on http://{HOST}:{PORT}")
+        perdf.start_background_tasks()
+        make_server(HOST, PORT, perdf.app, threaded=True, fd=sock.fileno()).serve_forever()
+        return
+
+    stopping = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: stopping.append(signum))
+    workers = {}
+    for _ in range(count):
+        _spawn(sock, workers)
+    print(f"perdf: {count} workers on http://{HOST}:{PORT} (preload {took:.1f}s, asset version "
+          f"{perdf.ASSET_VERSION})", flush=True)
+
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid, status = 0, 0
+        if not pid:
+            time.sleep(0.5)
+            continue
+        started = workers.pop(pid, None)
+        if started is None:
+            continue
+        print(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting", flush=True)
+        if time.monotonic() - started < RESPAWN_DELAY:
+            time.sleep(RESPAWN_DELAY)
+        if not stopping:
+            _spawn(sock, workers)
+
+    print(f"perdf: stopping {len(workers)} workers", flush=True)
+    _stop_workers(workers)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
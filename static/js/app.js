@@ -206,6 +206,12 @@ window.perdfToast = (function(){
   return { show: show };
 })();
 
+// True while the download iframe holds a queued-job page (templates/job.html) rather than a finished download
+window.perdfIsJobFrame = function(){
+  var iframe = document.getElementById('dl_iframe');
+  try{ return !!(iframe && iframe.contentWindow && iframe.contentWindow.PERDF_JOB); }catch(e){ return false; }
+};
+
 // Attach to forms that download files via hidden iframe for non-navigation UX
 (function(){
   var forms = document.querySelectorAll('form[action="/merge"], form[action="/split"], form[action="/pdf_to_image"], form[action="/image_to_pdf"]');
@@ -218,6 +224,7 @@ window.perdfToast = (function(){
   var iframe = document.getElementById('dl_iframe');
   if(iframe){
     iframe.addEventListener('load', function(){
+      if(window.perdfIsJobFrame()) return;
       // On any response load, assume success; if server sent an HTML error page, at least notify finish
       window.perdfToast.show('İşlem tamamlandı. İndiriliyor…', 'ok');
     });
@@ -586,8 +593,12 @@ window.perdfToast = (function(){
     f.addEventListener('submit', function(){ start(bar); });
   });
   if(iframe){
-    iframe.addEventListener('load', function(){ stop(true); });
+    iframe.addEventListener('load', function(){ if(!window.perdfIsJobFrame()) stop(true); });
   }
+  // background jobs report real progress; stop the simulated one
+  window.addEventListener('message', function(e){
+    if(e.data && e.data.type === 'perdf-job') clearInterval(timer);
+  });
 })();
 
 // ---- Robust progress handling for download forms ----
@@ -619,8 +630,32 @@ window.perdfToast = (function(){
     f.addEventListener('submit', function(){ startProgress(f); });
   });
   if(iframe){
-    iframe.addEventListener('load', function(){ finishAll(); });
+    iframe.addEventListener('load', function(){ if(!window.perdfIsJobFrame()) finishAll(); });
   }
+
+  // Large inputs run as background jobs; job.html in the iframe reports real progress here
+  window.addEventListener('message', function(e){
+    if(e.origin !== window.location.origin || !e.data || e.data.type !== 'perdf-job') return;
+    var job = e.data.job || {};
+    clearInterval(timer);
+    document.querySelectorAll('.progress:not(.hidden)').forEach(function(bar){
+      if(job.status === 'done'){
+        bar.textContent = 'Hazır! %100';
+        setTimeout(function(){ bar.classList.add('hidden'); }, 900);
+      }else if(job.status === 'error'){
+        bar.textContent = 'Hata';
+        setTimeout(function(){ bar.classList.add('hidden'); }, 900);
+      }else{
+        bar.textContent = (job.status === 'queued' ? 'Sırada... %' : 'İşleniyor... %') + (job.percent || 0);
+      }
+    });
+    if(job.status === 'done'){
+      var saved = job.stats && job.stats.bytes_saved;
+      var note = saved ? ' ' + (saved / 1048576).toFixed(1) + ' MB kazanıldı.' : '';
+      window.perdfToast.show('İşlem tamamlandı.' + note + ' İndiriliyor…', 'ok');
+    }
+    if(job.status === 'error'){ window.perdfToast.show(job.error || 'İşlem başarısız oldu.', 'error'); }
+  });
 })();
 
 
@@ -752,3 +787,108 @@ window.perdfToast = (function(){
   }
   animate();
 })();
+
+// ---- PDF Q&A: swap in the LLM summary when it arrives after the page ----
+(function(){
+  var el = document.getElementById('qa-summary');
+  if(!el || !el.dataset.summaryUrl) return;
+  var url = el.dataset.summaryUrl, tries = 0;
+  function poll(){
+    fetch(url, {headers:{'Accept':'application/json'}})
+      .then(function(r){ return r.json(); })
+      .then(function(data){
+        if(data.status === 'done'){
+          if(data.summary){ el.textContent = data.summary; }
+          return;
+        }
+        if(data.status === 'pending' && ++tries < 12){ poll(); }
+      })
+      .catch(function(){});
+  }
+  poll();
+})();
+
+// ---- PDF Q&A: stream the answer over server-sent events; plain form post without EventSource ----
+(function(){
+  var form = document.getElementById('qa-form');
+  var answer = document.getElementById('qa-answer');
+  var answerTpl = document.getElementById('qa-answer-tpl');
+  var cardTpl = document.getElementById('qa-card-tpl');
+  if(!form || !answer || !answerTpl || !cardTpl || !window.EventSource || !form.dataset.streamUrl) return;
+  var source = null;
+
+  function part(root, name){ return root.querySelector('[data-qa="' + name + '"]'); }
+
+  form.addEventListener('submit', function(ev){
+    var question = (form.elements.question.value || '').trim();
+    if(!question) return;
+    ev.preventDefault();
+    if(source){ source.close(); }
+    var button = form.querySelector('button[type="submit"]');
+    var params = new URLSearchParams({filename: form.elements.filename.value, question: question});
+    var es = source = new EventSource(form.dataset.streamUrl + '?' + params.toString());
+    var started = false, cards = [];
+    if(button){ button.disabled = true; }
+
+    function finish(){
+      es.close();
+      if(source === es){ source = null; }
+      if(button){ button.disabled = false; }
+      cards.forEach(function(c){
+        var slot = part(c.el, 'preview');
+        if(!slot.querySelector('img')){ slot.firstElementChild.textContent = 'Önizleme yok'; }
+      });
+    }
+
+    es.addEventListener('results', function(e){
+      var data = JSON.parse(e.data);
+      started = true;
+      answer.innerHTML = '';
+      answer.appendChild(answerTpl.content.cloneNode(true));
+      part(answer, 'mode').textContent = '🧠 ' + data.mode + ' tabanlı arama';
+      var grid = part(answer, 'grid');
+      cards = data.results.map(function(r){
+        var el = cardTpl.content.firstElementChild.cloneNode(true);
+        part(el, 'pages').textContent = 'Sayfa ' + r.page + (r.page_end && r.page_end !== r.page ? '–' + r.page_end : '');
+        part(el, 'snippet').textContent = r.snippet;
+        grid.appendChild(el);
+        return {page: r.page, el: el};
+      });
+    });
+
+    es.addEventListener('preview', function(e){
+      var data = JSON.parse(e.data);
+      cards.forEach(function(c){
+        if(c.page !== data.page) return;
+        var link = document.createElement('a');
+        link.href = data.preview; link.target = '_blank';
+        var img = document.createElement('img');
+        img.src = data.preview; img.className = 'w-full h-40 object-cover';
+        img.alt = 'Önizleme sayfa ' + data.page;
+        link.appendChild(img);
+        var slot = part(c.el, 'preview');
+        slot.innerHTML = '';
+        slot.appendChild(link);
+      });
+    });
+
+    es.addEventListener('summary', function(e){
+      var data = JSON.parse(e.data);
+      var el = document.getElementById('qa-summary');
+      if(el){ el.textContent = data.summary; }
+    });
+
+    es.addEventListener('done', finish);
+    es.addEventListener('failed', function(e){
+      finish();
+      var el = document.getElementById('qa-summary');
+      if(el){ el.textContent = JSON.parse(e.data).error; }
+    });
+    // connection error (also fired when the server closes the stream): without any answer yet,
+    // fall back to the regular form post
+    es.onerror = function(){
+      finish();
+      if(!started){ form.submit(); }
+    };
+  });
+})();
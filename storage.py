@@ -0,0 +1,198 @@
+"""
+Content-addressed upload store.
+
+Uploads are stored once per SHA-256 under sharded directories
+(<root>/ab/cd/<sha><ext>). A small SQLite table keeps the size, a reference
+count and the last-use time of every blob; a background sweeper deletes blobs
+that nobody holds and that have not been used for PERDF_STORE_TTL seconds.
+The same hash is the key for everything derived from an upload (chat index,
+previews), which can subscribe to deletions through `on_delete`.
+"""
+import os
+import re
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from werkzeug.utils import secure_filename
+
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.getenv("PERDF_STORE_DIR", os.path.join(BASE_DIR, "instance", "store"))
+STORE_TTL = int(os.getenv("PERDF_STORE_TTL", str(24 * 3600)))  # idle seconds before an unreferenced blob goes
+STORE_LEASE = int(os.getenv("PERDF_STORE_LEASE", str(6 * 3600)))  # refs older than this are treated as leaked
+SWEEP_INTERVAL = int(os.getenv("PERDF_STORE_SWEEP_SECONDS", "300"))
+BLOCK = 1 << 20
+
+_SHA_RE = re.compile(r"^[0-9a-f]{64}$")
+_init_lock = threading.Lock()
+_initialized = False
+_delete_hooks = []
+_sweeper = None
+
+
+def _after_fork():
+    # the sweeper thread stays behind in the parent; start_sweeper() starts one in this process
+    global _sweeper
+    _sweeper = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _connect():
+    global _initialized
+    os.makedirs(STORE_DIR, exist_ok=True)
+    db = sqlite3.connect(os.path.join(STORE_DIR, "store.db"), timeout=30, isolation_level=None)
+    if not _initialized:
+        with _init_lock:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                sha TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0, last_used REAL NOT NULL)""")
+            _initialized = True
+    return db
+
+
+def _blob_path(sha: str, ext: str) -> str:
+    return os.path.join(STORE_DIR, sha[:2], sha[2:4], sha + ext)
+
+
+def _ext_of(filename: str) -> str:
+    return os.path.splitext(secure_filename(filename or ""))[1].lower()[:10]
+
+
+def put_upload(f, hold: bool = True):
+    """
+    Stream a werkzeug FileStorage into the store, hashing on the way.
+    Returns (sha, path). With hold=True the caller owns one reference and must `release` it.
+    """
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp = os.path.join(STORE_DIR, f".incoming-{uuid.uuid4().hex}")
+    hasher = hashlib.sha256()
+    size = 0
+    with metrics.stage("upload") as st, open(tmp, "wb") as out:
+        for block in iter(lambda: f.stream.read(BLOCK), b""):
+            hasher.update(block)
+            out.write(block)
+            size += len(block)
+        st.add_bytes(size)
+    sha = hasher.hexdigest()
+
+    db = _connect()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute("SELECT ext FROM blobs WHERE sha=?", (sha,)).fetchone()
+        ext = row[0] if row else _ext_of(f.filename)
+        path = _blob_path(sha, ext)
+        if row and os.path.exists(path):
+            os.remove(tmp)  # duplicate upload: keep the stored copy
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+        db.execute("""INSERT INTO blobs (sha, ext, size, refs, last_used) VALUES (?, ?, ?, ?, ?)
+                      ON CONFLICT(sha) DO UPDATE SET refs = refs + excluded.refs, last_used = excluded.last_used""",
+                   (sha, ext, size, 1 if hold else 0, time.time()))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        db.close()
+    return sha, path
+
+
+def release(*shas):
+    """Drop references taken by put_upload(hold=True); the blob then ages out after the TTL."""
+    if not shas:
+        return
+    db = _connect()
+    try:
+        now = time.time()
+        for sha in shas:
+            db.execute("UPDATE blobs SET refs = MAX(refs - 1, 0), last_used = ? WHERE sha = ?", (now, sha))
+    finally:
+        db.close()
+
+
+def path_for(sha: str):
+    """Stored path for a hash (refreshing its last-use time), or None if unknown/expired."""
+    if not sha or not _SHA_RE.match(sha):
+        return None
+    db = _connect()
+    try:
+        row = db.execute("SELECT ext FROM blobs WHERE sha=?", (sha,)).fetchone()
+        if not row:
+            return None
+        path = _blob_path(sha, row[0])
+        if not os.path.exists(path):
+            return None
+        db.execute("UPDATE blobs SET last_used = ? WHERE sha = ?", (time.time(), sha))
+        return path
+    finally:
+        db.close()
+
+
+def on_delete(callback):
+    """Register callback(sha) to clean up anything else keyed by a deleted blob's hash."""
+    _delete_hooks.append(callback)
+
+
+def sweep(now: float = None) -> int:
+    """Delete expired blobs; returns how many were removed."""
+    now = now or time.time()
+    expired = "((refs <= 0 AND last_used < ?) OR last_used < ?)"
+    cutoffs = (now - STORE_TTL, now - max(STORE_TTL, STORE_LEASE))
+    db = _connect()
+    removed = []
+    try:
+        candidates = db.execute(f"SELECT sha FROM blobs WHERE {expired}", cutoffs).fetchall()
+        for (sha,) in candidates:
+            # re-check under the write lock so a concurrent put_upload can't lose its file
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(f"SELECT ext FROM blobs WHERE sha = ? AND {expired}", (sha,) + cutoffs).fetchone()
+                if row:
+                    try:
+                        os.remove(_blob_path(sha, row[0]))
+                    except OSError:
+                        pass
+                    db.execute("DELETE FROM blobs WHERE sha = ?", (sha,))
+                    removed.append(sha)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+    finally:
+        db.close()
+    for sha in removed:
+        for hook in _delete_hooks:
+            try:
+                hook(sha)
+            except Exception as e:
+                print("store delete hook error:", e)
+    return len(removed)
+
+
+def start_sweeper():
+    """Run `sweep` periodically in a daemon thread (once per process)."""
+    global _sweeper
+    if _sweeper is not None or SWEEP_INTERVAL <= 0:
+        return
+
+    def loop():
+        while True:
+            try:
+                removed = sweep()
+                if removed:
+                    print(f"store sweep: removed {removed} expired uploads")
+            except Exception as e:
+                print("store sweep error:", e)
+            time.sleep(SWEEP_INTERVAL)
+
+    _sweeper = threading.Thread(target=loop, name="perdf-store-sweeper", daemon=True)
+    _sweeper.start()
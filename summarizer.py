@@ -0,0 +1,300 @@
+"""
+LLM summaries for PDF Q&A.
+
+One OpenAI client per process (its HTTP connection pool is reused across
+questions), a small thread pool for the calls and a TTL + LRU cache keyed by
+(document hash, question, snippets, model). `summarize` waits at most
+PERDF_LLM_WAIT seconds: when the model is slower the caller shows the
+extractive summary right away and fetches the LLM one later with `poll`.
+Identical questions that are already in flight share one upstream call.
+
+Finished summaries are also written to PERDF_LLM_CACHE_DIR (one small file
+per key, plus a marker while a call is running), so with several worker
+processes a summary started by one worker can be polled through another and
+is not requested again by its neighbours.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+
+LLM_MODEL = os.getenv("PERDF_LLM_MODEL", "gpt-4o-mini")
+LLM_WAIT = float(os.getenv("PERDF_LLM_WAIT", "2.5"))  # seconds a question blocks before going async
+LLM_TIMEOUT = float(os.getenv("PERDF_LLM_TIMEOUT", "30"))  # upstream request timeout
+LLM_WORKERS = int(os.getenv("PERDF_LLM_WORKERS", "4"))
+LLM_CACHE_SIZE = int(os.getenv("PERDF_LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL = int(os.getenv("PERDF_LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_DIR = os.getenv("PERDF_LLM_CACHE_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "llm"))
+FAILURE_TTL = 60  # failed calls are remembered briefly so a retry storm can't hammer the API
+POLL_INTERVAL = 0.2  # seconds between checks for a summary another process is producing
+PRUNE_EVERY = 200  # disk cache writes between sweeps of expired files
+
+_client = None
+_client_lock = threading.Lock()
+_executor = None
+_cache = OrderedDict()  # key -> (expires_at, summary)
+_inflight = {}  # key -> Future
+_lock = threading.Lock()
+_writes = 0
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _after_fork():
+    # the parent's HTTP connections and pool threads must not be shared with a worker process
+    global _client, _client_lock, _executor, _inflight, _lock
+    _client, _client_lock, _executor = None, threading.Lock(), None
+    _inflight, _lock = {}, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def enabled() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+
+def get_client():
+    """Process-wide OpenAI client; base URL/key come from the usual OPENAI_* variables."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(timeout=LLM_TIMEOUT, max_retries=1)
+    return _client
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, LLM_WORKERS), thread_name_prefix="perdf-llm")
+        return _executor
+
+
+def cache_key(doc_hash: str, question: str, snippets, model: str = None) -> str:
+    h = hashlib.sha256()
+    for part in (doc_hash or "", " ".join(question.split()), model or LLM_MODEL, *snippets):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _cache_get(key: str):
+    with _lock:
+        hit = _cache.get(key)
+        if hit is None:
+            return None
+        if hit[0] < time.time():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return hit[1]
+
+
+def _cache_put(key: str, summary: str, ttl: float):
+    with _lock:
+        _cache[key] = (time.time() + ttl, summary)
+        _cache.move_to_end(key)
+        while len(_cache) > LLM_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _disk_path(key: str, suffix: str = ".txt") -> str:
+    return os.path.join(LLM_CACHE_DIR, key + suffix)
+
+
+def _disk_get(key: str):
+    """Summary another process (or an earlier run) finished, or None. "" is a recent failure."""
+    path = _disk_path(key)
+    try:
+        st = os.stat(path)
+        if st.st_mtime + (LLM_CACHE_TTL if st.st_size else FAILURE_TTL) < time.time():
+            return None
+        with open(path, encoding="utf-8") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def _disk_put(key: str, summary: str):
+    global _writes
+    path = _disk_path(key)
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(summary)
+        os.replace(tmp, path)
+        os.remove(_disk_path(key, ".pending"))
+    except OSError:
+        pass
+    with _lock:
+        _writes += 1
+        prune = _writes % PRUNE_EVERY == 0
+    if prune:
+        _disk_prune()
+
+
+def _disk_mark_pending(key: str):
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        with open(_disk_path(key, ".pending"), "w"):
+            pass
+    except OSError:
+        pass
+
+
+def _disk_pending(key: str) -> bool:
+    try:
+        return os.stat(_disk_path(key, ".pending")).st_mtime > time.time() - LLM_TIMEOUT - 10
+    except OSError:
+        return False
+
+
+def _disk_prune():
+    now = time.time()
+    try:
+        names = os.listdir(LLM_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(LLM_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+            ttl = LLM_CACHE_TTL if name.endswith(".txt") and st.st_size else LLM_TIMEOUT + FAILURE_TTL
+            if st.st_mtime + ttl < now:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _build_prompt(snippets, question: str) -> str:
+    text = "\n\n".join(snippets)[:8000]
+    return (
+        "Aşağıdaki PDF pasajlarına dayanarak, kullanıcı sorusuna çok kısa ve net Türkçe bir özet yaz. "
+        "Sadece pasajlarda yer alan bilgilere dayan. Gerekirse belirsizliği belirt. 3-4 cümleyi geçme.\n\n"
+        f"Soru: {question}\n\n"
+        f"Pasajlar:\n{text}"
+    )
+
+
+def _call(key: str, snippets, question: str, model: str) -> str:
+    try:
+        with metrics.stage("llm"):
+            resp = get_client().chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": _build_prompt(snippets, question)}],
+                max_tokens=180,
+                temperature=0.2,
+            )
+        summary = (resp.choices[0].message.content or "").strip()
+        _cache_put(key, summary, LLM_CACHE_TTL if summary else FAILURE_TTL)
+        _disk_put(key, summary)
+        return summary
+    except Exception as e:
+        print("LLM summary error:", e)
+        _cache_put(key, "", FAILURE_TTL)
+        _disk_put(key, "")
+        return ""
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def _submit(key: str, snippets, question: str, model: str):
+    executor = _get_executor()
+    with _lock:
+        fut = _inflight.get(key)
+        if fut is None:
+            _disk_mark_pending(key)
+            fut = _inflight[key] = executor.submit(_call, key, list(snippets), question, model)
+        return fut
+
+
+def _cached(key: str):
+    """Summary from this process's cache or, failing that, the shared disk cache."""
+    hit = _cache_get(key)
+    if hit is None:
+        hit = _disk_get(key)
+        if hit is not None:
+            _cache_put(key, hit, LLM_CACHE_TTL if hit else FAILURE_TTL)
+    return hit
+
+
+def summarize(doc_hash: str, question: str, snippets, wait: float = None, model: str = None):
+    """
+    (summary, pending_key). A cached or quickly answered summary comes back directly;
+    if the model needs longer than `wait` seconds the summary is "" and pending_key can
+    be passed to `poll`. ("", None) means no LLM summary (no key, or the call failed).
+    """
+    if not enabled() or not snippets:
+        return "", None
+    model = model or LLM_MODEL
+    key = cache_key(doc_hash, question, snippets, model)
+    hit = _cached(key)
+    if hit is not None:
+        return hit, None
+    fut = _submit(key, snippets, question, model)
+    try:
+        return fut.result(timeout=LLM_WAIT if wait is None else wait), None
+    except FutureTimeout:
+        return "", key
+
+
+def poll(key: str, wait: float = 0):
+    """
+    {"status": "done", "summary": str} or {"status": "pending"}; None for unknown keys.
+    With `wait` the call blocks up to that many seconds for a pending summary.
+    """
+    if not _KEY_RE.match(key or ""):
+        return None
+    hit = _cached(key)
+    if hit is not None:
+        return {"status": "done", "summary": hit}
+    with _lock:
+        fut = _inflight.get(key)
+    if fut is None:
+        hit = _cached(key)  # it may have finished between the two lookups
+        if hit is not None:
+            return {"status": "done", "summary": hit}
+        if not _disk_pending(key):
+            return None
+        # running in another worker process: watch the shared cache
+        deadline = time.monotonic() + wait
+        while True:
+            hit = _disk_get(key)
+            if hit is not None:
+                return {"status": "done", "summary": hit}
+            if time.monotonic() >= deadline:
+                return {"status": "pending"}
+            time.sleep(POLL_INTERVAL)
+    try:
+        return {"status": "done", "summary": fut.result(timeout=wait)}
+    except FutureTimeout:
+        return {"status": "pending"}
+
+
+def summarize_many(doc_hash: str, items, wait: float = None, model: str = None):
+    """
+    summarize() for many (question, snippets) pairs: every call is started first, then
+    the whole batch waits at most `wait` seconds. Returns [(summary, pending_key)].
+    """
+    deadline = time.monotonic() + (LLM_WAIT if wait is None else wait)
+    started = [summarize(doc_hash, q, snippets, wait=0, model=model) for q, snippets in items]
+    out = []
+    for summary, key in started:
+        if key:
+            state = poll(key, wait=max(0.0, deadline - time.monotonic()))
+            if state is None:
+                key = None
+            elif state["status"] == "done":
+                summary, key = state["summary"], None
+        out.append((summary, key))
+    return out
@@ -0,0 +1,50 @@
+import fitz
+import pytest
+
+import extract
+
+
+@pytest.fixture(autouse=True)
+def page_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract, "EXTRACT_CACHE_DIR", str(tmp_path / "extract"))
+    monkeypatch.setattr(extract, "_backend", ("none", None))
+
+
+def _form_pdf(path, text):
+    """One page whose content is only `q /fzFrm0 Do Q`: the text lives in a form XObject."""
+    src = fitz.open()
+    src.new_page().insert_text((72, 72), text)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.show_pdf_page(page.rect, src, 0)
+    doc.save(str(path))
+    return str(path)
+
+
+def _text(pages):
+    return " ".join(" ".join(blocks) for blocks in pages)
+
+
+def test_form_xobject_pages_do_not_share_cache_entries(tmp_path):
+    a = _form_pdf(tmp_path / "a.pdf", "Birinci belge gizli metin")
+    b = _form_pdf(tmp_path / "b.pdf", "Second document other text")
+    with fitz.open(a) as da, fitz.open(b) as db:
+        assert da[0].read_contents() == db[0].read_contents()
+
+    assert "Birinci" in _text(extract.extract_pages(a, workers=1))
+    stats = {}
+    text = _text(extract.extract_pages(b, workers=1, stats=stats))
+    assert "Second" in text and "Birinci" not in text
+    assert stats["cached"] == 0
+
+
+def test_same_page_in_another_file_is_cached(tmp_path):
+    a = _form_pdf(tmp_path / "a.pdf", "Same content again")
+    extract.extract_pages(a, workers=1)
+    with fitz.open(a) as doc:  # same page, renumbered objects
+        doc.new_page(0)
+        doc.save(str(tmp_path / "b.pdf"), garbage=4)
+    stats = {}
+    pages = extract.extract_pages(str(tmp_path / "b.pdf"), workers=1, stats=stats)
+    assert "Same content" in _text(pages)
+    assert stats["cached"] == 1  # the inserted blank page is new
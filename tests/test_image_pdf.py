@@ -0,0 +1,38 @@
+import io
+import os
+
+import fitz
+from PIL import Image
+
+from image_pdf import images_to_pdf
+from optimize import fit_image_file
+
+OPTS = {"page_size": "auto", "orientation": "auto", "fit_mode": "contain", "margin_mm": 0.0}
+
+
+def _mpo(path, size=(800, 600)):
+    """A two-frame MPO, as phone cameras write it (primary JPEG plus an appended frame)."""
+    frames = [Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3)) for _ in range(2)]
+    frames[0].save(str(path), "MPO", save_all=True, append_images=frames[1:])
+    with Image.open(str(path)) as img:
+        assert img.format == "MPO"
+        return img.mpinfo[0xB002][0]["Size"]
+
+
+def test_mpo_is_embedded_as_its_primary_jpeg(tmp_path):
+    primary = _mpo(tmp_path / "photo.jpg")
+    out = str(tmp_path / "out.pdf")
+    assert images_to_pdf([str(tmp_path / "photo.jpg")], out, dict(OPTS), engine="passthrough") == 1
+    with fitz.open(out) as doc:
+        xref = doc[0].get_images(full=True)[0][0]
+        assert doc.xref_get_key(xref, "Filter")[1] == "/DCTDecode"
+        raw = doc.xref_stream_raw(xref)
+    with open(tmp_path / "photo.jpg", "rb") as fh:
+        assert raw == fh.read()[:primary]
+
+
+def test_mpo_is_resampled_like_a_jpeg(tmp_path):
+    _mpo(tmp_path / "photo.jpg", size=(2400, 1800))
+    data = fit_image_file(str(tmp_path / "photo.jpg"), "MPO", 2400, 1800, 240, 180, 72)
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == "JPEG" and img.size == (240, 180)
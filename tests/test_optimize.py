@@ -0,0 +1,48 @@
+import os
+
+import fitz
+import pytest
+
+from optimize import optimize_pdf
+
+SIDE = 1500
+
+
+def _image_pdf(path, mask=None):
+    """One page showing a noisy SIDE x SIDE RGB image in a 200 pt box; `mask` is a /Mask value."""
+    doc = fitz.open()
+    page = doc.new_page()
+    pix = fitz.Pixmap(fitz.csRGB, SIDE, SIDE, os.urandom(SIDE * SIDE * 3), 0)
+    xref = page.insert_image(fitz.Rect(50, 50, 250, 250), pixmap=pix)
+    if mask == "stencil":
+        stencil = doc.get_new_xref()
+        doc.update_object(stencil, "<</Type/XObject/Subtype/Image/Width 16/Height 2/ImageMask true"
+                                   "/BitsPerComponent 1>>")
+        doc.update_stream(stencil, b"\xff\x00" * 2, new=True)  # left half hidden
+        mask = f"{stencil} 0 R"
+    if mask:
+        doc.xref_set_key(xref, "Mask", mask)
+    doc.save(str(path))
+    return str(path)
+
+
+def _image_key(path, key):
+    with fitz.open(path) as doc:
+        xref = doc[0].get_images(full=True)[0][0]
+        return doc.xref_get_key(xref, key)
+
+
+def test_unmasked_image_is_resampled(tmp_path):
+    path = _image_pdf(tmp_path / "plain.pdf")
+    stats = optimize_pdf(path, dpi=72)
+    assert stats["images_resampled"] == 1
+    assert int(_image_key(path, "Width")[1]) < SIDE
+
+
+@pytest.mark.parametrize("mask", ["stencil", "[0 10 0 10 0 10]"])
+def test_masked_image_keeps_its_mask(tmp_path, mask):
+    path = _image_pdf(tmp_path / "masked.pdf", mask)
+    stats = optimize_pdf(path, dpi=72)
+    assert stats["images_resampled"] == 0
+    assert _image_key(path, "Mask")[0] != "null"
+    assert int(_image_key(path, "Width")[1]) == SIDE
@@ -0,0 +1,96 @@
+"""summarizer against a local OpenAI-compatible stub server (no API key or network)."""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import summarizer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNIPPETS = ["Birinci pasaj.", "İkinci pasaj."]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    calls = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with StubHandler.lock:
+            StubHandler.calls += 1
+        time.sleep(StubHandler.latency)
+        question = body["messages"][0]["content"].split("Soru: ", 1)[-1].split("\n", 1)[0]
+        out = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"Özet: {question}"}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubHandler.latency, StubHandler.calls = 0.0, 0
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setattr(summarizer, "LLM_CACHE_DIR", str(tmp_path / "llm"))
+    summarizer._after_fork()  # fresh client, pool and in-flight table
+    summarizer._cache.clear()
+    yield StubHandler
+    server.shutdown()
+    server.server_close()
+
+
+def test_identical_question_is_served_from_cache(stub):
+    first, key = summarizer.summarize("doc", "soru", SNIPPETS, wait=5)
+    assert first == "Özet: soru" and key is None
+    again, key = summarizer.summarize("doc", "  soru ", SNIPPETS, wait=5)
+    assert again == first and key is None
+    assert stub.calls == 1
+
+
+def test_concurrent_identical_questions_share_one_call(stub):
+    stub.latency = 0.5
+    with ThreadPoolExecutor(10) as ex:
+        results = list(ex.map(lambda _: summarizer.summarize("doc", "soru", SNIPPETS, wait=5), range(10)))
+    assert results == [("Özet: soru", None)] * 10
+    assert stub.calls == 1
+
+
+def test_slow_upstream_goes_pending_and_poll_resolves(stub):
+    stub.latency = 1.0
+    summary, key = summarizer.summarize("doc", "yavaş", SNIPPETS, wait=0.1)
+    assert summary == "" and key
+    assert summarizer.poll(key) == {"status": "pending"}
+    assert summarizer.poll(key, wait=5) == {"status": "done", "summary": "Özet: yavaş"}
+    assert summarizer.poll("not-a-key") is None
+    assert stub.calls == 1
+
+
+def test_disk_cache_survives_a_restart(stub):
+    summary, _ = summarizer.summarize("doc", "kalıcı", SNIPPETS, wait=5)
+    assert summary == "Özet: kalıcı"
+    code = ("import json, sys, summarizer; "
+            "print(json.dumps(summarizer.summarize('doc', 'kalıcı', json.loads(sys.argv[1]), wait=5)))")
+    env = dict(os.environ, PERDF_LLM_CACHE_DIR=summarizer.LLM_CACHE_DIR)
+    out = subprocess.run([sys.executable, "-c", code, json.dumps(SNIPPETS)], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    assert json.loads(out.strip().splitlines()[-1]) == ["Özet: kalıcı", None]
+    assert stub.calls == 1
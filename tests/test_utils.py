@@ -0,0 +1,77 @@
+import os
+
+import fitz
+import numpy as np
+import pytest
+
+import extract
+import utils
+
+
+@pytest.fixture(autouse=True)
+def index_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(extract, "EXTRACT_CACHE_DIR", str(tmp_path / "extract"))
+    monkeypatch.setattr(extract, "_backend", ("none", None))
+    monkeypatch.setattr(utils, "_index_cache", utils.OrderedDict())
+
+
+def _pdf(path):
+    doc = fitz.open()
+    for i in range(3):
+        doc.new_page().insert_text((72, 72), f"Page {i} invoice total {i * 100} due in March.")
+    doc.save(str(path))
+    return str(path)
+
+
+def test_keyword_only_index_gains_embeddings_once_a_model_works(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "get_embed_model", lambda: None)
+    path = _pdf(tmp_path / "a.pdf")
+    index = utils.load_doc_index(path)
+    assert index["emb"] is None
+
+    added = []
+    monkeypatch.setattr(utils, "get_embed_model", lambda: object())
+    monkeypatch.setattr(utils, "_try_embed", lambda texts: np.ones((len(texts), 4), dtype=np.float32))
+    monkeypatch.setattr(utils, "add_to_corpus", lambda pdf_path, doc_hash: added.append(doc_hash))
+    monkeypatch.setattr(extract, "extract_pages", lambda *a, **k: pytest.fail("PDF re-extracted"))
+    utils._index_cache.clear()
+
+    upgraded = utils.load_doc_index(None, index["hash"])
+    assert upgraded["emb"] is not None and upgraded["emb"].shape == (len(index["chunks"]), 4)
+    assert utils._read_index_meta(index["hash"])["embed_model"] == utils._embed_model_name()
+    assert added == [index["hash"]]
+
+
+def test_corpus_search_does_not_fill_the_chat_index_cache(tmp_path, monkeypatch):
+    import corpus_index
+    monkeypatch.setattr(utils, "CORPUS_ENABLED", True)
+    monkeypatch.setattr(corpus_index, "_corpus", corpus_index.CorpusIndex(str(tmp_path / "corpus")))
+    monkeypatch.setattr(utils, "get_embed_model", lambda: object())
+    monkeypatch.setattr(utils, "_try_embed", lambda texts: np.eye(len(texts), 8, dtype=np.float32))
+
+    doc_hash = utils.load_doc_index(_pdf(tmp_path / "a.pdf"))["hash"]
+    assert utils.add_to_corpus(None, doc_hash) > 0
+    utils._index_cache.clear()
+
+    hits = utils.search_corpus("invoice", k=3)
+    assert hits and hits[0]["document"] == doc_hash and "invoice" in hits[0]["snippet"]
+    assert not utils._index_cache
+
+
+def test_preview_budget_counts_files_written_by_other_workers(tmp_path, monkeypatch):
+    previews = tmp_path / "previews"
+    previews.mkdir()
+    monkeypatch.setattr(utils, "PREVIEW_CACHE_BYTES", 2500)
+    for n, name in enumerate(["other_p1_140.png", "other_p2_140.png"]):  # another process's renders
+        (previews / name).write_bytes(b"x" * 1000)
+        os.utime(previews / name, (1000 + n, 1000 + n))
+
+    utils._preview_store(str(previews), "mine_p1_140.png", b"y" * 1000, pinned={"mine_p1_140.png"})
+    assert sorted(os.listdir(previews)) == [".lock", "mine_p1_140.png", "other_p2_140.png"]
+
+    (previews / "other_p2_140.png").unlink()  # evicted elsewhere: no longer counted here
+    utils._preview_store(str(previews), "mine_p2_140.png", b"y" * 1000)
+    assert utils._preview_cached(str(previews), "mine_p1_140.png")
+    assert utils._preview_cached(str(previews), "mine_p2_140.png")
+    assert not utils._preview_cached(str(previews), "other_p1_140.png")
@@ -1,7 +1,14 @@
 
-import os, re, io
+import os, re, io, json, math, time, heapq, shutil, hashlib, threading, uuid
+from collections import OrderedDict, Counter, defaultdict
+from contextlib import contextmanager
 import fitz  # PyMuPDF
 
+try:
+    import fcntl  # serialises preview eviction across worker processes
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
 # --- Optional: load .env if present ---
 try:
     from dotenv import load_dotenv
@@ -9,75 +16,491 @@ try:
 except Exception:
     pass
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+import summarizer  # reads PERDF_LLM_* at import, so after .env is loaded
+import chunker
+import extract
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Per-document indexes live outside static/ so they are never served directly
+INDEX_DIR = os.getenv("PERDF_INDEX_DIR", os.path.join(BASE_DIR, "instance", "index"))
+INDEX_VERSION = 2
+INDEX_CACHE_SIZE = int(os.getenv("PERDF_INDEX_CACHE", "16"))
+
+BM25_K1 = float(os.getenv("PERDF_BM25_K1", "1.5"))
+BM25_B = float(os.getenv("PERDF_BM25_B", "0.75"))
+
+EMBED_BATCH_SIZE = int(os.getenv("PERDF_EMBED_BATCH", "32"))
+EMBED_THREADS = int(os.getenv("PERDF_EMBED_THREADS", "0"))  # 0 -> torch default
+EMBED_CONCURRENCY = int(os.getenv("PERDF_EMBED_CONCURRENCY", "2"))
+
+CORPUS_ENABLED = os.getenv("PERDF_CORPUS", "0") == "1"  # opt-in: /search_pdfs reads every upload
+CORPUS_SEARCH_MAX = 50
+
+NO_TEXT_SUMMARY = "PDF metin içerik bulunamadı."
+
+PREVIEW_SUBDIR = "previews"  # under the upload folder, served by /uploads
+PREVIEW_DIR = os.path.join(BASE_DIR, "static", "uploads", PREVIEW_SUBDIR)
+PREVIEW_DPI = int(os.getenv("PERDF_PREVIEW_DPI", "140"))
+PREVIEW_CACHE_BYTES = int(float(os.getenv("PERDF_PREVIEW_CACHE_MB", "256")) * 2**20)
+
+_hash_cache = {}
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+_preview_lock = threading.Lock()
+
+_embed_model = None
+_embed_model_failed = False
+_embed_model_lock = threading.Lock()
+_embed_slots = threading.BoundedSemaphore(max(1, EMBED_CONCURRENCY))
+
+def get_embed_model():
+    """Process-wide SentenceTransformer, created lazily once; None if unavailable."""
+    global _embed_model, _embed_model_failed
+    if _embed_model is not None or _embed_model_failed:
+        return _embed_model
+    with _embed_model_lock:
+        if _embed_model is None and not _embed_model_failed:
+            try:
+                from sentence_transformers import SentenceTransformer
+                if EMBED_THREADS > 0:
+                    try:
+                        import torch
+                        torch.set_num_threads(EMBED_THREADS)
+                    except Exception:
+                        pass
+                _embed_model = SentenceTransformer(_embed_model_name())
+            except Exception as e:
+                print("embedding model unavailable:", e)
+                _embed_model_failed = True
+    return _embed_model
+
+def warm_embedding_model() -> bool:
+    """Load the model and run one tiny encode so the first real question is fast."""
+    if get_embed_model() is None:
+        return False
+    return _try_embed(["query: warmup"]) is not None
 
 def _try_embed(texts):
     """Optional embeddings via sentence-transformers; safe fallback if unavailable."""
+    model = get_embed_model()
+    if model is None:
+        return None
     try:
-        from sentence_transformers import SentenceTransformer
-        model_name = os.getenv("PERDF_EMBED_MODEL", "intfloat/multilingual-e5-small")
-        model = SentenceTransformer(model_name)
-        import numpy as np
-        return model.encode(texts, normalize_embeddings=True)
+        # Shared model; cap concurrent encodes so threads don't oversubscribe the CPU
+        with _embed_slots, metrics.stage("embed", sum(len(t) for t in texts)):
+            return model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True,
+                                show_progress_bar=False)
     except Exception:
         return None
 
-def _chunk_text(text: str, size: int = 900, overlap: int = 150):
-    chunks = []
-    i = 0
-    while i < len(text):
-        chunks.append(text[i:i+size])
-        i += size - overlap
-    return chunks
-
-def _load_pdf_chunks(pdf_path: str):
-    doc = fitz.open(pdf_path)
-    chunks, pages = [], []
-    for pnum, page in enumerate(doc, start=1):
-        txt = page.get_text("text") or ""
-        if not txt.strip():
-            continue
-        for ch in _chunk_text(txt):
-            chunks.append(ch)
-            pages.append(pnum)
-    return chunks, pages
-
-def _rank_keyword(chunks, query):
-    q = query.lower()
-    scores = []
+def _embed_model_name():
+    return os.getenv("PERDF_EMBED_MODEL", "intfloat/multilingual-e5-small")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def _fold(text: str) -> str:
+    """Turkish-aware case folding: İ/I/ı/i all fold to 'i' so Turkish and ASCII spellings match."""
+    return text.replace("İ", "i").lower().replace("ı", "i").replace("\u0307", "")
+
+def _tokenize(text: str):
+    return _TOKEN_RE.findall(_fold(text))
+
+def _build_bm25(chunks):
+    """Inverted index: term -> [(chunk_idx, tf)], plus chunk lengths for BM25 normalisation."""
+    postings = {}
+    lengths = []
     for i, ch in enumerate(chunks):
-        t = ch.lower()
-        score = t.count(q) * 3
-        for tok in q.split():
-            score += t.count(tok)
-        scores.append((i, score))
-    scores.sort(key=lambda x: x[1], reverse=True)
-    return [i for i, s in scores]
-
-def _rank_embedding(chunks, query):
+        tf = Counter(_tokenize(ch))
+        lengths.append(sum(tf.values()))
+        for term, c in tf.items():
+            postings.setdefault(term, []).append((i, c))
+    avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+    return {"postings": postings, "lengths": lengths, "avgdl": avgdl or 1.0}
+
+def _rank_keyword(index, query, k):
+    bm = index.get("bm25")
+    if bm is None:
+        bm = index["bm25"] = _build_bm25(index["chunks"])
+    postings, lengths, avgdl = bm["postings"], bm["lengths"], bm["avgdl"]
+    n = len(lengths)
+    scores = defaultdict(float)
+    for term in set(_tokenize(query)):
+        plist = postings.get(term)
+        if not plist:
+            continue
+        idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        for i, tf in plist:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[i] / avgdl)
+            scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+    order = [i for i, _ in heapq.nlargest(k, scores.items(), key=lambda x: x[1])]
+    # Like the old substring ranker, still return k passages when few chunks match
+    if len(order) < k:
+        picked = set(order)
+        order += [i for i in range(n) if i not in picked][:k - len(order)]
+    return order
+
+def _rank_embedding_batch(index, queries, k):
+    """Top-k chunk indices per query from one batched encode and one matrix-matrix product."""
+    emb = index.get("emb")
+    if emb is None or not queries:
+        return None
+    import numpy as np
+    qv = _try_embed(["query: " + q for q in queries])
+    if qv is None:
+        return None
+    sims = np.asarray(qv, dtype=np.float32) @ emb.T  # (queries, chunks); cosine if normalized
+    k = min(k, sims.shape[1])
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return [[int(i) for i in cand[np.argsort(-row[cand])]] for row, cand in zip(sims, top)]
+
+def _rank_embedding(index, query, k):
+    orders = _rank_embedding_batch(index, [query], k)
+    return orders[0] if orders else None
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file, memoized on (mtime, size) so repeated questions don't re-hash."""
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _hash_cache.get(path)
+    if hit and hit[0] == key:
+        return hit[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as fh, metrics.stage("hash", st.st_size):
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    _hash_cache[path] = (key, digest)
+    return digest
+
+def _index_path(doc_hash: str) -> str:
+    return os.path.join(INDEX_DIR, doc_hash[:2], doc_hash)
+
+def _read_index_meta(doc_hash: str):
+    try:
+        with open(os.path.join(_index_path(doc_hash), "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != INDEX_VERSION:
+        return None
+    return meta
+
+def build_doc_index(pdf_path: str, doc_hash: str = None) -> str:
+    """
+    Extract chunks and passage embeddings once and persist them under INDEX_DIR/<hash>:
+      meta.json  -> {'version', 'chunking', 'extraction', 'ocr_pages', 'text', 'spans', 'pages',
+                     'page_ends', 'embed_model'}
+      emb.npy    -> float32 [n_chunks, dim] (only when an embedding model is available)
+    Returns the document hash. Existing indexes are reused.
+    """
+    doc_hash = doc_hash or file_sha256(pdf_path)
+    if _read_index_meta(doc_hash) is not None:
+        return doc_hash
+
+    extract_stats = {}
+    with metrics.stage("extract", os.path.getsize(pdf_path)):
+        pages = extract.extract_pages(pdf_path, stats=extract_stats)
+    with metrics.stage("chunk"):
+        parts = chunker.chunk_pages(pages)
+    chunks = chunker.Chunks(parts["text"], parts["spans"])
+    vecs = _try_embed(["passage: " + c for c in chunks]) if chunks else None
+
+    final_dir = _index_path(doc_hash)
+    tmp_dir = f"{final_dir}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        if vecs is not None:
+            import numpy as np
+            np.save(os.path.join(tmp_dir, "emb.npy"), np.asarray(vecs, dtype=np.float32))
+        meta = {
+            "version": INDEX_VERSION,
+            "chunking": chunker.settings_key(),
+            "extraction": extract.settings_key(),
+            "ocr_pages": extract_stats.get("ocr", 0),
+            **parts,
+            "embed_model": _embed_model_name() if vecs is not None else None,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False)
+        if _read_index_meta(doc_hash) is None:
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(tmp_dir, final_dir)
+    except OSError as e:
+        # another request may have built the same document concurrently
+        print("index build error:", e)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return doc_hash
+
+def _index_current(meta) -> bool:
+    """An index was built with the current chunking, extraction and (if any) embedding model."""
+    return (meta is not None and meta.get("chunking") == chunker.settings_key()
+            and meta.get("extraction") == extract.settings_key()
+            and (not meta.get("embed_model") or meta["embed_model"] == _embed_model_name()))
+
+def load_doc_index(pdf_path: str, doc_hash: str = None) -> dict:
+    """
+    Load (building if needed) the index for a PDF; embeddings are memory-mapped.
+    With pdf_path=None only an existing, current index is loaded (None otherwise).
+    """
+    doc_hash = doc_hash or file_sha256(pdf_path)
+    with _index_lock:
+        index = _index_cache.get(doc_hash)
+        if index is not None:
+            _index_cache.move_to_end(doc_hash)
+            return index
+
+    meta = _read_index_meta(doc_hash)
+    if not _index_current(meta):
+        if pdf_path is None:
+            return None
+        shutil.rmtree(_index_path(doc_hash), ignore_errors=True)
+        build_doc_index(pdf_path, doc_hash)
+        meta = _read_index_meta(doc_hash) or {"text": "", "spans": [], "pages": [], "page_ends": [],
+                                              "embed_model": None}
+
+    upgraded = False
+    if not meta.get("embed_model") and meta["spans"] and get_embed_model() is not None:
+        # built while no model was available: embed the stored chunks now
+        upgraded = _add_index_embeddings(doc_hash, meta)
+
+    emb = None
+    emb_path = os.path.join(_index_path(doc_hash), "emb.npy")
+    if meta.get("embed_model") and os.path.exists(emb_path):
+        import numpy as np
+        emb = np.load(emb_path, mmap_mode="r")
+
+    index = {"hash": doc_hash, "chunks": chunker.Chunks(meta["text"], meta["spans"]),
+             "pages": meta["pages"], "page_ends": meta["page_ends"], "emb": emb}
+    with _index_lock:
+        _index_cache[doc_hash] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    if upgraded:
+        add_to_corpus(None, doc_hash)
+    return index
+
+def _add_index_embeddings(doc_hash: str, meta: dict) -> bool:
+    """Write emb.npy for an index built without a model and record the model in meta.json (and `meta`)."""
+    chunks = chunker.Chunks(meta["text"], meta["spans"])
     vecs = _try_embed(["passage: " + c for c in chunks])
     if vecs is None:
-        return None, None
+        return False
     import numpy as np
+    index_dir = _index_path(doc_hash)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        # emb.npy first: a reader that sees embed_model in meta.json must find the vectors
+        with open(os.path.join(index_dir, "emb.npy" + suffix), "wb") as fh:
+            np.save(fh, np.asarray(vecs, dtype=np.float32))
+        os.replace(os.path.join(index_dir, "emb.npy" + suffix), os.path.join(index_dir, "emb.npy"))
+        meta["embed_model"] = _embed_model_name()
+        with open(os.path.join(index_dir, "meta.json" + suffix), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False)
+        os.replace(os.path.join(index_dir, "meta.json" + suffix), os.path.join(index_dir, "meta.json"))
+    except OSError as e:
+        print("index upgrade error:", e)
+        meta["embed_model"] = None
+        for name in ("emb.npy", "meta.json"):
+            try:
+                os.remove(os.path.join(index_dir, name + suffix))
+            except OSError:
+                pass
+        return False
+    return True
+
+def drop_doc_artifacts(doc_hash: str):
+    """Forget the index and cached previews derived from a document (e.g. when its upload expires)."""
+    with _index_lock:
+        _index_cache.pop(doc_hash, None)
+    shutil.rmtree(_index_path(doc_hash), ignore_errors=True)
+    corpus = _corpus()
+    if corpus is not None:
+        corpus.remove(doc_hash)
+    for _, name, _ in _preview_files(PREVIEW_DIR):
+        if name.startswith(doc_hash + "_"):
+            try:
+                os.remove(os.path.join(PREVIEW_DIR, name))
+            except OSError:
+                pass
+
+def _corpus():
+    """The corpus index, or None when it is disabled or NumPy is not installed."""
+    if not CORPUS_ENABLED:
+        return None
+    try:
+        import corpus_index  # NumPy, like the embedding model, is optional
+    except ImportError:
+        return None
+    return corpus_index.get_corpus()
+
+def _corpus_signature() -> str:
+    # chunk indices in the corpus are only valid for this model, chunking and extraction
+    return f"{_embed_model_name()}|{chunker.settings_key()}|{extract.settings_key()}"
+
+def add_to_corpus(pdf_path: str, doc_hash: str) -> int:
+    """Append a document's passage embeddings to the corpus-wide index; returns rows added."""
+    corpus = _corpus()
+    if corpus is None:
+        return 0
+    index = load_doc_index(pdf_path, doc_hash)
+    if index["emb"] is None:
+        return 0
+    return corpus.add(index["hash"], index["emb"], _corpus_signature())
+
+def _corpus_hit_source(doc_hash: str):
+    """
+    Chunks and pages of a document for corpus hits, read once per search. An open chat
+    index is reused, but the chat LRU is never filled: a search must not evict it.
+    """
+    with _index_lock:
+        index = _index_cache.get(doc_hash)
+    if index is not None:
+        return index
+    meta = _read_index_meta(doc_hash)
+    if not _index_current(meta):
+        return None
+    return {"chunks": chunker.Chunks(meta["text"], meta["spans"]), "pages": meta["pages"],
+            "page_ends": meta["page_ends"]}
+
+def search_corpus(query: str, k: int = 10):
+    """
+    Nearest passages across every indexed upload, or None without an embedding model:
+    [{'document': hash, 'page': int, 'page_end': int, 'snippet': str, 'score': float}]
+    """
+    corpus = _corpus()
+    if corpus is None:
+        return None
     qv = _try_embed(["query: " + query])
     if qv is None:
-        return None, None
-    qv = qv[0]
-    sims = vecs @ qv  # cosine if normalized
-    order = list(np.argsort(sims)[::-1])
-    return order, sims
-
-def _make_preview(pdf_path: str, page_num: int, dpi: int = 140) -> str:
-    doc = fitz.open(pdf_path)
-    page = doc[page_num-1]
-    pix = page.get_pixmap(dpi=dpi)
-    base_dir = os.path.dirname(pdf_path)
-    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    out_name = f"{base_name}_p{page_num}_preview.png"
-    out_path = os.path.join(base_dir, out_name)
-    with open(out_path, "wb") as f:
-        f.write(pix.tobytes("png"))
-    return out_name
+        return None
+    k = max(1, min(k, CORPUS_SEARCH_MAX))
+    hits = []
+    with metrics.stage("corpus_search"):
+        found = corpus.search(qv, k, _corpus_signature())[0]
+    sources = {}
+    for doc_hash, ci, score in found:
+        if doc_hash not in sources:
+            sources[doc_hash] = _corpus_hit_source(doc_hash)
+        index = sources[doc_hash]
+        if index is None or ci >= len(index["chunks"]):
+            continue  # index was dropped or rebuilt since the corpus saw it
+        snip = " ".join(index["chunks"][ci].split())
+        hits.append({'document': doc_hash, 'page': index["pages"][ci], 'page_end': index["page_ends"][ci],
+                     'snippet': snip[:450] + ("…" if len(snip) > 450 else ""), 'score': round(score, 4)})
+    return hits
+
+@contextmanager
+def _previews_locked(preview_dir: str):
+    """Thread lock plus an exclusive flock: all worker processes share one preview budget."""
+    with _preview_lock:
+        os.makedirs(preview_dir, exist_ok=True)
+        with open(os.path.join(preview_dir, ".lock"), "a") as fh:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+def _preview_files(preview_dir: str):
+    """[(mtime, name, bytes)] of the cached previews on disk, least recently used first."""
+    entries = []
+    try:
+        names = os.listdir(preview_dir)
+    except OSError:
+        return entries
+    for name in names:
+        if not name.endswith(".png"):
+            continue
+        try:
+            st = os.stat(os.path.join(preview_dir, name))
+        except OSError:
+            continue
+        entries.append((st.st_mtime, name, st.st_size))
+    entries.sort()
+    return entries
+
+def _preview_cached(preview_dir: str, name: str) -> bool:
+    """Whether a preview is cached; a hit bumps its mtime, which is what eviction orders by."""
+    try:
+        os.utime(os.path.join(preview_dir, name))
+        return True
+    except OSError:
+        return False
+
+def _preview_store(preview_dir: str, name: str, data: bytes, pinned=()):
+    """
+    Write a rendered preview and evict least recently used ones over the byte budget.
+    The accounting is a scan of the directory, so it covers what every worker wrote.
+    """
+    os.makedirs(preview_dir, exist_ok=True)
+    path = os.path.join(preview_dir, name)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    with _previews_locked(preview_dir):
+        entries = _preview_files(preview_dir)
+        total = sum(size for _, _, size in entries)
+        for _, old, size in entries:
+            if total <= PREVIEW_CACHE_BYTES:
+                break
+            if old in pinned:
+                continue  # never evict previews handed out for the current request
+            try:
+                os.remove(os.path.join(preview_dir, old))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            total -= size
+
+def _make_previews(pdf_path: str, pages, doc_hash: str, dpi: int = PREVIEW_DPI) -> dict:
+    """
+    Returns {page: 'previews/<hash>_p<page>_<dpi>.png'} for the requested pages.
+    Cached renders are reused; missing ones share a single fitz.Document.
+    """
+    with metrics.stage("previews") as st:
+        out = {}
+        for page_num, rel, nbytes in _iter_previews(pdf_path, pages, doc_hash, dpi):
+            st.add_bytes(nbytes)
+            out[page_num] = rel
+        return out
+
+def _iter_previews(pdf_path, pages, doc_hash, dpi):
+    """Yield (page, 'previews/<name>.png', rendered bytes) per page: cached pages first, then new renders."""
+    preview_dir = PREVIEW_DIR
+    names = {p: f"{doc_hash}_p{p}_{dpi}.png" for p in pages}
+    pinned = set(names.values())
+    missing = []
+    for page_num, name in names.items():
+        if _preview_cached(preview_dir, name):
+            yield page_num, f"{PREVIEW_SUBDIR}/{name}", 0
+        else:
+            missing.append(page_num)
+    if not missing:
+        return
+    doc = None
+    try:
+        for page_num in missing:
+            name = names[page_num]
+            try:
+                if doc is None:
+                    doc = fitz.open(pdf_path)
+                pix = doc[page_num-1].get_pixmap(dpi=dpi)
+                data = pix.tobytes("png")
+                _preview_store(preview_dir, name, data, pinned)
+            except Exception as e:
+                print("preview error:", e)
+                continue
+            yield page_num, f"{PREVIEW_SUBDIR}/{name}", len(data)
+    finally:
+        if doc is not None:
+            doc.close()
 
 def _sentences(text: str):
     parts = re.split(r'(?<=[.!?])\s+', text.strip())
@@ -97,68 +520,133 @@ def _extractive_summary(snippets, question="", max_sentences=3):
             break
     return " ".join(clean) if clean else ""
 
-def _llm_summary(snippets, question: str) -> str:
-    """Use OpenAI to summarize if key is available; else return empty to fallback."""
-    if not OPENAI_API_KEY:
-        return ""
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        text = "\n\n".join(snippets)[:8000]
-        prompt = (
-            "Aşağıdaki PDF pasajlarına dayanarak, kullanıcı sorusuna çok kısa ve net Türkçe bir özet yaz. "
-            "Sadece pasajlarda yer alan bilgilere dayan. Gerekirse belirsizliği belirt. 3-4 cümleyi geçme.\n\n"
-            f"Soru: {question}\n\n"
-            f"Pasajlar:\n{text}"
-        )
-        resp = client.chat.completions.create(
-            model=os.getenv("PERDF_LLM_MODEL", "gpt-4o-mini"),
-            messages=[{"role":"user","content":prompt}],
-            max_tokens=180,
-            temperature=0.2,
-        )
-        return (resp.choices[0].message.content or "").strip()
-    except Exception as e:
-        # any failure -> fallback
-        return ""
-
-def get_relevant_answer_struct(pdf_path: str, question: str, k: int = 3, make_previews: bool = True):
+def _answer_results(index, idxs, previews):
+    chunks, page_of, page_end_of = index["chunks"], index["pages"], index["page_ends"]
+    results = []
+    for i in idxs:
+        page = page_of[i]
+        snip = " ".join(chunks[i].split())
+        snip = snip[:450] + ("…" if len(snip) > 450 else "")
+        results.append({'page': page, 'page_end': page_end_of[i], 'snippet': snip, 'preview': previews.get(page)})
+    return results
+
+def _fallback_summary(snippets, question):
+    summary = _extractive_summary(snippets, question, max_sentences=3)
+    return summary or "İlgili kısa bir özet çıkarılamadı; kaynak pasajlar aşağıda."
+
+def _rank(index, question, k):
+    """(mode, chunk indices of the k best passages): embedding search, BM25 without a model."""
+    with metrics.stage("rank"):
+        order = _rank_embedding(index, question, k)
+        if order is not None:
+            return "Embedding", order[:k]
+        return "Anahtar kelime", _rank_keyword(index, question, k)[:k]
+
+def _no_text_answer():
+    return {'mode': 'Anahtar kelime', 'summary': NO_TEXT_SUMMARY, 'summary_id': None, 'results': []}
+
+def get_relevant_answer_struct(pdf_path: str, question: str, k: int = 3, make_previews: bool = True,
+                               doc_hash: str = None):
     """
     Returns:
     {
       'mode': 'Embedding' | 'Anahtar kelime',
       'summary': '...',
-      'results': [{'page': int, 'snippet': str, 'preview': 'filename.png' | None}]
+      'summary_id': str | None,  # LLM summary still running: poll summarizer with this key
+      'results': [{'page': int, 'page_end': int, 'snippet': str, 'preview': 'previews/<name>.png' | None}]
     }
     """
-    chunks, page_of = _load_pdf_chunks(pdf_path)
-    if not chunks:
-        return {'mode': 'Anahtar kelime', 'summary': 'PDF metin içerik bulunamadı.', 'results': []}
+    index = load_doc_index(pdf_path, doc_hash)
+    if not index["chunks"]:
+        return _no_text_answer()
 
-    order, sims = _rank_embedding(chunks, question)
-    mode = "Embedding" if order is not None else "Anahtar kelime"
-    if order is None:
-        order = _rank_keyword(chunks, question)
+    mode, idxs = _rank(index, question, k)
+    previews = _make_previews(pdf_path, [index["pages"][i] for i in idxs], index["hash"]) if make_previews else {}
+    results = _answer_results(index, idxs, previews)
 
-    idxs = order[:k]
-    results = []
-    for i in idxs:
-        page = page_of[i]
-        snip = chunks[i].strip().replace('\\n', ' ')
-        snip = snip[:450] + ("…" if len(snip) > 450 else "")
-        preview = None
-        if make_previews:
-            try:
-                preview = _make_preview(pdf_path, page)
-            except Exception:
-                preview = None
-        results.append({'page': page, 'snippet': snip, 'preview': preview})
-
-    # Prefer LLM summary if possible, else extractive
+    # Prefer LLM summary if possible, else extractive; a slow LLM answer arrives later via summary_id
     snippets = [r['snippet'] for r in results]
-    summary = _llm_summary(snippets, question).strip()
+    with metrics.stage("llm_wait"):
+        summary, summary_id = summarizer.summarize(index["hash"], question, snippets)
     if not summary:
-        summary = _extractive_summary(snippets, question, max_sentences=3)
+        summary = _fallback_summary(snippets, question)
+    return {'mode': mode, 'summary': summary, 'summary_id': summary_id, 'results': results}
+
+def iter_relevant_answer(pdf_path: str, question: str, k: int = 3, make_previews: bool = True,
+                         doc_hash: str = None):
+    """
+    get_relevant_answer_struct as a stream of (event, data) pairs, each produced as soon as it is known:
+      ('results', {'mode', 'results'})    ranked snippets, 'preview' still None
+      ('preview', {'page', 'preview'})    one per page once its preview exists (cached pages first)
+      ('summary', {'summary', 'final'})   the summary; final=False is the extractive stand-in sent
+                                          while the LLM is slower than PERDF_LLM_WAIT
+      ('done', {})
+    The LLM call starts right after ranking, so it runs while the previews render.
+    """
+    index = load_doc_index(pdf_path, doc_hash)
+    if not index["chunks"]:
+        answer = _no_text_answer()
+        yield 'results', {'mode': answer['mode'], 'results': answer['results']}
+        yield 'summary', {'summary': answer['summary'], 'final': True}
+        yield 'done', {}
+        return
+
+    mode, idxs = _rank(index, question, k)
+    results = _answer_results(index, idxs, {})
+    yield 'results', {'mode': mode, 'results': results}
+
+    snippets = [r['snippet'] for r in results]
+    started = time.monotonic()
+    summary, summary_id = summarizer.summarize(index["hash"], question, snippets, wait=0)
+    if make_previews:
+        pages = list(dict.fromkeys(index["pages"][i] for i in idxs))
+        previews = _iter_previews(pdf_path, pages, index["hash"], PREVIEW_DPI)
+        for page_num, rel, _ in metrics.timed_iter("previews", previews, size=lambda e: e[2]):
+            yield 'preview', {'page': page_num, 'preview': rel}
+
+    if summary_id:
+        # same budget as the blocking path, counted from when the call started
+        with metrics.stage("llm_wait"):
+            state = summarizer.poll(summary_id, wait=max(0.0, summarizer.LLM_WAIT - (time.monotonic() - started)))
+        if state and state["status"] == "pending":
+            yield 'summary', {'summary': _fallback_summary(snippets, question), 'final': False}
+            state = summarizer.poll(summary_id, wait=summarizer.LLM_TIMEOUT)
+        summary = state["summary"] if state and state["status"] == "done" else ""
+    yield 'summary', {'summary': summary or _fallback_summary(snippets, question), 'final': True}
+    yield 'done', {}
+
+def get_relevant_answers_batch(pdf_path: str, questions, k: int = 3, make_previews: bool = True,
+                               doc_hash: str = None):
+    """
+    Many questions about one document in one pass: the index is loaded once, all queries
+    are embedded in one batch and scored with one matrix product, previews are rendered
+    once per distinct page and LLM summaries run concurrently.
+    Returns {'mode': ..., 'answers': [{'question', 'summary', 'summary_id', 'results'}]}
+    with the same per-answer fields as get_relevant_answer_struct.
+    """
+    index = load_doc_index(pdf_path, doc_hash)
+    if not index["chunks"]:
+        return {'mode': 'Anahtar kelime',
+                'answers': [{'question': q, 'summary': NO_TEXT_SUMMARY, 'summary_id': None,
+                             'results': []} for q in questions]}
+
+    with metrics.stage("rank"):
+        orders = _rank_embedding_batch(index, questions, k)
+        mode = "Embedding" if orders is not None else "Anahtar kelime"
+        if orders is None:
+            orders = [_rank_keyword(index, q, k) for q in questions]
+
+    page_of = index["pages"]
+    pages = sorted({page_of[i] for order in orders for i in order[:k]})
+    previews = _make_previews(pdf_path, pages, index["hash"]) if make_previews else {}
+    all_results = [_answer_results(index, order[:k], previews) for order in orders]
+
+    with metrics.stage("llm_wait"):
+        summaries = summarizer.summarize_many(
+            index["hash"], [(q, [r['snippet'] for r in results]) for q, results in zip(questions, all_results)])
+    answers = []
+    for q, results, (summary, summary_id) in zip(questions, all_results, summaries):
         if not summary:
-            summary = "İlgili kısa bir özet çıkarılamadı; kaynak pasajlar aşağıda."
-    return {'mode': mode, 'summary': summary, 'results': results}
+            summary = _fallback_summary([r['snippet'] for r in results], q)
+        answers.append({'question': q, 'summary': summary, 'summary_id': summary_id, 'results': results})
+    return {'mode': mode, 'answers': answers}
@@ -0,0 +1,71 @@
+"""
+Generator-based ZIP writer.
+
+`iter_zip` writes entries through `zipfile` into an unseekable sink and yields
+the bytes produced after every entry, so an archive can be sent to the client
+while later entries are still being produced. Nothing but the current entry is
+held in memory.
+"""
+import io
+import zipfile
+
+# Formats that are already compressed; deflating them again only burns CPU
+STORED_EXTS = (".png", ".jpg", ".jpeg", ".zip", ".gz")
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer; zipfile then uses data descriptors."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(name: str) -> int:
+    return zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTS) else zipfile.ZIP_DEFLATED
+
+
+def iter_zip(entries):
+    """
+    entries: iterable of (name, data) or (name, data, compress_type).
+    When no compress type is given it is picked from the file extension.
+    Yields the archive as byte chunks, one or more per entry.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for entry in entries:
+            name, data = entry[0], entry[1]
+            ctype = entry[2] if len(entry) > 2 else compress_type_for(name)
+            zf.writestr(name, data, compress_type=ctype)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    tail = sink.drain()  # central directory
+    if tail:
+        yield tail
+
+
+def write_zip(entries, out_path: str) -> int:
+    """Write the same archive to a file; returns its size."""
+    size = 0
+    with open(out_path, "wb") as fh:
+        for chunk in iter_zip(entries):
+            fh.write(chunk)
+            size += len(chunk)
+    return size